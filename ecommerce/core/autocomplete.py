@@ -0,0 +1,282 @@
+"""Search as you type suggestions of product titles and category names.
+
+Suggestions come from a prefix index in the memory of every process:
+normalized titles and names, and sorted arrays of the positions of
+their word starts, an integer (slot of the text << 8 | offset of the
+word) for each, one array of the first words and one of the others.
+A prefix is looked up with a binary search of the first word array,
+then of the other one when it has too few matches, and every match is
+ranked, the shortest texts first. No query runs once the index is built.
+
+The index is built on first use, updated once product and category
+changes are committed by the signals below, and rebuilt in the background
+every AUTOCOMPLETE_MAX_AGE seconds, which brings in the changes made
+by other processes.
+"""
+
+import bisect
+import functools
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from array import array
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .models import Category, Product
+
+# Longest prefix looked up, longer ones are cut
+MAX_PREFIX = 32
+# Texts are indexed up to the word starting before this offset
+MAX_OFFSET = 255
+
+SEPARATOR_RE = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Lowercase words without accents separated by single spaces"""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in text if not unicodedata.combining(char))
+    return SEPARATOR_RE.sub(" ", text.casefold()).strip()
+
+
+class PrefixIndex:
+    def __init__(self):
+        self.texts = []
+        self.entries = []
+        self.slots = {}
+        # Codes of the first words and of the other words
+        self.indexes = (array("Q"), array("Q"))
+        self.built_at = time.time()
+        self.lock = threading.Lock()
+
+    def _key(self, code, length=MAX_PREFIX):
+        offset = code & 0xFF
+        return self.texts[code >> 8][offset : offset + length]
+
+    def _codes_of(self, slot):
+        text = self.texts[slot]
+        return [
+            slot << 8 | match.start()
+            for match in re.finditer(r"\S+", text)
+            if match.start() < MAX_OFFSET
+        ]
+
+    def _index_of(self, code):
+        return self.indexes[code & 0xFF > 0]
+
+    def _position(self, code):
+        codes = self._index_of(code)
+        key = self._key(code)
+        position = bisect.bisect_left(codes, key, key=self._key)
+        while codes[position] != code:
+            position += 1
+        return position
+
+    def _remove(self, entry_id):
+        slot = self.slots.pop(entry_id, None)
+        if slot is None:
+            return
+        for code in self._codes_of(slot):
+            del self._index_of(code)[self._position(code)]
+        self.texts[slot] = ""
+        self.entries[slot] = None
+
+    def discard(self, entry_id):
+        with self.lock:
+            self._remove(entry_id)
+
+    def update(self, entry_id, text, payload):
+        """Indexes the text of an entry, replacing its previous text,
+        suggestions of the entry are its payload"""
+        with self.lock:
+            self._remove(entry_id)
+            normalized = normalize(text)
+            if not normalized:
+                return
+            slot = len(self.texts)
+            self.texts.append(normalized)
+            self.entries.append(payload)
+            self.slots[entry_id] = slot
+            for code in self._codes_of(slot):
+                bisect.insort(self._index_of(code), code, key=self._key)
+
+    @classmethod
+    def build(cls, items):
+        """An index of (entry id, text, payload) items"""
+        index = cls()
+        codes = []
+        for entry_id, text, payload in items:
+            normalized = normalize(text)
+            if not normalized:
+                continue
+            slot = len(index.texts)
+            index.texts.append(normalized)
+            index.entries.append(payload)
+            index.slots[entry_id] = slot
+            codes.extend(index._codes_of(slot))
+        codes.sort(key=index._key)
+        index.indexes = (
+            array("Q", (code for code in codes if code & 0xFF == 0)),
+            array("Q", (code for code in codes if code & 0xFF > 0)),
+        )
+        return index
+
+    def suggest(self, prefix, limit=8):
+        """The payloads of the best entries having
+        a word starting with the prefix"""
+        prefix = normalize(prefix)[:MAX_PREFIX]
+        if not prefix:
+            return []
+        with self.lock:
+            length = len(prefix)
+
+            def key(code):
+                return self._key(code, length)
+
+            def rank(slot):
+                return len(self.texts[slot]), self.texts[slot]
+
+            best = []
+            # Texts matching from their first word come first
+            for codes in self.indexes:
+                start = bisect.bisect_left(codes, prefix, key=key)
+                end = bisect.bisect_right(codes, prefix, start, key=key)
+                slots = {code >> 8 for code in codes[start:end]}.difference(best)
+                best.extend(heapq.nsmallest(limit - len(best), slots, key=rank))
+                if len(best) >= limit:
+                    break
+            return [self.entries[slot] for slot in best]
+
+
+def indexed_items():
+    """(entry id, text, payload) of the products and active categories,
+    payloads are (kind, text, slug, pk) tuples"""
+    categories = Category.objects.filter(is_active=True).values_list("pk", "name")
+    for pk, name in categories:
+        yield category_item(pk, name)
+    products = Product.objects.values_list("pk", "title", "slug").order_by("pk")
+    for pk, title, slug in products.iterator(chunk_size=2000):
+        yield product_item(pk, title, slug)
+
+
+def category_item(pk, name):
+    return ("category", pk), name, ("category", name, None, pk)
+
+
+def product_item(pk, title, slug):
+    return ("product", pk), title, ("product", title, slug, pk)
+
+
+@functools.lru_cache(maxsize=10000)
+def suggestion_url(kind, text, slug, pk):
+    if kind == "category":
+        return reverse("core:product_home") + "?" + urlencode({"categories": text})
+    return reverse("core:product", args=[slug, pk])
+
+
+def max_age():
+    return getattr(settings, "AUTOCOMPLETE_MAX_AGE", 600)
+
+
+_index = None
+_index_lock = threading.Lock()
+# Changes committed while the index is rebuilt, replayed on the new index
+_pending = None
+
+
+def _apply(index, change):
+    if change[0] == "discard":
+        index.discard(change[1])
+    else:
+        index.update(*change[1:])
+
+
+def _record(change):
+    with _index_lock:
+        if _pending is not None:
+            _pending.append(change)
+        index = _index
+    if index is not None:
+        _apply(index, change)
+
+
+def _rebuild():
+    global _index, _pending
+    try:
+        index = PrefixIndex.build(indexed_items())
+        with _index_lock:
+            for change in _pending:
+                _apply(index, change)
+            _index = index
+    finally:
+        with _index_lock:
+            _pending = None
+        connections.close_all()
+
+
+def get_index():
+    """The prefix index of the process, built on first use"""
+    global _index, _pending
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = PrefixIndex.build(indexed_items())
+            return _index
+    if time.time() - index.built_at > max_age():
+        with _index_lock:
+            rebuild = _pending is None
+            if rebuild:
+                _pending = []
+        if rebuild:
+            threading.Thread(target=_rebuild, daemon=True).start()
+    return index
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def suggest(prefix, limit=8):
+    """(kind, text, url) of the top suggestions of a prefix"""
+    return [
+        (payload[0], payload[1], suggestion_url(*payload))
+        for payload in get_index().suggest(prefix, limit)
+    ]
+
+
+@receiver(post_save, sender=Product)
+def index_product(instance, raw=False, **kwargs):
+    if not raw:
+        change = ("update", *product_item(instance.pk, instance.title, instance.slug))
+        transaction.on_commit(lambda: _record(change))
+
+
+@receiver(post_save, sender=Category)
+def index_category(instance, raw=False, **kwargs):
+    if raw:
+        return
+    if instance.is_active:
+        change = ("update", *category_item(instance.pk, instance.name))
+    else:
+        change = ("discard", ("category", instance.pk))
+    transaction.on_commit(lambda: _record(change))
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def unindex(sender, instance, **kwargs):
+    kind = "product" if sender is Product else "category"
+    change = ("discard", (kind, instance.pk))
+    transaction.on_commit(lambda: _record(change))
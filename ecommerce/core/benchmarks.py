@@ -0,0 +1,87 @@
+import math
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+from .models import Category, Product
+
+WORDS = (
+    "asus acer apple lenovo dell samsung sony xiaomi oneplus nokia "
+    "laptop phone tablet monitor keyboard mouse headphones speaker camera "
+    "charger cable case cover stand dock router printer watch band "
+    "black white silver blue red wireless portable gaming slim pro max mini "
+    "ultra fast smart compact durable premium classic travel office home"
+).split()
+
+
+@contextmanager
+def temporary_database(verbosity=0):
+    """Runs the enclosed block against a freshly migrated throwaway database,
+    the same way the test runner does, so benchmarks never touch real data"""
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def make_rng(seed=0):
+    return random.Random(seed)
+
+
+def random_text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def populate_catalog(rng, products, categories=20, batch_size=5000):
+    """Bulk inserts random products, which skips their signals"""
+    categories = Category.objects.bulk_create(
+        Category(name=f"{random_text(rng, 1).title()} {number}", description="")
+        for number in range(categories)
+    )
+    for start in range(0, products, batch_size):
+        Product.objects.bulk_create(
+            Product(
+                title=random_text(rng, 4).title(),
+                slug=f"product-{number}",
+                description=random_text(rng, 12),
+                label=rng.choice(Product.LABEL_CHOICES)[0],
+                price=rng.randint(100, 500000),
+                stock=rng.randint(0, 50),
+                category=rng.choice(categories),
+            )
+            for number in range(start, min(start + batch_size, products))
+        )
+
+
+def measure(func, *args, repeat=5, clock=time.perf_counter, **kwargs):
+    """Calls func repeat times and returns its timings in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = clock()
+        func(*args, **kwargs)
+        timings.append((clock() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    return {
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def percentiles(timings, points=(50, 95, 99)):
+    """Nearest rank percentiles of timings in milliseconds"""
+    ordered = sorted(timings)
+    return {
+        f"p{point}_ms": round(
+            ordered[max(0, math.ceil(point / 100 * len(ordered)) - 1)], 4
+        )
+        for point in points
+    }
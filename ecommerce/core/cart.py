@@ -0,0 +1,40 @@
+"""Cart summaries, the wish list lines of a user and their totals.
+
+Prices are integer cents, product prices are stored in cents, and totals
+are computed by the database with the lines: one query returns every
+line, its product, its total and the total of the cart.
+"""
+
+from decimal import Decimal
+
+from django.db.models import F, Sum, Window
+
+from .models import AddedProduct
+
+
+class CartSummary:
+    def __init__(self, user):
+        line_total = F("quantity") * F("product__price")
+        self.lines = list(
+            AddedProduct.objects.filter(user=user, status="WISH_LIST", quantity__gt=0)
+            .select_related("product")
+            .annotate(
+                total_cents=line_total,
+                cart_total_cents=Window(Sum(line_total)),
+            )
+            .order_by("pk")
+        )
+        self.total_cents = self.lines[0].cart_total_cents if self.lines else 0
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def total_price(self):
+        return Decimal(self.total_cents) / 100
+
+    def line_ids(self):
+        return [line.pk for line in self.lines]
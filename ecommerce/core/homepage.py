@@ -0,0 +1,101 @@
+"""Rendered fragments of the storefront homepage.
+
+The product cards and category cards of the homepage only change with
+products and categories, they are rendered once and kept in the default
+cache. Cached fragments carry the generation they were rendered at,
+product and category saves and deletes start a new generation once
+committed, and fragments stay fresh for HOMEPAGE_CACHE_TIMEOUT seconds
+of their generation.
+
+Stale fragments are still served for HOMEPAGE_STALE_TIMEOUT seconds
+while a single background thread renders the new ones, only the
+requests finding no fragments at all render them.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+
+from .models import Category, Product
+
+FRAGMENTS_KEY = "homepage:fragments"
+GENERATION_KEY = "homepage:generation"
+REVALIDATING_KEY = "homepage:revalidating"
+
+
+def fresh_timeout():
+    return getattr(settings, "HOMEPAGE_CACHE_TIMEOUT", 300)
+
+
+def stale_timeout():
+    return getattr(settings, "HOMEPAGE_STALE_TIMEOUT", 60)
+
+
+def render_fragments():
+    """Renders the product cards and category cards"""
+    new_products = Product.objects.filter(label="NEW", TNA=False, stock__gt=0)
+    categories = Category.objects.filter(
+        Exists(Product.objects.filter(category=OuterRef("pk")))
+    )
+    return {
+        "product_cards": render_to_string(
+            "core/home_product_cards.html", {"new_products": new_products}
+        ),
+        "category_cards": render_to_string(
+            "core/home_category_cards.html", {"categories": categories}
+        ),
+    }
+
+
+def revalidate():
+    """Renders and caches the fragments of the current generation"""
+    generation = cache.get(GENERATION_KEY, 0)
+    fragments = render_fragments()
+    cache.set(
+        FRAGMENTS_KEY,
+        (generation, time.time() + fresh_timeout(), fragments),
+        fresh_timeout() + stale_timeout(),
+    )
+    return fragments
+
+
+def _revalidate_in_background():
+    try:
+        revalidate()
+    finally:
+        cache.delete(REVALIDATING_KEY)
+        connections.close_all()
+
+
+def start_revalidation():
+    """Renders the fragments in a background thread,
+    unless another request is already rendering them"""
+    if cache.add(REVALIDATING_KEY, True, stale_timeout()):
+        threading.Thread(target=_revalidate_in_background, daemon=True).start()
+
+
+def homepage_fragments():
+    """The cached fragments, stale ones while they are revalidated"""
+    cached = cache.get_many([FRAGMENTS_KEY, GENERATION_KEY])
+    if FRAGMENTS_KEY not in cached:
+        return revalidate()
+    generation, fresh_until, fragments = cached[FRAGMENTS_KEY]
+    if generation != cached.get(GENERATION_KEY, 0) or time.time() > fresh_until:
+        start_revalidation()
+    return fragments
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_homepage(**kwargs):
+    """Marks the cached fragments as stale once the transaction commits"""
+    transaction.on_commit(lambda: cache.set(GENERATION_KEY, time.time_ns(), None))
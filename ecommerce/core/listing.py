@@ -0,0 +1,129 @@
+"""Product listings, keyset paginated.
+
+A listing page is the first products of a sort order after a cursor,
+the sort order, sort key and pk of the last product of the previous
+page. Pages are found with an index range scan whatever their depth,
+unlike offsets that count every product before them, and stay
+consistent while products are added or removed.
+
+Facet counts, the number of listed products of every category and label,
+come from one grouped query over the listing index, cached until products
+or categories change like the homepage fragments.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+from rest_framework.exceptions import NotFound
+
+from .homepage import GENERATION_KEY, fresh_timeout
+from .models import PRODUCT_DISCOUNT, Product
+
+# Sort options, the sort key of each and whether it descends,
+# ties are broken by pk in the same direction
+SORTS = {
+    "newest": ("created_at", True),
+    "price": ("price", False),
+    "-price": ("price", True),
+    "discount": ("discount", True),
+}
+DEFAULT_SORT = "newest"
+# Integers out of this range do not fit the database columns
+MAX_INTEGER = 2**63
+
+
+def listed_products(categories=(), label=None):
+    """Products in stock of some categories and a label"""
+    products = Product.objects.filter(TNA=False, stock__gt=0)
+    if categories:
+        products = products.filter(category__name__in=categories)
+    if label:
+        products = products.filter(label=label)
+    return products
+
+
+def is_integer(value):
+    return type(value) is int and -MAX_INTEGER <= value < MAX_INTEGER
+
+
+def encode_cursor(sort, value, pk):
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    data = json.dumps([sort, value, pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor, sort):
+    """The sort key value and pk of a cursor of a sort order,
+    cursors of other sort orders are invalid"""
+    try:
+        cursor_sort, value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if cursor_sort != sort or not is_integer(pk):
+            raise ValueError
+        if SORTS[sort][0] == "created_at":
+            value = datetime.fromisoformat(value)
+            if value.tzinfo is None:
+                raise ValueError
+        elif not is_integer(value):
+            raise ValueError
+    except (ValueError, TypeError):
+        raise NotFound("Invalid cursor")
+    return value, pk
+
+
+def product_page(products, sort=DEFAULT_SORT, cursor=None, page_size=24):
+    """A page of products in a sort order, after a cursor.
+    Returns the products and the cursor of the next page, None on the last."""
+    if sort not in SORTS:
+        sort = DEFAULT_SORT
+    key, descending = SORTS[sort]
+    if key == "discount":
+        products = products.annotate(discount=PRODUCT_DISCOUNT)
+    if cursor:
+        value, pk = decode_cursor(cursor, sort)
+        after = "lt" if descending else "gt"
+        # The bound on the key alone starts the index range scan
+        products = products.filter(**{f"{key}__{after}e": value}).filter(
+            Q(**{f"{key}__{after}": value}) | Q(**{f"pk__{after}": pk})
+        )
+    direction = "-" if descending else ""
+    products = products.order_by(f"{direction}{key}", f"{direction}pk")
+    page = list(products[: page_size + 1])
+    if len(page) <= page_size:
+        return page, None
+    page = page[:page_size]
+    last = page[-1]
+    return page, encode_cursor(sort, getattr(last, key), last.pk)
+
+
+def facet_rows():
+    """Counts of the products in stock by category name and label"""
+    key = f"listing:facets:{cache.get(GENERATION_KEY, 0)}"
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(
+            Product.objects.filter(TNA=False, stock__gt=0)
+            .values_list("category__name", "label")
+            .annotate(count=Count("pk"))
+            .order_by()
+        )
+        cache.set(key, rows, fresh_timeout())
+    return rows
+
+
+def product_facets(categories=(), label=None):
+    """Counts of the products in stock of every category and label,
+    category counts of the selected label and label counts of the
+    selected categories"""
+    category_counts = {}
+    label_counts = dict.fromkeys((value for value, _ in Product.LABEL_CHOICES), 0)
+    for category, product_label, count in facet_rows():
+        category_counts.setdefault(category, 0)
+        if not label or product_label == label:
+            category_counts[category] += count
+        if not categories or category in categories:
+            label_counts[product_label] = label_counts.get(product_label, 0) + count
+    return sorted(category_counts.items()), list(label_counts.items())
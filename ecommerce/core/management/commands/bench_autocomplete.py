@@ -0,0 +1,63 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.autocomplete import PrefixIndex, indexed_items, suggestion_url
+from core.benchmarks import (
+    make_rng,
+    measure,
+    percentiles,
+    populate_catalog,
+    summarize,
+    temporary_database,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the autocomplete prefix index of a generated catalog and "
+        "reports its memory usage and the latency of every keystroke"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=500000)
+        parser.add_argument("--keystrokes", type=int, default=20000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, products, keystrokes, seed, **options):
+        rng = make_rng(seed)
+        with temporary_database():
+            populate_catalog(rng, products)
+            start = time.perf_counter()
+            index = PrefixIndex.build(indexed_items())
+            build_ms = (time.perf_counter() - start) * 1000
+
+        # Typing product titles one character at a time
+        typed = []
+        while len(typed) < keystrokes:
+            title = rng.choice(index.entries)[1]
+            typed.extend(title[:length] for length in range(1, len(title) + 1))
+        timings = []
+        for prefix in typed[:keystrokes]:
+            start = time.perf_counter()
+            [suggestion_url(*payload) for payload in index.suggest(prefix)]
+            timings.append((time.perf_counter() - start) * 1000)
+
+        def update():
+            for number in range(100):
+                title = f"Benchmark product {number}"
+                index.update(("product", -number), title, ("product", title, "", 0))
+
+        report = {
+            "products": products,
+            "build_ms": round(build_ms, 1),
+            "index_bytes": {
+                "codes": sum(codes.itemsize * len(codes) for codes in index.indexes),
+                "texts": sum(sys.getsizeof(text) for text in index.texts),
+            },
+            "keystroke_ms": percentiles(timings),
+            "hundred_updates_ms": summarize(measure(update, repeat=3)),
+        }
+        self.stdout.write(json.dumps(report, indent=4))
@@ -0,0 +1,53 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import (
+    make_rng,
+    measure,
+    populate_catalog,
+    summarize,
+    temporary_database,
+)
+from core.models import Product
+from core.search import is_indexed, rebuild_index, search
+
+QUERIES = ("asus", "wireless mouse", "gaming laptop black", "lap", "headphnes")
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares title icontains scans with the full text product search "
+        "on a generated catalog"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=500000)
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, products, limit, seed, **options):
+        if not is_indexed():
+            self.stderr.write("The product search index needs an SQLite database")
+            return
+        with temporary_database():
+            populate_catalog(make_rng(seed), products)
+            report = {
+                "products": products,
+                "index_rebuild_ms": summarize(measure(rebuild_index, repeat=1)),
+                "queries": {},
+            }
+            for query in QUERIES:
+
+                def icontains():
+                    # The search before the index, every title match
+                    list(Product.objects.filter(title__icontains=query))
+
+                results = search(query, limit)
+                report["queries"][query] = {
+                    "icontains_ms": summarize(measure(icontains)),
+                    "search_ms": summarize(measure(search, query, limit)),
+                    "results": len(results.products),
+                    "suggestion": results.suggestion,
+                }
+        self.stdout.write(json.dumps(report, indent=4))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.search import is_indexed, rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the product search index, needed after loading fixtures "
+        "or writing products without their signals"
+    )
+
+    def handle(self, *args, **options):
+        if not is_indexed():
+            self.stderr.write("The product search index needs an SQLite database")
+            return
+        with transaction.atomic():
+            count = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products"))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:58
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_order_addedproduct_order"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="category",
+            options={"verbose_name_plural": "Categories"},
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["category", "label", "TNA", "stock"], name="product_listing_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["created_at", "id"], name="product_newest_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["price", "id"], name="product_price_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                django.db.models.expressions.CombinedExpression(
+                    models.F("price"),
+                    "-",
+                    django.db.models.functions.comparison.Coalesce(
+                        "discount_price", "price"
+                    ),
+                ),
+                models.F("id"),
+                name="product_discount_idx",
+            ),
+        ),
+    ]
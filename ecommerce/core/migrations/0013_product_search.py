@@ -0,0 +1,41 @@
+from django.db import migrations
+
+SEARCH_TABLE = "core_product_search"
+VOCABULARY_TABLE = "core_product_search_vocabulary"
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+        "title, description, category, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {VOCABULARY_TABLE} "
+        f"USING fts5vocab({SEARCH_TABLE}, row)"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, category) "
+        "SELECT product.id, product.title, product.description, category.name "
+        "FROM core_product product "
+        "JOIN core_category category ON category.id = product.category_id"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(f"DROP TABLE {VOCABULARY_TABLE}")
+    schema_editor.execute(f"DROP TABLE {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0012_product_listing_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
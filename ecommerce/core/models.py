@@ -1,6 +1,7 @@
 import uuid
 
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils.text import slugify
 from phonenumber_field.modelfields import PhoneNumberField
 from user.models import AuthUser
@@ -67,6 +68,10 @@ class Category(models.Model):
         verbose_name_plural = "Categories"
 
 
+# Amount taken off the price of a product, the discount sort key of listings
+PRODUCT_DISCOUNT = models.F("price") - Coalesce("discount_price", "price")
+
+
 class Product(models.Model):
     LABEL_CHOICES = (
         ("DEFAULT", "Default"),
@@ -96,6 +101,19 @@ class Product(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        indexes = [
+            # Listing filters, also covers the facet counts
+            models.Index(
+                fields=["category", "label", "TNA", "stock"],
+                name="product_listing_idx",
+            ),
+            # Listing sort orders, with the pk tie breaker of their keysets
+            models.Index(fields=["created_at", "id"], name="product_newest_idx"),
+            models.Index(fields=["price", "id"], name="product_price_idx"),
+            models.Index(PRODUCT_DISCOUNT, models.F("id"), name="product_discount_idx"),
+        ]
+
     def cost(self):
         return self.price / 100
 
@@ -168,7 +186,10 @@ class AddedProduct(models.Model):
         return f"{self.quantity} of {self.product.title}"
 
     def get_total_item_price(self):
-        return self.quantity * self.product.price / 100
+        return self.get_total_item_cost() / 100
 
     def get_total_item_cost(self):
+        # Annotated by the cart summary query
+        if hasattr(self, "total_cents"):
+            return self.total_cents
         return self.quantity * self.product.price
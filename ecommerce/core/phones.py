@@ -0,0 +1,77 @@
+import copy
+from collections import namedtuple
+from functools import lru_cache
+
+import phonenumbers
+from django.conf import settings
+from phonenumber_field.phonenumber import PhoneNumber
+from phonenumber_field.serializerfields import PhoneNumberField
+from rest_framework.exceptions import ValidationError
+
+ParsedPhone = namedtuple("ParsedPhone", ("e164", "valid", "number"))
+
+
+@lru_cache(maxsize=getattr(settings, "PHONE_PARSE_CACHE_SIZE", 100000))
+def _parse(raw, region):
+    try:
+        number = PhoneNumber.from_string(raw, region=region)
+    except phonenumbers.NumberParseException:
+        return ParsedPhone(None, False, PhoneNumber(raw_input=raw))
+    valid = number.is_valid()
+    return ParsedPhone(number.as_e164 if valid else None, valid, number)
+
+
+def parse_phone(raw, region=None):
+    """Parses and validates a phone number string, memoized per raw string.
+    The returned number is shared between callers, use to_phone_number
+    for a copy that can be modified."""
+    if region is None:
+        region = getattr(settings, "PHONENUMBER_DEFAULT_REGION", None)
+    return _parse(raw, region)
+
+
+def to_phone_number(raw, region=None):
+    return copy.copy(parse_phone(raw, region).number)
+
+
+def phone_to_e164(value, region=None):
+    """E.164 string of a phone number string or PhoneNumber,
+    None when it is empty or invalid"""
+    if not value:
+        return None
+    if isinstance(value, PhoneNumber):
+        if not value.raw_input:
+            return value.as_e164 if value.is_valid() else None
+        value = value.raw_input
+    return parse_phone(value, region).e164
+
+
+def cache_stats():
+    info = _parse.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / lookups if lookups else 0.0,
+        "size": info.currsize,
+        "max_size": info.maxsize,
+    }
+
+
+def clear_cache():
+    _parse.cache_clear()
+
+
+class CachedPhoneNumberField(PhoneNumberField):
+    """PhoneNumberField parsing through the memoized phone parser"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, PhoneNumber):
+            return super().to_internal_value(data)
+
+        parsed = parse_phone(
+            super(PhoneNumberField, self).to_internal_value(data), self.region
+        )
+        if not parsed.valid:
+            raise ValidationError(self.error_messages["invalid"])
+        return copy.copy(parsed.number)
@@ -0,0 +1,212 @@
+"""Full text product search.
+
+Products are indexed in core_product_search, an SQLite FTS5 table of
+their title, description and category name keyed by product id, kept
+in sync by the product and category signals below and rebuilt by the
+rebuild_search_index command. Searches match every word of a query as
+a prefix, "asu lap" finds "Asus Laptop", and rank matches by BM25 with
+title matches first. Every match is ranked before the limit is taken,
+FTS5 keeps only the best ones while ranking an ORDER BY rank LIMIT.
+
+Query words found in no product are replaced by the closest indexed
+word within SUGGESTION_DISTANCE edits sharing their first letter, the
+most common on ties. A query without matches is searched again as
+corrected, and the results tell the query they are for.
+
+Databases other than SQLite have no index, searches fall back to
+matching the title of products.
+"""
+
+import re
+from collections import namedtuple
+
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Product
+
+SEARCH_TABLE = "core_product_search"
+VOCABULARY_TABLE = "core_product_search_vocabulary"
+# Column weights of the BM25 ranking: title, description, category
+RANK_WEIGHTS = (10.0, 1.0, 4.0)
+SUGGESTION_DISTANCE = 2
+
+WORD_RE = re.compile(r"\w+")
+
+SearchResults = namedtuple("SearchResults", ["query", "products", "suggestion"])
+
+
+def is_indexed():
+    return connection.vendor == "sqlite"
+
+
+def query_words(query):
+    return WORD_RE.findall(query.lower())[:16]
+
+
+def index_products(products):
+    """Indexes products, replacing their previous entries"""
+    if not is_indexed():
+        return
+    rows = [
+        (product.pk, product.title, product.description, product.category.name)
+        for product in products
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s",
+            [(row[0],) for row in rows],
+        )
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, category) "
+            "VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+
+def unindex_products(pks):
+    if not is_indexed():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(pk,) for pk in pks]
+        )
+
+
+def rebuild_index():
+    """Indexes every product again, returns the number of indexed products,
+    0 without an index"""
+    if not is_indexed():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, title, description, category) "
+            "SELECT product.id, product.title, product.description, category.name "
+            f"FROM {Product._meta.db_table} product "
+            f"JOIN {Category._meta.db_table} category "
+            "ON category.id = product.category_id"
+        )
+        indexed = cursor.rowcount
+        # Merges the index segments written by the inserts
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')"
+        )
+    return indexed
+
+
+def match_expression(words):
+    """FTS5 query matching every word as a prefix, words are \\w+
+    so quoting them keeps FTS5 operators out of the query"""
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def matching_ids(words, limit):
+    # The rank column of the query is bm25 with the column weights
+    weights = ", ".join(str(weight) for weight in RANK_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+            "AND rank MATCH %s ORDER BY rank LIMIT %s",
+            [match_expression(words), f"bm25({weights})", limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def edit_distance(source, target, limit):
+    """Levenshtein distance of two words, limit + 1 once past limit"""
+    if abs(len(source) - len(target)) > limit:
+        return limit + 1
+    previous = list(range(len(target) + 1))
+    for i, source_char in enumerate(source, 1):
+        current = [i]
+        for j, target_char in enumerate(target, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (source_char != target_char),
+                )
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def correct_word(cursor, word):
+    """The word if some indexed word starts with it,
+    else the closest indexed word, None without any"""
+    cursor.execute(
+        f"SELECT 1 FROM {VOCABULARY_TABLE} WHERE term >= %s AND term < %s LIMIT 1",
+        [word, word + "\U0010ffff"],
+    )
+    if cursor.fetchone():
+        return word
+    cursor.execute(
+        f"SELECT term, doc FROM {VOCABULARY_TABLE} WHERE term >= %s AND term < %s",
+        [word[0], chr(ord(word[0]) + 1)],
+    )
+    best = None
+    for term, documents in cursor.fetchall():
+        distance = edit_distance(word, term, SUGGESTION_DISTANCE)
+        if distance <= SUGGESTION_DISTANCE:
+            candidate = (distance, -documents, term)
+            best = min(best, candidate) if best else candidate
+    return best[2] if best else None
+
+
+def suggest(words):
+    """The query words with unknown ones corrected, None when
+    every word is known or an unknown word has no correction"""
+    with connection.cursor() as cursor:
+        corrected = [correct_word(cursor, word) for word in words]
+    if None in corrected or corrected == words:
+        return None
+    return corrected
+
+
+def search(query, limit=20):
+    """Products matching a query, best first"""
+    words = query_words(query)
+    if not words:
+        return SearchResults(query, [], None)
+    if not is_indexed():
+        products = Product.objects.filter(title__icontains=query)[:limit]
+        return SearchResults(query, list(products), None)
+    ids = matching_ids(words, limit)
+    suggestion = None
+    if not ids:
+        corrected = suggest(words)
+        if corrected:
+            suggestion = " ".join(corrected)
+            ids = matching_ids(corrected, limit)
+    products = Product.objects.in_bulk(ids)
+    return SearchResults(
+        query, [products[pk] for pk in ids if pk in products], suggestion
+    )
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(instance, raw=False, **kwargs):
+    if not raw:
+        index_products([instance])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(instance, **kwargs):
+    unindex_products([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def index_category_name(instance, created, raw=False, **kwargs):
+    # Products have the name of their category indexed
+    if created or raw or not is_indexed():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {SEARCH_TABLE} SET category = %s WHERE rowid IN "
+            f"(SELECT id FROM {Product._meta.db_table} WHERE category_id = %s)",
+            [instance.name, instance.pk],
+        )
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import AddedProduct, ShippingAddress, Order
+from .models import AddedProduct, Product, ShippingAddress, Order
+from .phones import CachedPhoneNumberField
 
 
 class AddedProductSerializer(serializers.ModelSerializer):
@@ -9,6 +10,8 @@ class AddedProductSerializer(serializers.ModelSerializer):
 
 
 class AddressSerializer(serializers.ModelSerializer):
+    phone = CachedPhoneNumberField(region="IN")
+
     class Meta:
         model = ShippingAddress
         fields = (
@@ -30,3 +33,9 @@ class OrderSerializer(serializers.ModelSerializer):
             "price",
             "shipping_address",
         )
+
+
+class ProductSearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ("id", "title", "slug", "description", "price", "discount_price")
@@ -1,3 +1,420 @@
+import base64
+import time
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
+from user.models import AuthUser
+
+from . import autocomplete, homepage
+from .cart import CartSummary
+from .listing import (
+    SORTS,
+    encode_cursor,
+    listed_products,
+    product_facets,
+    product_page,
+)
+from .models import AddedProduct, Category, Order, Product, ShippingAddress
+from .search import rebuild_index, search
+
+
+class HomepageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.category = Category.objects.create(name="Laptops", description="Light")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product = Product.objects.create(
+                title="Zenbook",
+                description="Thin",
+                price=99900,
+                stock=3,
+                category=self.category,
+            )
+
+    def test_anonymous_homepage_is_served_from_the_cache(self):
+        response = self.client.get(reverse("core:home"))
+        self.assertContains(response, "Zenbook")
+        self.assertContains(response, "Laptops")
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("core:home"))
+        self.assertContains(response, "Zenbook")
+        self.assertContains(response, "csrfmiddlewaretoken")
+
+    def test_saves_and_deletes_mark_the_fragments_stale(self):
+        homepage.homepage_fragments()
+        self.product.title = "Vivobook"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        with mock.patch.object(homepage, "start_revalidation") as start:
+            fragments = homepage.homepage_fragments()
+        start.assert_called_once()
+        self.assertIn("Zenbook", fragments["product_cards"])
+
+        homepage.revalidate()
+        fragments = homepage.homepage_fragments()
+        self.assertIn("Vivobook", fragments["product_cards"])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        homepage.revalidate()
+        fragments = homepage.homepage_fragments()
+        self.assertNotIn("Vivobook", fragments["product_cards"])
+        self.assertNotIn("Laptops", fragments["category_cards"])
+
+    def test_expired_fragments_are_served_while_revalidated(self):
+        homepage.homepage_fragments()
+        later = time.time() + homepage.fresh_timeout() + 1
+        with mock.patch.object(homepage.time, "time", return_value=later):
+            with mock.patch.object(homepage, "start_revalidation") as start:
+                with self.assertNumQueries(0):
+                    fragments = homepage.homepage_fragments()
+        start.assert_called_once()
+        self.assertIn("Zenbook", fragments["product_cards"])
+
+
+class ProductListingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    @classmethod
+    def setUpTestData(cls):
+        laptops = Category.objects.create(name="Laptops", description="Light")
+        phones = Category.objects.create(name="Phones", description="Small")
+        for number in range(7):
+            Product.objects.create(
+                title=f"Product {number}",
+                description="Listed",
+                label="SALE" if number % 2 else "NEW",
+                price=1000 * (number % 3),
+                discount_price=900 * (number % 3) if number % 2 else None,
+                stock=number % 4,
+                category=laptops if number < 4 else phones,
+            )
+        Product.objects.create(
+            title="Retired",
+            description="",
+            price=1,
+            stock=1,
+            TNA=True,
+            category=laptops,
+        )
+
+    def test_pages_list_every_product_in_stock_once(self):
+        listed = set(listed_products().values_list("pk", flat=True))
+        self.assertEqual(len(listed), 5)
+        for sort, (key, descending) in SORTS.items():
+            with self.subTest(sort=sort):
+                seen, cursor = [], None
+                while True:
+                    page, cursor = product_page(listed_products(), sort, cursor, 2)
+                    seen.extend(page)
+                    if cursor is None:
+                        break
+                self.assertCountEqual([product.pk for product in seen], listed)
+                keys = [(getattr(product, key), product.pk) for product in seen]
+                self.assertEqual(keys, sorted(keys, reverse=descending))
+
+    def test_facet_counts(self):
+        category_facets, label_facets = product_facets()
+        self.assertEqual(category_facets, [("Laptops", 3), ("Phones", 2)])
+        self.assertEqual(dict(label_facets)["NEW"], 2)
+        self.assertEqual(dict(label_facets)["SALE"], 3)
+
+        category_facets, label_facets = product_facets(["Phones"], "SALE")
+        self.assertEqual(category_facets, [("Laptops", 2), ("Phones", 1)])
+        self.assertEqual(
+            dict(label_facets), {"DEFAULT": 0, "NEW": 1, "SALE": 1, "BEST_SELLER": 0}
+        )
+
+    def test_facet_counts_follow_product_changes(self):
+        self.assertEqual(product_facets()[0], [("Laptops", 3), ("Phones", 2)])
+        with self.assertNumQueries(0):
+            product_facets()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(stock__gt=0).first().delete()
+        self.assertEqual(sum(count for _, count in product_facets()[0]), 4)
+
+    def test_listing_view(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse("core:product_home"), {"sort": "price", "label": "SALE"}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["products"]), 3)
+        self.assertIsNone(response.context["next_query"])
+        response = self.client.get(reverse("core:product_home"), {"cursor": "oops"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_invalid_cursors(self):
+        _, cursor = product_page(listed_products(), "price", None, 2)
+        self.assertEqual(len(product_page(listed_products(), "price", cursor, 2)[0]), 2)
+        invalid = [
+            # A cursor of another sort order
+            ("newest", cursor),
+            ("discount", cursor),
+            ("newest", encode_cursor("newest", "yesterday", 1)),
+            ("newest", encode_cursor("newest", 5, 1)),
+            ("newest", encode_cursor("newest", "2024-01-01T00:00:00", 1)),
+            ("price", encode_cursor("price", "5", 1)),
+            ("price", encode_cursor("price", 2**70, 1)),
+            ("price", encode_cursor("price", 5, None)),
+            ("price", base64.urlsafe_b64encode(b'{"price": 5}').decode()),
+        ]
+        for sort, invalid_cursor in invalid:
+            response = self.client.get(
+                reverse("core:product_home"), {"sort": sort, "cursor": invalid_cursor}
+            )
+            self.assertEqual(response.status_code, 404, (sort, invalid_cursor))
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.laptops = Category.objects.create(name="Laptops", description="")
+        cls.phones = Category.objects.create(name="Phones", description="")
+        cls.zenbook = Product.objects.create(
+            title="Asus Zenbook",
+            description="Thin aluminium laptop",
+            price=99900,
+            stock=3,
+            category=cls.laptops,
+        )
+        cls.rog = Product.objects.create(
+            title="Asus Rog Phone",
+            description="Gaming phone by Asus",
+            price=69900,
+            stock=3,
+            category=cls.phones,
+        )
+        cls.pixel = Product.objects.create(
+            title="Pixel",
+            description="Camera phone",
+            price=59900,
+            stock=3,
+            category=cls.phones,
+        )
+
+    def titles(self, query):
+        return [product.title for product in search(query).products]
+
+    def test_ranking_and_prefixes(self):
+        self.assertCountEqual(self.titles("asus"), ["Asus Zenbook", "Asus Rog Phone"])
+        self.assertEqual(self.titles("phone")[0], "Asus Rog Phone")
+        self.assertEqual(self.titles("zen"), ["Asus Zenbook"])
+        self.assertEqual(self.titles("asu lap"), ["Asus Zenbook"])
+        self.assertEqual(self.titles("laptops"), ["Asus Zenbook"])
+        self.assertEqual(self.titles('"OR" -*'), [])
+
+    def test_old_title_match_ranks_before_newer_matches(self):
+        Product.objects.bulk_create(
+            Product(
+                title=f"Case {number}",
+                description="Fits the Pixel",
+                price=1900,
+                stock=3,
+                category=self.phones,
+            )
+            # More newer matches than the ranking window search once had
+            for number in range(5000)
+        )
+        rebuild_index()
+        self.assertEqual(self.titles("pixel")[0], "Pixel")
+        self.assertEqual(len(search("pixel", limit=5).products), 5)
+
+    def test_typo_suggestions(self):
+        results = search("zenbok")
+        self.assertEqual(results.suggestion, "zenbook")
+        self.assertEqual(
+            [product.pk for product in results.products], [self.zenbook.pk]
+        )
+        self.assertIsNone(search("zenbook").suggestion)
+        self.assertEqual(search("qwertyuiop").products, [])
+
+    def test_index_follows_signals(self):
+        self.pixel.title = "Pixel Fold"
+        self.pixel.save()
+        self.assertEqual(self.titles("fold"), ["Pixel Fold"])
+        self.phones.name = "Mobiles"
+        self.phones.save()
+        self.assertEqual(len(self.titles("mobiles")), 2)
+        self.rog.delete()
+        self.assertEqual(self.titles("asus"), ["Asus Zenbook"])
+        self.assertEqual(rebuild_index(), 2)
+        self.assertEqual(len(self.titles("mobiles")), 1)
+
+    def test_search_views(self):
+        response = self.client.get(reverse("core:search_api"), {"q": "pixl"})
+        self.assertEqual(response.json()["suggestion"], "pixel")
+        self.assertEqual(response.json()["results"][0]["id"], self.pixel.pk)
+        response = self.client.get(reverse("core:search"), {"q": "zenbook"})
+        self.assertContains(response, "Asus Zenbook")
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        autocomplete.reset_index()
+        self.addCleanup(autocomplete.reset_index)
+        self.laptops = Category.objects.create(name="Laptops", description="")
+        self.zenbook = Product.objects.create(
+            title="Asus Zenbook 14",
+            description="",
+            price=99900,
+            stock=3,
+            category=self.laptops,
+        )
+        Product.objects.create(
+            title="Asus Rog Phone",
+            description="",
+            price=69900,
+            stock=3,
+            category=self.laptops,
+        )
+        Product.objects.create(
+            title="Café Lamp",
+            description="",
+            price=900,
+            stock=3,
+            category=self.laptops,
+        )
+
+    def texts(self, prefix):
+        return [text for _, text, _ in autocomplete.suggest(prefix)]
+
+    def test_suggestions(self):
+        self.assertEqual(self.texts("asus"), ["Asus Rog Phone", "Asus Zenbook 14"])
+        self.assertEqual(self.texts("ZEN"), ["Asus Zenbook 14"])
+        self.assertEqual(self.texts("asus z"), ["Asus Zenbook 14"])
+        self.assertEqual(self.texts("cafe"), ["Café Lamp"])
+        self.assertEqual(self.texts("la"), ["Laptops", "Café Lamp"])
+        self.assertEqual(self.texts("  "), [])
+        self.assertEqual(self.texts("xyz"), [])
+
+    def test_first_word_matches_rank_before_many_later_word_matches(self):
+        for number in range(100):
+            Product.objects.create(
+                title=f"Laptop bag {number:03}",
+                description="",
+                price=1,
+                stock=1,
+                category=self.laptops,
+            )
+        Product.objects.create(
+            title="Bagpack", description="", price=1, stock=1, category=self.laptops
+        )
+        Category.objects.create(name="Bags", description="")
+        self.assertEqual(
+            [text for _, text, _ in autocomplete.suggest("bag", 5)],
+            ["Bags", "Bagpack", "Laptop bag 000", "Laptop bag 001", "Laptop bag 002"],
+        )
+
+    def test_index_follows_commits(self):
+        autocomplete.get_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.zenbook.title = "Asus Vivobook"
+            self.zenbook.save()
+            Product.objects.create(
+                title="Zenfone",
+                description="",
+                price=1,
+                stock=1,
+                category=self.laptops,
+            )
+        self.assertEqual(self.texts("zen"), ["Zenfone"])
+        self.assertEqual(self.texts("vivo"), ["Asus Vivobook"])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.laptops.is_active = False
+            self.laptops.save()
+        self.assertEqual(self.texts("lap"), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.laptops.delete()
+        self.assertEqual(self.texts("asus"), [])
+
+    def test_endpoint_runs_no_query(self):
+        url = reverse("core:search_autocomplete")
+        self.client.get(url, {"q": "a"})
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"q": "zen", "limit": "5"})
+        self.assertEqual(
+            response.json()["suggestions"],
+            [
+                {
+                    "type": "product",
+                    "text": "Asus Zenbook 14",
+                    "url": reverse(
+                        "core:product", args=["asus-zenbook-14", self.zenbook.pk]
+                    ),
+                }
+            ],
+        )
+
+
+class CartSummaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AuthUser.objects.create_user(
+            "buyer@example.com", "secret", phone="+919876543210", user_type="CUSTOMER"
+        )
+        category = Category.objects.create(name="Laptops", description="")
+        cls.products = [
+            Product.objects.create(
+                title=f"Product {number}",
+                description="",
+                price=1999 + number,
+                stock=5,
+                category=category,
+            )
+            for number in range(5)
+        ]
+        cls.address = ShippingAddress.objects.create(
+            user=cls.user,
+            name="Home",
+            phone="+919876543210",
+            address_line1="Street",
+            zip="560001",
+        )
+
+    def add_to_cart(self, products, quantity=3):
+        for product in products:
+            AddedProduct.objects.create(
+                user=self.user, product=product, quantity=quantity
+            )
+
+    def test_totals_in_cents(self):
+        self.assertEqual(CartSummary(self.user).total_cents, 0)
+        self.add_to_cart(self.products[:2])
+        with self.assertNumQueries(1):
+            cart = CartSummary(self.user)
+            self.assertEqual(
+                [line.get_total_item_cost() for line in cart], [3 * 1999, 3 * 2000]
+            )
+            self.assertEqual(cart.lines[0].product.title, "Product 0")
+        self.assertEqual(cart.total_cents, 11997)
+        self.assertEqual(str(cart.total_price), "119.97")
+
+    def test_cart_page_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.products[:1])
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("core:cart"))
+        self.assertContains(response, "Total Price: 59.97")
+        self.add_to_cart(self.products[1:])
+        with self.assertNumQueries(3):
+            self.client.get(reverse("core:cart"))
 
-# Create your tests here.
+    def test_order_is_priced_in_cents(self):
+        self.client.force_login(self.user)
+        self.add_to_cart(self.products[:2], quantity=1)
+        response = self.client.post(
+            reverse("core:order"), {"selected_address": self.address.pk}
+        )
+        self.assertRedirects(
+            response, reverse("core:cart"), fetch_redirect_response=False
+        )
+        order = Order.objects.get()
+        self.assertEqual(order.price, 3999)
+        self.assertEqual(order.products.filter(status="ORDERED").count(), 2)
+        self.assertEqual(CartSummary(self.user).total_cents, 0)
@@ -2,12 +2,14 @@ from django.urls import path, re_path
 
 from .views import (
     AddedProductView,
+    AutocompleteView,
     CartView,
     CheckoutView,
     HomepageView,
     OrderView,
     ProductHomeView,
     ProductView,
+    SearchAPIView,
     SearchView,
     ShippingAddressView,
 )
@@ -23,6 +25,10 @@ urlpatterns = [
     path("checkout/", CheckoutView.as_view(), name="checkout"),
     path("order/", OrderView.as_view(), name="order"),
     path("search/", SearchView.as_view(), name="search"),
+    path("search/api/", SearchAPIView.as_view(), name="search_api"),
+    path(
+        "search/autocomplete/", AutocompleteView.as_view(), name="search_autocomplete"
+    ),
     re_path(r"cart/(?P<pk>\d+)/$", CartView.as_view(), name="cart_modify"),
     # re_path(
     #     r"added_product/(?P<pk>\d+)/$", AddedProductView.as_view(), name="added_product"
@@ -1,12 +1,22 @@
-from django.db.models import Q
+from django.db import transaction
 from django.shortcuts import redirect
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.renderers import TemplateHTMLRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from . import autocomplete
+from .cart import CartSummary
+from .homepage import homepage_fragments
+from .listing import DEFAULT_SORT, SORTS, listed_products, product_facets, product_page
 from .models import AddedProduct, Product, ShippingAddress
-from .serializers import AddedProductSerializer, AddressSerializer, OrderSerializer
+from .search import search
+from .serializers import (
+    AddedProductSerializer,
+    AddressSerializer,
+    OrderSerializer,
+    ProductSearchSerializer,
+)
 
 
 class HomepageView(APIView):
@@ -14,11 +24,8 @@ class HomepageView(APIView):
     template_name = "core/home.html"
 
     def get(self, request):
-        new_products = Product.objects.filter(label="NEW", TNA=False, stock__gt=0)
-        categories = Product.objects.values(
-            "category__name", "category__description", "category__image"
-        ).distinct()
-        return Response({"new_products": new_products, "categories": categories})
+        # Cached product and category cards, see core.homepage
+        return Response(homepage_fragments())
 
 
 class ProductView(APIView):
@@ -64,21 +71,36 @@ class ProductHomeView(APIView):
     renderer_classes = [TemplateHTMLRenderer]
     template_name = "core/product_home.html"
 
+    page_size = 24
+
     def get(self, request):
-        categories = request.GET.getlist("categories", None)
+        categories = request.GET.getlist("categories")
         label = request.GET.get("label")
+        sort = request.GET.get("sort", DEFAULT_SORT)
 
-        q_filter = ~Q(pk__in=[])
-        if categories:
-            q_filter &= Q(category__name__in=categories)
-        if label:
-            q_filter &= Q(label=label)
-
-        products = Product.objects.filter(q_filter)
-        categories = Product.objects.values("category__name").distinct()
-        labels = ["DEFAULT", "NEW", "SALE", "BEST_SELLER"]
+        products, next_cursor = product_page(
+            listed_products(categories, label),
+            sort,
+            request.GET.get("cursor"),
+            self.page_size,
+        )
+        category_facets, label_facets = product_facets(categories, label)
+        next_query = None
+        if next_cursor:
+            next_query = request.GET.copy()
+            next_query["cursor"] = next_cursor
+            next_query = next_query.urlencode()
         return Response(
-            {"products": products, "categories": categories, "product_labels": labels}
+            {
+                "products": products,
+                "category_facets": category_facets,
+                "label_facets": label_facets,
+                "selected_categories": categories,
+                "selected_label": label,
+                "sorts": list(SORTS),
+                "selected_sort": sort,
+                "next_query": next_query,
+            }
         )
 
 
@@ -89,14 +111,8 @@ class CartView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        added_products = AddedProduct.objects.filter(
-            user=request.user.pk, status="WISH_LIST", quantity__gt=0
-        )
-        total_price = 0
-        for added_product in added_products:
-            total_price += added_product.get_total_item_price()
-
-        return Response({"added_products": added_products, "total_price": total_price})
+        cart = CartSummary(request.user.pk)
+        return Response({"added_products": cart, "total_price": cart.total_price})
 
     def post(self, request, pk):
         action = request.data.get("quantity")
@@ -175,9 +191,7 @@ class CheckoutView(APIView):
 
     def get(self, request):
         address = request.GET.get("address")
-        added_products = AddedProduct.objects.filter(
-            user=request.user.pk, status="WISH_LIST", quantity__gt=0
-        )
+        cart = CartSummary(request.user.pk)
 
         shipping_addresses = ShippingAddress.objects.filter(
             user=request.user.pk
@@ -192,7 +206,8 @@ class CheckoutView(APIView):
             ).last()
         return Response(
             {
-                "added_products": added_products,
+                "added_products": cart,
+                "total_price": cart.total_price,
                 "shipping_addresses": shipping_addresses,
                 "chosen_address": chosen_address,
             }
@@ -206,23 +221,21 @@ class OrderView(APIView):
     def post(self, request):
         address = request.data.get("selected_address")
         if address:
-            added_products = AddedProduct.objects.filter(
-                user=request.user.pk, status="WISH_LIST", quantity__gt=0
-            )
-            total_price = 0
-            for added_product in added_products:
-                total_price += added_product.get_total_item_price()
-
+            cart = CartSummary(request.user.pk)
             orderSerialzer = OrderSerializer(
                 data={
                     "user": request.user.pk,
-                    "price": total_price,
+                    "price": cart.total_cents,
                     "shipping_address": address,
                 }
             )
-            if orderSerialzer.is_valid():
-                order = orderSerialzer.save()
-                added_products.update(status="ORDERED", order=order)
+            if cart and orderSerialzer.is_valid():
+                with transaction.atomic():
+                    order = orderSerialzer.save()
+                    # Orders the priced lines, not lines added since
+                    AddedProduct.objects.filter(pk__in=cart.line_ids()).update(
+                        status="ORDERED", order=order
+                    )
                 return redirect("core:cart")
 
         return redirect("core:checkout")
@@ -233,13 +246,52 @@ class SearchView(APIView):
     template_name = "core/search.html"
 
     def get(self, request):
-        product = Product.objects.filter(title__icontains="asus")
-        return Response()
+        query = request.GET.get("q", "")
+        if not query:
+            return Response()
+        return Response({"results": search(query)})
 
     def post(self, request):
         keyword = request.data.get("search")
         if keyword:
-            products = Product.objects.filter(title__icontains=keyword)
-            return Response({"products": products})
+            return Response({"results": search(keyword)})
         else:
             return redirect("core:home")
+
+
+class AutocompleteView(APIView):
+    # Keystrokes are answered from the prefix index, without
+    # the session or user queries of authentication
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        try:
+            limit = min(int(request.GET.get("limit", 8)), 20)
+        except ValueError:
+            limit = 8
+        suggestions = autocomplete.suggest(request.GET.get("q", ""), max(limit, 1))
+        return Response(
+            {
+                "suggestions": [
+                    {"type": kind, "text": text, "url": url}
+                    for kind, text, url in suggestions
+                ]
+            }
+        )
+
+
+class SearchAPIView(APIView):
+    def get(self, request):
+        try:
+            limit = min(int(request.GET.get("limit", 20)), 100)
+        except ValueError:
+            limit = 20
+        results = search(request.GET.get("q", ""), max(limit, 1))
+        return Response(
+            {
+                "query": results.query,
+                "suggestion": results.suggestion,
+                "results": ProductSearchSerializer(results.products, many=True).data,
+            }
+        )
@@ -95,6 +95,18 @@ DATABASES = {
     }
 }
 
+# Homepage product and category cards are cached in the default cache,
+# fresh for HOMEPAGE_CACHE_TIMEOUT seconds or until products or categories
+# change, then served stale for up to HOMEPAGE_STALE_TIMEOUT seconds while
+# they are rendered again in the background
+HOMEPAGE_CACHE_TIMEOUT = 300
+HOMEPAGE_STALE_TIMEOUT = 60
+
+# Search autocomplete prefix indexes are kept in the memory of every process,
+# updated by the changes of their process and rebuilt in the background once
+# older than AUTOCOMPLETE_MAX_AGE seconds to bring in the changes of the others
+AUTOCOMPLETE_MAX_AGE = 600
+
 
 AUTH_USER_MODEL = "user.AuthUser"
 
@@ -1,7 +1,9 @@
+from core.phones import CachedPhoneNumberField
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import update_last_login
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework.validators import UniqueValidator
 from rest_framework_simplejwt.serializers import TokenObtainSerializer
 from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -41,6 +43,15 @@ class LoginSerializers(serializers.Serializer):
 
 
 class SignUpSerializer(serializers.ModelSerializer):
+    # Declared fields lose the unique validator of their model field
+    phone = CachedPhoneNumberField(
+        validators=[
+            UniqueValidator(
+                queryset=AuthUser.objects.all(),
+                message=_("A user with that phone number already exists."),
+            )
+        ]
+    )
     password = serializers.CharField(
         write_only=True,
         required=True,
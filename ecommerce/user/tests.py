@@ -1,3 +1,30 @@
 from django.test import TestCase
 
-# Create your tests here.
+from .models import AuthUser
+from .serializers import SignUpSerializer
+
+
+class SignUpSerializerTests(TestCase):
+    def signup(self, email, phone):
+        return SignUpSerializer(
+            data={
+                "email": email,
+                "phone": phone,
+                "password": "secret-password",
+                "user_type": "CUSTOMER",
+                "first_name": "Robin",
+                "last_name": "Jones",
+            }
+        )
+
+    def test_duplicate_phone_is_a_validation_error(self):
+        serializer = self.signup("first@example.com", "+919876543210")
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        serializer = self.signup("second@example.com", "+919876543210")
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(
+            serializer.errors["phone"],
+            ["A user with that phone number already exists."],
+        )
+        self.assertEqual(AuthUser.objects.count(), 1)
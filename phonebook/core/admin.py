@@ -35,7 +35,7 @@ class PhoneDirectoryAdminView(admin.ModelAdmin):
     list_display = ("user", "phone", "spam_reports", "aliases")
 
     def spam_reports(self, obj):
-        return obj.spam_reports.count()
+        return obj.spam_count
 
     def aliases(self, obj):
         return ", ".join([str(alias.name) for alias in obj.aliases.all()])
@@ -0,0 +1,167 @@
+import io
+import itertools
+import math
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection, transaction
+from user.models import AuthUser
+
+from .models import Contact, PhoneDirectory, SpamData, phone_key
+
+SYLLABLES = "ka ra an mi su jo el ha ni to sa ve li do ar ya ru me ko bi".split()
+
+
+@contextmanager
+def temporary_database(verbosity=0):
+    """Runs the enclosed block against a freshly migrated throwaway database,
+    the same way the test runner does, so benchmarks never touch real data"""
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=verbosity, autoclobber=True)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=verbosity)
+
+
+def random_name(rng, words=2):
+    return " ".join(
+        "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+        for _ in range(words)
+    )
+
+
+def random_phone(rng, country_code=91):
+    return f"+{country_code}{rng.randint(7000000000, 9999999999)}"
+
+
+def make_rng(seed=0):
+    return random.Random(seed)
+
+
+def measure(func, *args, repeat=5, clock=time.perf_counter, **kwargs):
+    """Calls func repeat times and returns its timings in milliseconds,
+    pass clock=time.process_time to measure CPU time instead of wall time"""
+    timings = []
+    for _ in range(repeat):
+        start = clock()
+        func(*args, **kwargs)
+        timings.append((clock() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    return {
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def percentiles(timings, points=(50, 95, 99)):
+    """Nearest rank percentiles of timings in milliseconds"""
+    ordered = sorted(timings)
+    return {
+        f"p{point}_ms": round(
+            ordered[max(0, math.ceil(point / 100 * len(ordered)) - 1)], 3
+        )
+        for point in points
+    }
+
+
+def zipf_sampler(rng, population, exponent=1.1):
+    """Draws from population with Zipf distributed popularity,
+    the first items being the most popular"""
+    cum_weights = list(
+        itertools.accumulate(
+            1 / rank**exponent for rank in range(1, len(population) + 1)
+        )
+    )
+
+    def sample(count):
+        return rng.choices(population, cum_weights=cum_weights, k=count)
+
+    return sample
+
+
+def populate_phonebook(
+    rng,
+    users,
+    contacts_per_user,
+    spam_per_user,
+    numbers=None,
+    exponent=1.1,
+    batch_size=5000,
+):
+    """Generates users with contacts_per_user contacts and spam_per_user spam
+    reports each, using bulk inserts. Contacts and spam reports draw from
+    a shared pool of numbers with Zipf distributed popularity, registered
+    numbers included. Every user has the password "password".
+    Returns the number of generated rows per model."""
+    if numbers is None:
+        numbers = max(1, users * contacts_per_user // 4)
+    password = make_password("password")
+    user_phones = [f"+9188{i:08d}" for i in range(users)]
+    pool = [f"+9187{i:08d}" for i in range(numbers)]
+    # Some of the popular numbers belong to registered users
+    for rank, phone in zip(range(1, numbers, 10), user_phones):
+        pool[rank] = phone
+
+    with transaction.atomic():
+        created = AuthUser.objects.bulk_create(
+            (
+                AuthUser(
+                    phone=phone,
+                    username=random_name(rng, words=1),
+                    email=f"user{i}@example.com",
+                    password=password,
+                )
+                for i, phone in enumerate(user_phones)
+            ),
+            batch_size=batch_size,
+        )
+        user_ids = [user.pk for user in created]
+        registered = dict(zip(user_phones, user_ids))
+        PhoneDirectory.objects.bulk_create(
+            (
+                PhoneDirectory(
+                    phone=phone, number=phone_key(phone), user_id=registered.get(phone)
+                )
+                for phone in {*user_phones, *pool}
+            ),
+            batch_size=batch_size,
+        )
+
+        sample = zipf_sampler(rng, pool, exponent)
+        contacts = Contact.objects.bulk_create(
+            (
+                Contact(user_id=user_id, phone_id=phone, name=random_name(rng))
+                for user_id in user_ids
+                for phone in set(sample(contacts_per_user))
+            ),
+            batch_size=batch_size,
+        )
+        spam = SpamData.objects.bulk_create(
+            (
+                SpamData(
+                    target_phone_id=phone,
+                    reporter_phone_id=user_id,
+                    name=random_name(rng, words=1) if rng.random() < 0.5 else None,
+                )
+                for user_id in user_ids
+                for phone in set(sample(spam_per_user))
+            ),
+            batch_size=batch_size,
+        )
+        PhoneDirectory.objects.recompute_spam_counts()
+    call_command("rebuild_name_index", batch_size=batch_size, stdout=io.StringIO())
+    return {
+        "users": len(user_ids),
+        "phone_directory": len({*user_phones, *pool}),
+        "contacts": len(contacts),
+        "spam_reports": len(spam),
+    }
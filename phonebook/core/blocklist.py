@@ -0,0 +1,164 @@
+"""Spam blocklist export.
+
+Numbers are exported as their E.164 digits, an unsigned 64 bit integer.
+All integers are big endian.
+
+Packed delta (encoding "packed"), the blocklist changes since a version,
+the full blocklist when since is 0:
+    magic b"SPBL", format (uint8), version (uint32), since (uint32),
+    added count (uint32), removed count (uint32),
+    added numbers (sorted uint64 array), removed numbers (sorted uint64 array)
+
+Bloom filter (encoding "bloom"), the full blocklist only:
+    magic b"SPBF", format (uint8), version (uint32), bit count m (uint64),
+    hash count k (uint8), bit array (m / 8 bytes, bit i is byte i // 8, bit i % 8)
+Bit positions of a number are (h1 + i * h2) % m for i in range(k), where
+h1 and h2 are the two big endian uint64 halves of the 16 byte blake2b
+digest of the number as a big endian uint64.
+"""
+
+import hashlib
+import math
+import struct
+import sys
+from array import array
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import PhoneDirectory, SpamBlocklistEntry, SpamBlocklistVersion
+from .sharding import shard_aliases
+
+FORMAT = 1
+PACKED_HEADER = struct.Struct(">4sBIIII")
+BLOOM_HEADER = struct.Struct(">4sBIQB")
+LOOKUP_BATCH_SIZE = 900
+
+
+def pack_numbers(numbers):
+    """Packs sorted integers as a big endian uint64 array"""
+    packed = array("Q", numbers)
+    if sys.byteorder == "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_numbers(data):
+    numbers = array("Q")
+    numbers.frombytes(data)
+    if sys.byteorder == "little":
+        numbers.byteswap()
+    return numbers
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.size += -self.size % 8
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray(self.size // 8)
+
+    def positions(self, number):
+        digest = hashlib.blake2b(number.to_bytes(8, "big"), digest_size=16).digest()
+        h1, h2 = struct.unpack(">QQ", digest)
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, number):
+        for position in self.positions(number):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, number):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(number)
+        )
+
+
+def spam_numbers(threshold):
+    """E.164 digits of the directory numbers with more than threshold spam reports"""
+    # The spam_count > 0 term matches the partial phonedirectory_spam_idx
+    return PhoneDirectory.objects.filter(
+        Q(spam_count__gt=0), Q(spam_count__gt=threshold)
+    ).values_list("number", flat=True)
+
+
+def build_blocklist(threshold):
+    """Publishes a new blocklist version from the current spam counts,
+    recording only the numbers added and removed since the last version"""
+    with transaction.atomic():
+        current = set()
+        for shard in shard_aliases():
+            current.update(
+                spam_numbers(threshold).using(shard).iterator(chunk_size=10000)
+            )
+        active = set(
+            SpamBlocklistEntry.objects.filter(removed_version=None)
+            .values_list("number", flat=True)
+            .iterator(chunk_size=10000)
+        )
+        added = sorted(current - active)
+        removed = sorted(active - current)
+        version = SpamBlocklistVersion.objects.create(
+            threshold=threshold, size=len(current)
+        )
+        for i in range(0, len(removed), LOOKUP_BATCH_SIZE):
+            SpamBlocklistEntry.objects.filter(
+                number__in=removed[i : i + LOOKUP_BATCH_SIZE]
+            ).update(removed_version=version)
+        SpamBlocklistEntry.objects.bulk_create(
+            (
+                SpamBlocklistEntry(
+                    number=number, added_version=version, removed_version=None
+                )
+                for number in added
+            ),
+            batch_size=5000,
+            update_conflicts=True,
+            unique_fields=["number"],
+            update_fields=["added_version", "removed_version"],
+        )
+    return version
+
+
+def latest_version():
+    return SpamBlocklistVersion.objects.order_by("-pk").first()
+
+
+def blocklist_changes(since=0):
+    """Querysets of the numbers added to and removed from the blocklist
+    after version since. Re-adding a number overwrites the version that
+    added it before, removals are sent whenever that was, a client
+    dropping a number it does not have is harmless."""
+    added = SpamBlocklistEntry.objects.filter(
+        removed_version=None, added_version__gt=since
+    )
+    removed = SpamBlocklistEntry.objects.filter(removed_version__gt=since)
+    return (
+        added.values_list("number", flat=True),
+        removed.values_list("number", flat=True),
+    )
+
+
+def blocklist_delta(since=0):
+    """Numbers added to and removed from the blocklist after version since,
+    as sorted lists. Sorting here keeps the queries on blocklist_delta_idx."""
+    added, removed = blocklist_changes(since)
+    return sorted(added), sorted(removed)
+
+
+def export_packed(version, since=0):
+    added, removed = blocklist_delta(since)
+    header = PACKED_HEADER.pack(
+        b"SPBL", FORMAT, version, since, len(added), len(removed)
+    )
+    return header + pack_numbers(added) + pack_numbers(removed)
+
+
+def export_bloom(version, error_rate=0.01):
+    numbers, _ = blocklist_delta()
+    bloom = BloomFilter(len(numbers), error_rate)
+    for number in numbers:
+        bloom.add(number)
+    header = BLOOM_HEADER.pack(b"SPBF", FORMAT, version, bloom.size, bloom.hashes)
+    return header + bytes(bloom.bits)
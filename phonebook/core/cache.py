@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class LRUCache:
+    """Thread safe, per process least recently used cache
+    whose entries expire ttl seconds after they were set"""
+
+    def __init__(self, max_size=10000, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCache:
+    """Adapter exposing a configured django cache with the LRUCache interface"""
+
+    def __init__(self, alias="default", ttl=300, key_prefix=""):
+        self.cache = caches[alias]
+        self.ttl = ttl
+        self.key_prefix = key_prefix
+
+    def make_key(self, key):
+        return f"{self.key_prefix}{key}"
+
+    def get(self, key, default=None):
+        return self.cache.get(self.make_key(key), default)
+
+    def set(self, key, value):
+        self.cache.set(self.make_key(key), value, self.ttl)
+
+    def delete(self, key):
+        self.cache.delete(self.make_key(key))
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.make_key(key) for key in keys])
+
+    def clear(self):
+        self.cache.clear()
+
+
+BACKENDS = {
+    "local": LRUCache,
+    "django": DjangoCache,
+}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name):
+    """Returns the cache configured under name in settings.PHONEBOOK_CACHES,
+    created on first use"""
+    if name not in _caches:
+        with _caches_lock:
+            if name not in _caches:
+                options = dict(settings.PHONEBOOK_CACHES[name])
+                backend = BACKENDS[options.pop("BACKEND")]
+                _caches[name] = backend(
+                    **{key.lower(): value for key, value in options.items()}
+                )
+    return _caches[name]
+
+
+def phone_details_cache():
+    return get_cache("phone_details")
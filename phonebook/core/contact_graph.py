@@ -0,0 +1,63 @@
+"""Contact graphs, the numbers in the contacts of every user.
+
+The email of a registered user is only shown to users having them as a
+contact. Contact graphs answer that without a query: the sorted phone
+keys of the contacts of a user, an array of unsigned 64 bit integers
+(8 bytes a number), kept in the contact_graphs cache. Graphs are loaded
+by Contact.objects.contact_graph on first use and updated once saved
+contacts are committed. Cached graphs are replaced, never modified,
+so that readers of a shared graph never see a partial update.
+"""
+
+import bisect
+import itertools
+import sys
+from array import array
+
+from .cache import get_cache
+
+
+class ContactGraph:
+    __slots__ = ("keys",)
+
+    def __init__(self, keys=()):
+        self.keys = array("Q", sorted(set(keys)))
+
+    def __contains__(self, key):
+        position = bisect.bisect_left(self.keys, key)
+        return position < len(self.keys) and self.keys[position] == key
+
+    def __len__(self):
+        return len(self.keys)
+
+    def with_keys(self, keys):
+        return ContactGraph(itertools.chain(self.keys, keys))
+
+    @property
+    def nbytes(self):
+        """Memory used by the graph"""
+        return sys.getsizeof(self) + sys.getsizeof(self.keys)
+
+
+def contact_graph_cache():
+    return get_cache("contact_graphs")
+
+
+def graph_key(user_id):
+    """Cache key of the graph of a user. Token users have string ids,
+    model instances integer ones, both must reach the same graph."""
+    return int(user_id)
+
+
+def add_contact_keys(user_id, keys):
+    """Adds phone keys to the cached graph of a user, a graph that is
+    not cached has them once loaded. Concurrent additions may drop
+    each other's keys, which only hides emails until the graph expires."""
+    cache = contact_graph_cache()
+    graph = cache.get(graph_key(user_id))
+    if graph is not None:
+        cache.set(graph_key(user_id), graph.with_keys(keys))
+
+
+def forget_contact_graph(user_id):
+    contact_graph_cache().delete(graph_key(user_id))
@@ -0,0 +1,95 @@
+"""Links registered users to the phone directory instances of their numbers.
+
+Users are linked explicitly where they are created, by the signup
+serializer, the admin and the bulk imports, instead of by a post_save
+signal. A link is an upsert, one statement per batch of users whatever
+the directory already knows about their numbers, followed by the bulk
+indexing of their names, on the shard of every number. The
+link_phone_directory command backfills the users created by other means.
+"""
+
+from django.db.models import F
+from user.models import AuthUser
+
+from .models import NameIndexEntry, PhoneDirectory, invalidate_phone_details, phone_key
+from .sharding import group_by_shard, is_sharded, shard_aliases
+
+
+def link_users(users, batch_size=900):
+    """Links users to the directory instances of their phone numbers,
+    creating the missing ones, and indexes their names.
+    Returns the number of linked users."""
+    users = list(users)
+    for shard, group in group_by_shard(users, lambda user: user.phone).items():
+        PhoneDirectory.objects.using(shard).bulk_create(
+            (
+                PhoneDirectory(
+                    phone=user.phone, number=phone_key(user.phone), user_id=user.pk
+                )
+                for _, user in group
+            ),
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["phone"],
+            update_fields=["user"],
+        )
+        NameIndexEntry.objects.db_manager(shard).bulk_index(
+            NameIndexEntry.REGISTERED,
+            ((user.pk, user.phone, user.username) for _, user in group),
+            batch_size=batch_size,
+        )
+        invalidate_phone_details(*(user.phone for _, user in group), using=shard)
+    return len(users)
+
+
+def backfill_links(batch_size=900):
+    """Repairs the links of the whole directory: unlinks the instances of
+    numbers their user no longer has, then links every unlinked user.
+    Returns the number of unlinked instances and of linked users."""
+    if is_sharded():
+        return backfill_shard_links(batch_size)
+    unlinked = (
+        PhoneDirectory.objects.filter(user__isnull=False)
+        .exclude(user__phone=F("phone"))
+        .update(user=None)
+    )
+    users = (
+        AuthUser.objects.filter(phone_dir__isnull=True)
+        .only("pk", "phone", "username")
+        .order_by("pk")
+    )
+    # Materialized up front, linking changes what the query matches
+    users = list(users)
+    linked = 0
+    for start in range(0, len(users), batch_size):
+        linked += link_users(users[start : start + batch_size], batch_size)
+    return unlinked, linked
+
+
+def backfill_shard_links(batch_size=900):
+    """backfill_links of a sharded directory, which cannot be joined with
+    the users. Users are checked batch_size at a time against every shard."""
+    unlinked = linked = 0
+    users = AuthUser.objects.only("pk", "phone", "username").order_by("pk")
+    for start in range(0, users.count(), batch_size):
+        batch = {user.pk: user for user in users[start : start + batch_size]}
+        correct = set()
+        for shard in shard_aliases():
+            directories = PhoneDirectory.objects.using(shard).filter(
+                user__in=list(batch)
+            )
+            stale = []
+            for phone, user_id in directories.values_list("phone", "user"):
+                if str(phone) == str(batch[user_id].phone):
+                    correct.add(user_id)
+                else:
+                    stale.append(phone)
+            unlinked += (
+                PhoneDirectory.objects.using(shard)
+                .filter(pk__in=stale)
+                .update(user=None)
+            )
+        linked += link_users(
+            user for user_id, user in batch.items() if user_id not in correct
+        )
+    return unlinked, linked
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from user.models import AuthUser
+
+from core.benchmarks import make_rng, percentiles, random_name, temporary_database
+from core.models import Contact, PhoneDirectory, SpamData
+
+
+class Command(BaseCommand):
+    help = (
+        "Load tests the read API through the WSGI handler with a thread "
+        "per concurrent request and through the ASGI handler on an event loop"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--users", type=int, default=300)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def populate(self, rng, users):
+        AuthUser.objects.bulk_create(
+            AuthUser(
+                phone=f"+9188{i:08d}",
+                username=random_name(rng, words=1),
+                email=f"{i}@mail.com",
+            )
+            for i in range(users)
+        )
+        for user in AuthUser.objects.all():
+            PhoneDirectory.objects.create(phone=user.phone, user=user)
+        users = list(AuthUser.objects.all())
+        unregistered = [
+            PhoneDirectory.objects.create(phone=f"+9187{i:08d}")
+            for i in range(len(users))
+        ]
+        for user in users:
+            for phone in rng.sample(unregistered, 5):
+                Contact.objects.create(user=user, phone=phone, name=random_name(rng))
+            SpamData.objects.create(
+                target_phone=rng.choice(unregistered),
+                reporter_phone=user,
+                name=random_name(rng),
+            )
+        return users, unregistered
+
+    def workload(self, rng, users, unregistered, requests):
+        paths = []
+        for _ in range(requests):
+            user = rng.choice(users)
+            path = rng.choice(
+                (
+                    f"/api/search/?name={random_name(rng, words=1)[:3]}",
+                    f"/api/search/?phone={rng.choice(unregistered).phone.as_e164}",
+                    f"/api/phone-directory/?q={rng.choice(users).phone.as_e164}",
+                    "/api/contacts/",
+                )
+            )
+            headers = {"authorization": f"Bearer {AccessToken.for_user(user)}"}
+            paths.append((path.replace("+", "%2B"), headers))
+        return paths
+
+    def run_wsgi(self, workload, concurrency):
+        local = threading.local()
+
+        def request(item):
+            if not hasattr(local, "client"):
+                local.client = Client()
+            path, headers = item
+            start = time.perf_counter()
+            response = local.client.get(path, headers=headers)
+            elapsed = (time.perf_counter() - start) * 1000
+            assert response.status_code == 200, response.content
+            return elapsed
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            timings = list(pool.map(request, workload))
+        return timings, time.perf_counter() - start
+
+    async def run_asgi(self, workload, concurrency):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def request(item):
+            path, headers = item
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                elapsed = (time.perf_counter() - start) * 1000
+            assert response.status_code == 200, response.content
+            return elapsed
+
+        start = time.perf_counter()
+        timings = await asyncio.gather(*(request(item) for item in workload))
+        return timings, time.perf_counter() - start
+
+    def summarize(self, timings, elapsed):
+        return {
+            "requests_per_s": round(len(timings) / elapsed, 1),
+            "total_ms": round(elapsed * 1000, 3),
+            **percentiles(timings),
+        }
+
+    def handle(self, *args, requests, concurrency, users, seed, **options):
+        rng = make_rng(seed)
+        report = {"requests": requests, "concurrency": concurrency}
+        with temporary_database(), override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            users, unregistered = self.populate(rng, users)
+            workload = self.workload(rng, users, unregistered, requests)
+            # Warm the parser and phone details caches for both runs
+            self.run_wsgi(workload, concurrency)
+            report["wsgi"] = self.summarize(*self.run_wsgi(workload, concurrency))
+            report["asgi"] = self.summarize(
+                *asyncio.run(self.run_asgi(workload, concurrency))
+            )
+        self.stdout.write(json.dumps(report, indent=4))
@@ -0,0 +1,76 @@
+import json
+import statistics
+import sys
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import (
+    make_rng,
+    measure,
+    populate_phonebook,
+    summarize,
+    temporary_database,
+)
+from core.contact_graph import contact_graph_cache
+from core.models import Contact, PhoneDirectory
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the contact lookup of the phone details view, a query "
+        "per lookup, with cached contact graphs and reports their memory usage"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--contacts", type=int, default=200)
+        parser.add_argument("--lookups", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, users, contacts, lookups, seed, **options):
+        rng = make_rng(seed)
+        with temporary_database():
+            populate_phonebook(rng, users, contacts, 0)
+            user_ids = list(Contact.objects.values_list("user", flat=True).distinct())
+            numbers = list(PhoneDirectory.objects.values_list("number", flat=True))
+            probes = [
+                (rng.choice(user_ids), rng.choice(numbers)) for _ in range(lookups)
+            ]
+
+            def query():
+                for user_id, number in probes:
+                    Contact.objects.filter(
+                        user_id=user_id, phone__number=number
+                    ).exists()
+
+            def graph():
+                for user_id, number in probes:
+                    number in Contact.objects.contact_graph(user_id)
+
+            contact_graph_cache().clear()
+            graph_sizes = []
+            set_sizes = []
+            for user_id in user_ids:
+                contact_graph = Contact.objects.contact_graph(user_id)
+                graph_sizes.append(contact_graph.nbytes)
+                keys = set(contact_graph.keys)
+                set_sizes.append(
+                    sys.getsizeof(keys) + sum(sys.getsizeof(key) for key in keys)
+                )
+
+            report = {
+                "users": len(user_ids),
+                "contacts_per_user": contacts,
+                "lookups": lookups,
+                "query_ms": summarize(measure(query, repeat=3)),
+                "cached_graph_ms": summarize(measure(graph, repeat=3)),
+                "graph_bytes_per_user": {
+                    "mean": round(statistics.mean(graph_sizes)),
+                    "max": max(graph_sizes),
+                },
+                "set_bytes_per_user": {
+                    "mean": round(statistics.mean(set_sizes)),
+                    "max": max(set_sizes),
+                },
+            }
+        self.stdout.write(json.dumps(report, indent=4))
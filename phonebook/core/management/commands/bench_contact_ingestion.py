@@ -0,0 +1,105 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from phonenumber_field.serializerfields import PhoneNumberField
+from rest_framework.test import APIClient
+from user.models import AuthUser
+
+from core.benchmarks import (
+    make_rng,
+    measure,
+    random_name,
+    summarize,
+    temporary_database,
+)
+from core.phones import cache_stats, clear_cache
+from core.serializers import ContactImportSerializer
+
+
+class UncachedContactImportSerializer(ContactImportSerializer):
+    phone = PhoneNumberField()
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures phone number parsing during bulk contact ingestion "
+        "with and without the memoized phone parser"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--contacts", type=int, default=5000)
+        parser.add_argument(
+            "--distinct",
+            type=int,
+            default=2000,
+            help="Number of distinct phone numbers among the contacts",
+        )
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def validate(self, serializer_class, contacts):
+        for contact in contacts:
+            serializer_class(data=contact).is_valid(raise_exception=True)
+
+    def handle(self, *args, contacts, distinct, repeat, seed, **options):
+        rng = make_rng(seed)
+        numbers = [f"+9189{i:08d}" for i in range(distinct)]
+        # Address books mostly share a few popular numbers
+        payload = [
+            {
+                "phone": numbers[min(int(rng.paretovariate(1)) - 1, distinct - 1)],
+                "name": random_name(rng),
+            }
+            for _ in range(contacts)
+        ]
+
+        clear_cache()
+        report = {
+            "contacts": contacts,
+            "distinct": len({contact["phone"] for contact in payload}),
+            "validation": {
+                "uncached": summarize(
+                    measure(
+                        self.validate,
+                        UncachedContactImportSerializer,
+                        payload,
+                        repeat=repeat,
+                    )
+                ),
+                "cached": summarize(
+                    measure(
+                        self.validate, ContactImportSerializer, payload, repeat=repeat
+                    )
+                ),
+            },
+        }
+
+        with temporary_database(), override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            client = APIClient()
+            users = [
+                AuthUser.objects.create(
+                    phone=f"+9188{i:08d}", username=f"user{i}", email=f"{i}@mail.com"
+                )
+                for i in range(repeat)
+            ]
+            timings = []
+            for user in users:
+                client.force_authenticate(user)
+                with CaptureQueriesContext(connection) as queries:
+                    timings.extend(
+                        measure(
+                            client.post,
+                            "/api/contacts/bulk/",
+                            payload,
+                            format="json",
+                            repeat=1,
+                        )
+                    )
+            report["bulk_import"] = {**summarize(timings), "queries": len(queries)}
+        report["parser_cache"] = cache_stats()
+        self.stdout.write(json.dumps(report, indent=4))
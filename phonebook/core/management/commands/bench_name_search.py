@@ -0,0 +1,126 @@
+import json
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from user.models import AuthUser
+
+from core.benchmarks import (
+    make_rng,
+    measure,
+    random_name,
+    random_phone,
+    summarize,
+    temporary_database,
+)
+from core.models import Contact, PhoneDirectory, SpamData, phone_key
+from core.search import NameSearchEngine
+
+BATCH_SIZE = 5000
+
+
+def regex_name_search(name_query):
+    """Lookups of the regex based name search the index replaced"""
+    results = []
+    for model, name_field in zip(
+        [AuthUser, Contact, SpamData], ["username", "name", "name"]
+    ):
+        results.extend(
+            model.objects.filter(
+                **{f"{name_field}__startswith": name_query}
+            ).values_list("pk", name_field)
+        )
+        results.extend(
+            model.objects.filter(
+                **{f"{name_field}__iregex": r".+" + name_query}
+            ).values_list("pk", name_field)
+        )
+    return results
+
+
+def index_name_search(name_query):
+    return list(NameSearchEngine().queryset(name_query).values_list("pk", "name"))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the trigram name index against the regex name search "
+        "on a generated throwaway database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--contacts", type=int, default=1_000_000)
+        parser.add_argument("--contacts-per-user", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("queries", nargs="*")
+
+    def populate(self, rng, contacts, contacts_per_user):
+        users = max(1, contacts // contacts_per_user)
+        numbers = sorted({random_phone(rng) for _ in range(contacts // 2 + users)})
+        user_numbers, contact_numbers = numbers[:users], numbers[users:]
+        PhoneDirectory.objects.bulk_create(
+            (
+                PhoneDirectory(phone=number, number=phone_key(number))
+                for number in numbers
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        AuthUser.objects.bulk_create(
+            (
+                AuthUser(username=random_name(rng, words=1), phone=number, email=None)
+                for number in user_numbers
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        for user_id, number in AuthUser.objects.values_list("pk", "phone"):
+            PhoneDirectory.objects.filter(phone=number).update(user_id=user_id)
+        user_ids = list(AuthUser.objects.values_list("pk", flat=True))
+        Contact.objects.bulk_create(
+            (
+                Contact(
+                    user_id=user_ids[i % len(user_ids)],
+                    phone_id=rng.choice(contact_numbers),
+                    name=random_name(rng),
+                )
+                for i in range(contacts)
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        SpamData.objects.bulk_create(
+            (
+                SpamData(
+                    target_phone_id=rng.choice(contact_numbers),
+                    reporter_phone_id=rng.choice(user_ids),
+                    name=random_name(rng),
+                )
+                for _ in range(contacts // 20)
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+    def handle(
+        self, *args, contacts, contacts_per_user, repeat, seed, queries, **options
+    ):
+        rng = make_rng(seed)
+        if not queries:
+            sample = random_name(rng).lower()
+            queries = [sample[:1], sample[:3], sample[1:5], sample[2:8]]
+
+        report = {"contacts": contacts, "queries": {}}
+        with temporary_database():
+            self.stdout.write(f"Generating {contacts} contacts")
+            self.populate(rng, contacts, contacts_per_user)
+            call_command("rebuild_name_index", stdout=self.stdout)
+            for query in queries:
+                report["queries"][query] = {
+                    "matches": len(index_name_search(query)),
+                    "regex": summarize(
+                        measure(regex_name_search, query, repeat=repeat)
+                    ),
+                    "index": summarize(
+                        measure(index_name_search, query, repeat=repeat)
+                    ),
+                }
+        self.stdout.write(json.dumps(report, indent=4))
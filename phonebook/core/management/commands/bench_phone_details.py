@@ -0,0 +1,99 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from user.models import AuthUser
+
+from core.benchmarks import (
+    make_rng,
+    measure,
+    random_name,
+    summarize,
+    temporary_database,
+)
+from core.models import Contact, PhoneDirectory, SpamData
+from core.serializers import PhoneSearchSerializer
+
+
+class LegacyPhoneSearchSerializer(PhoneSearchSerializer):
+    """Phone details serialization before alias serializers were cached"""
+
+    def getAliasSerializer(self, model_arg):
+        class AliasSerializer(serializers.ModelSerializer):
+            class Meta:
+                model = model_arg
+                fields = ("name",)
+
+        return AliasSerializer
+
+    def remove_nulls(self, result_list):
+        return [result for result in result_list if result.get("name") is not None]
+
+    def get_contact_count(self, obj):
+        return obj.aliases.count()
+
+    def get_spam_aliases(self, obj):
+        serializer = self.getAliasSerializer(SpamData)
+        result_list = serializer(obj.spam_reports, many=True).data
+        return self.remove_nulls(result_list)
+
+    def get_contact_aliases(self, obj):
+        serializer = self.getAliasSerializer(Contact)
+        result_list = serializer(obj.aliases, many=True).data
+        return self.remove_nulls(result_list)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares per request CPU time of the phone details serialization "
+        "before and after caching alias serializers"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--aliases", type=int, default=200)
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def populate(self, rng, aliases):
+        phone = PhoneDirectory.objects.create(phone="+918900000000")
+        AuthUser.objects.bulk_create(
+            AuthUser(
+                username=random_name(rng, words=1),
+                phone=f"+9189100{i:05d}",
+                email=None,
+            )
+            for i in range(aliases)
+        )
+        for i, user in enumerate(AuthUser.objects.all()):
+            name = random_name(rng) if i % 4 else None
+            Contact.objects.create(user=user, phone=phone, name=name)
+            SpamData.objects.create(target_phone=phone, reporter_phone=user, name=name)
+        return PhoneDirectory.objects.select_related("user").get(pk=phone.pk)
+
+    def handle(self, *args, aliases, repeat, seed, **options):
+        report = {"aliases": aliases}
+        with temporary_database():
+            phone = self.populate(make_rng(seed), aliases)
+            for label, serializer in (
+                ("legacy", LegacyPhoneSearchSerializer),
+                ("cached", PhoneSearchSerializer),
+            ):
+                with CaptureQueriesContext(connection) as queries:
+                    serializer(phone).data
+                report[label] = {
+                    "queries": len(queries),
+                    "cpu": summarize(
+                        measure(
+                            lambda: serializer(phone).data,
+                            repeat=repeat,
+                            clock=time.process_time,
+                        )
+                    ),
+                    "wall": summarize(
+                        measure(lambda: serializer(phone).data, repeat=repeat)
+                    ),
+                }
+        self.stdout.write(json.dumps(report, indent=4))
@@ -0,0 +1,143 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from user.models import AuthUser
+from user.serializers import AuthTokenObtainPairSerializer
+
+from core.benchmarks import (
+    make_rng,
+    percentiles,
+    populate_phonebook,
+    random_name,
+    temporary_database,
+    zipf_sampler,
+)
+from core.models import PhoneDirectory
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic phonebook in a throwaway database and drives "
+        "the search, phone directory, contact and spam endpoints through the "
+        "test client, reporting latency percentiles, queries per request "
+        "and throughput as JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--contacts-per-user", type=int, default=50)
+        parser.add_argument("--spam-per-user", type=int, default=2)
+        parser.add_argument("--zipf", type=float, default=1.1)
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per endpoint"
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="File to write the JSON report to")
+
+    def scenarios(self, rng, numbers):
+        """Request factories by scenario name, each returning
+        (method, path, data) for one request"""
+        lookup = zipf_sampler(rng, numbers)
+        return {
+            "search_name": lambda: (
+                "get",
+                "/api/search/",
+                {"name": random_name(rng, words=1)[: rng.randint(1, 5)]},
+            ),
+            "search_phone": lambda: ("get", "/api/search/", {"phone": lookup(1)[0]}),
+            "phone_directory": lambda: (
+                "get",
+                "/api/phone-directory/",
+                {"q": lookup(1)[0]},
+            ),
+            "contacts_list": lambda: ("get", "/api/contacts/", {"page_size": 100}),
+            "contacts_create": lambda: (
+                "post",
+                "/api/contacts/",
+                {"phone": lookup(1)[0], "name": random_name(rng)},
+            ),
+            "spam_list": lambda: ("get", "/api/spam/", {"page_size": 100}),
+            "spam_report": lambda: (
+                "post",
+                "/api/spam/",
+                {"target_phone": lookup(1)[0], "name": random_name(rng, words=1)},
+            ),
+        }
+
+    def run(self, client, tokens, rng, make_request, requests):
+        timings = []
+        queries = []
+        elapsed = 0.0
+        for _ in range(requests):
+            method, path, data = make_request()
+            headers = {"authorization": f"Bearer {rng.choice(tokens)}"}
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                if method == "get":
+                    response = client.get(path, data, headers=headers)
+                else:
+                    response = client.post(
+                        path, data, content_type="application/json", headers=headers
+                    )
+                duration = time.perf_counter() - start
+            if response.status_code >= 500:
+                raise RuntimeError(f"{method.upper()} {path} {response.status_code}")
+            elapsed += duration
+            timings.append(duration * 1000)
+            queries.append(len(captured))
+        return {
+            "requests": requests,
+            "requests_per_s": round(requests / elapsed, 1),
+            **percentiles(timings),
+            "queries_per_request": round(sum(queries) / requests, 2),
+            "max_queries": max(queries),
+        }
+
+    def handle(
+        self,
+        *args,
+        users,
+        contacts_per_user,
+        spam_per_user,
+        zipf,
+        requests,
+        seed,
+        output,
+        **options,
+    ):
+        rng = make_rng(seed)
+        with temporary_database(), override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]
+        ):
+            self.stderr.write(f"Generating {users} users")
+            dataset = populate_phonebook(
+                rng, users, contacts_per_user, spam_per_user, exponent=zipf
+            )
+            tokens = [
+                str(AuthTokenObtainPairSerializer.get_token(user).access_token)
+                for user in AuthUser.objects.order_by("pk")[:100]
+            ]
+            numbers = [
+                str(phone)
+                for phone in PhoneDirectory.objects.order_by(
+                    "-spam_count", "phone"
+                ).values_list("phone", flat=True)
+            ]
+            client = Client()
+            report = {
+                "dataset": dataset,
+                "endpoints": {
+                    name: self.run(client, tokens, rng, make_request, requests)
+                    for name, make_request in self.scenarios(rng, numbers).items()
+                },
+            }
+        content = json.dumps(report, indent=4)
+        if output:
+            with open(output, "w") as file:
+                file.write(content)
+        self.stdout.write(content)
@@ -0,0 +1,76 @@
+import json
+import time
+from bisect import bisect_left
+
+from django.core.management.base import BaseCommand
+
+from core.benchmarks import make_rng
+from core.blocklist import BloomFilter, pack_numbers, unpack_numbers
+
+
+def random_numbers(rng, count):
+    numbers = set()
+    while len(numbers) < count:
+        numbers.add(rng.randint(917000000000, 919999999999))
+    return numbers
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures build cost, size and false positive rate "
+        "of the spam blocklist encodings"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--numbers", type=int, default=10_000_000)
+        parser.add_argument("--probes", type=int, default=100_000)
+        parser.add_argument("--error-rate", type=float, default=0.01)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, numbers, probes, error_rate, seed, **options):
+        rng = make_rng(seed)
+        members = random_numbers(rng, numbers)
+        outsiders = [
+            number
+            for number in random_numbers(rng, probes * 2)
+            if number not in members
+        ][:probes]
+
+        start = time.perf_counter()
+        packed = pack_numbers(sorted(members))
+        packed_build = time.perf_counter() - start
+        sorted_numbers = unpack_numbers(packed)
+
+        start = time.perf_counter()
+        bloom = BloomFilter(numbers, error_rate)
+        for number in members:
+            bloom.add(number)
+        bloom_build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for number in outsiders:
+            index = bisect_left(sorted_numbers, number)
+            index < len(sorted_numbers) and sorted_numbers[index] == number
+        packed_lookup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        false_positives = sum(number in bloom for number in outsiders)
+        bloom_lookup = time.perf_counter() - start
+
+        report = {
+            "numbers": numbers,
+            "packed": {
+                "build_s": round(packed_build, 3),
+                "bytes": len(packed),
+                "lookup_us": round(packed_lookup / len(outsiders) * 1e6, 3),
+                "false_positive_rate": 0.0,
+            },
+            "bloom": {
+                "build_s": round(bloom_build, 3),
+                "bytes": len(bloom.bits),
+                "hashes": bloom.hashes,
+                "lookup_us": round(bloom_lookup / len(outsiders) * 1e6, 3),
+                "false_positive_rate": false_positives / len(outsiders),
+            },
+        }
+        self.stdout.write(json.dumps(report, indent=4))
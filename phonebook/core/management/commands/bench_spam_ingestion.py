@@ -0,0 +1,128 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.test.utils import CaptureQueriesContext
+from rest_framework.exceptions import ValidationError
+from user.models import AuthUser
+
+from core.benchmarks import make_rng, random_name, summarize, temporary_database
+from core.models import PhoneDirectory, QueuedSpamReport, SpamData, phone_key
+from core.serializers import SpamDataSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures a burst of spam reports against a few hot numbers, "
+        "recorded in the request or queued and drained in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reports", type=int, default=5000)
+        parser.add_argument("--reporters", type=int, default=2000)
+        parser.add_argument(
+            "--targets",
+            type=int,
+            default=20,
+            help="Number of distinct phone numbers being reported",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def burst(self, rng, prefix, reports, reporters, targets):
+        # A spam wave mostly reports the same few numbers, often repeatedly
+        return [
+            {
+                "target_phone": f"+91{prefix}{min(int(rng.paretovariate(1)) - 1, targets - 1):08d}",
+                "reporter_phone": rng.choice(reporters).pk,
+                "name": random_name(rng, words=1) if rng.random() < 0.5 else None,
+            }
+            for _ in range(reports)
+        ]
+
+    def record(self, burst):
+        """The spam endpoint before the queue, every report in its request"""
+        timings = []
+        for data in burst:
+            start = time.perf_counter()
+            serializer = SpamDataSerializer(data=data)
+            # Repeated reports are rejected, by validation or on insert
+            if serializer.is_valid():
+                try:
+                    serializer.save()
+                except ValidationError:
+                    pass
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def enqueue(self, burst, reporters):
+        timings = []
+        for data in burst:
+            start = time.perf_counter()
+            serializer = SpamDataSerializer(data=data)
+            if serializer.is_valid():
+                QueuedSpamReport.objects.create(
+                    target_phone=serializer.validated_data["target_phone"].as_e164,
+                    reporter=reporters[data["reporter_phone"]],
+                    name=serializer.validated_data.get("name") or None,
+                )
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def handle(self, *args, reports, reporters, targets, batch_size, seed, **options):
+        rng = make_rng(seed)
+        with temporary_database():
+            users = AuthUser.objects.bulk_create(
+                AuthUser(
+                    phone=f"+9188{i:08d}", username=f"user{i}", email=f"{i}@mail.com"
+                )
+                for i in range(reporters)
+            )
+            PhoneDirectory.objects.bulk_create(
+                PhoneDirectory(
+                    phone=user.phone, number=phone_key(user.phone), user=user
+                )
+                for user in users
+            )
+            by_pk = {user.pk: user for user in users}
+
+            synchronous = self.burst(rng, "87", reports, users, targets)
+            start = time.perf_counter()
+            timings = self.record(synchronous)
+            elapsed = time.perf_counter() - start
+            report = {
+                "reports": reports,
+                "targets": len({data["target_phone"] for data in synchronous}),
+                "synchronous": {
+                    "request": summarize(timings),
+                    "total_ms": round(elapsed * 1000, 3),
+                    "reports_per_s": round(reports / elapsed),
+                    "recorded": SpamData.objects.count(),
+                },
+            }
+
+            queued = self.burst(rng, "86", reports, users, targets)
+            start = time.perf_counter()
+            timings = self.enqueue(queued, by_pk)
+            enqueued = time.perf_counter() - start
+            recorded = 0
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                while True:
+                    batch, batch_recorded = QueuedSpamReport.objects.drain(batch_size)
+                    recorded += batch_recorded
+                    if batch < batch_size:
+                        break
+                drained = time.perf_counter() - start
+            report["queued"] = {
+                "request": summarize(timings),
+                "enqueue_ms": round(enqueued * 1000, 3),
+                "drain_ms": round(drained * 1000, 3),
+                "drain_queries": len(queries),
+                "reports_per_s": round(reports / (enqueued + drained)),
+                "drain_reports_per_s": round(reports / drained),
+                "recorded": recorded,
+            }
+        self.stdout.write(json.dumps(report, indent=4))
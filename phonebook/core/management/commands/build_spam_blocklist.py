@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import blocklist
+
+
+class Command(BaseCommand):
+    help = (
+        "Publishes a new spam blocklist version, optionally writing "
+        "its export to a file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threshold",
+            type=int,
+            default=settings.SPAM_BLOCKLIST_THRESHOLD,
+            help="Blocklist numbers with more spam reports than this",
+        )
+        parser.add_argument("--output", help="File to write the export to")
+        parser.add_argument(
+            "--since",
+            type=int,
+            default=0,
+            help="Export the changes since this version, 0 for all numbers",
+        )
+        parser.add_argument("--encoding", choices=("packed", "bloom"), default="packed")
+        parser.add_argument("--error-rate", type=float, default=0.01)
+
+    def handle(self, *args, threshold, output, since, encoding, error_rate, **options):
+        version = blocklist.build_blocklist(threshold)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Published blocklist version {version.pk} "
+                f"with {version.size} numbers"
+            )
+        )
+        if output:
+            if encoding == "bloom":
+                content = blocklist.export_bloom(version.pk, error_rate)
+            else:
+                content = blocklist.export_packed(version.pk, since)
+            with open(output, "wb") as file:
+                file.write(content)
+            self.stdout.write(f"Wrote {len(content)} bytes to {output}")
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from user.models import AuthUser
+
+from core.benchmarks import make_rng, populate_phonebook
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates synthetic users, contacts and spam reports in the configured "
+        "database, contacts and spam reports share Zipf distributed numbers"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--contacts-per-user", type=int, default=50)
+        parser.add_argument("--spam-per-user", type=int, default=2)
+        parser.add_argument(
+            "--numbers",
+            type=int,
+            help="Size of the shared number pool, a quarter of the contacts by default",
+        )
+        parser.add_argument(
+            "--zipf",
+            type=float,
+            default=1.1,
+            help="Exponent of the number popularity distribution",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(
+        self,
+        *args,
+        users,
+        contacts_per_user,
+        spam_per_user,
+        numbers,
+        zipf,
+        batch_size,
+        seed,
+        **options,
+    ):
+        if AuthUser.objects.filter(phone="+918800000000").exists():
+            raise CommandError("The database already holds generated users")
+        counts = populate_phonebook(
+            make_rng(seed),
+            users,
+            contacts_per_user,
+            spam_per_user,
+            numbers=numbers,
+            exponent=zipf,
+            batch_size=batch_size,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                ", ".join(f"{count} {name}" for name, count in counts.items())
+                + " generated"
+            )
+        )
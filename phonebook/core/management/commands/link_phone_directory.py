@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.directory import backfill_links
+
+
+class Command(BaseCommand):
+    help = (
+        "Links the registered users to the phone directory instances "
+        "of their numbers, creating the missing ones"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=900,
+            help="Number of users linked per upsert",
+        )
+
+    def handle(self, *args, batch_size, **options):
+        with transaction.atomic():
+            unlinked, linked = backfill_links(batch_size)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Unlinked {unlinked} phone directory instances, linked {linked} users"
+            )
+        )
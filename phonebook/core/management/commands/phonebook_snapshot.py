@@ -0,0 +1,57 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from user.models import AuthUser
+
+from core.models import PhoneDirectory
+from core.sharding import is_sharded
+from core.snapshots import export_snapshot, import_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the users, phone directory, contacts and spam reports to a "
+        "dumpdata compatible JSON snapshot, or bulk imports one into a database "
+        "without phonebook data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=("import", "export"))
+        parser.add_argument("path", help='Snapshot file, "-" for stdin or stdout')
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, action, path, batch_size, **options):
+        if is_sharded():
+            raise CommandError(
+                "Snapshots of a sharded phone directory are not supported"
+            )
+        start = time.perf_counter()
+        if action == "export":
+            if path == "-":
+                counts = export_snapshot(self.stdout, batch_size)
+            else:
+                with open(path, "w") as file:
+                    counts = export_snapshot(file, batch_size)
+            skipped = {}
+        else:
+            if AuthUser.objects.exists() or PhoneDirectory.objects.exists():
+                raise CommandError(
+                    "Snapshots are imported into a database without phonebook data"
+                )
+            if path == "-":
+                counts, skipped = import_snapshot(sys.stdin, batch_size)
+            else:
+                with open(path) as file:
+                    counts, skipped = import_snapshot(file, batch_size)
+
+        summary = ", ".join(f"{count} {label}" for label, count in counts.items())
+        # Keep an exported snapshot on stdout clean
+        out = self.stderr if path == "-" and action == "export" else self.stdout
+        out.write(
+            self.style.SUCCESS(
+                f"{action.title()}ed {summary} in {time.perf_counter() - start:.2f}s"
+            )
+        )
+        for label, count in skipped.items():
+            out.write(f"Skipped {count} {label} objects")
@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.models import QueuedSpamReport
+
+
+class Command(BaseCommand):
+    help = (
+        "Records the queued spam reports as spam data in batches, "
+        "once or continuously with --watch"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Keep polling the queue instead of exiting once it is empty",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait between polls of an empty queue",
+        )
+
+    def handle(self, *args, batch_size, watch, interval, **options):
+        dequeued = recorded = 0
+        while True:
+            batch, batch_recorded = QueuedSpamReport.objects.drain(batch_size)
+            dequeued += batch
+            recorded += batch_recorded
+            if batch < batch_size:
+                if not watch:
+                    break
+                if dequeued:
+                    self.report(dequeued, recorded)
+                    dequeued = recorded = 0
+                time.sleep(interval)
+        self.report(dequeued, recorded)
+
+    def report(self, dequeued, recorded):
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Recorded {recorded} of {dequeued} queued spam reports, "
+                f"{dequeued - recorded} duplicates dropped"
+            )
+        )
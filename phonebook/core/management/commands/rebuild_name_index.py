@@ -0,0 +1,85 @@
+import itertools
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from user.models import AuthUser
+
+from core.models import Contact, NameIndexEntry, PhoneDirectory, SpamData
+from core.sharding import is_sharded, shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Backfills the name search index from users, contacts and spam reports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Number of names indexed per bulk insert",
+        )
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Drop the whole index before rebuilding it",
+        )
+
+    def registered_names(self, shard, batch_size):
+        """(user id, phone, username) rows of the users linked on a shard"""
+        if not is_sharded():
+            yield from (
+                AuthUser.objects.filter(phone_dir__isnull=False)
+                .values_list("pk", "phone_dir__phone", "username")
+                .order_by("pk")
+                .iterator(chunk_size=batch_size)
+            )
+            return
+        # The users are on another database than the directory
+        linked = (
+            PhoneDirectory.objects.using(shard)
+            .filter(user__isnull=False)
+            .values_list("user", "phone")
+            .order_by("pk")
+            .iterator(chunk_size=batch_size)
+        )
+        while batch := list(itertools.islice(linked, batch_size)):
+            usernames = dict(
+                AuthUser.objects.filter(pk__in=[user for user, _ in batch]).values_list(
+                    "pk", "username"
+                )
+            )
+            for user, phone in batch:
+                yield user, phone, usernames.get(user)
+
+    def handle(self, *args, batch_size, clear, **options):
+        for shard in shard_aliases():
+            sources = (
+                (
+                    NameIndexEntry.REGISTERED,
+                    self.registered_names(shard, batch_size),
+                ),
+                (
+                    NameIndexEntry.UNREGISTERED,
+                    Contact.objects.using(shard)
+                    .exclude(name=None)
+                    .values_list("pk", "phone", "name")
+                    .order_by("pk")
+                    .iterator(chunk_size=batch_size),
+                ),
+                (
+                    NameIndexEntry.REPORTED_SPAM,
+                    SpamData.objects.using(shard)
+                    .exclude(name=None)
+                    .values_list("pk", "target_phone", "name")
+                    .order_by("pk")
+                    .iterator(chunk_size=batch_size),
+                ),
+            )
+            entries = NameIndexEntry.objects.db_manager(shard)
+            with transaction.atomic(using=shard):
+                if clear:
+                    entries.all().delete()
+                for kind, rows in sources:
+                    count = entries.bulk_index(kind, rows, batch_size=batch_size)
+                    self.stdout.write(f"Indexed {count} {kind} names on {shard}")
+        self.stdout.write(self.style.SUCCESS("Name index rebuilt"))
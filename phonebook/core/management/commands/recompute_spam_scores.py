@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.models import PhoneDirectory
+from core.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Recomputes the spam counts of the phone directory from the spam reports"
+
+    def handle(self, *args, **options):
+        repaired = sum(
+            PhoneDirectory.objects.using(shard).recompute_spam_counts()
+            for shard in shard_aliases()
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Repaired spam counts of {repaired} phone numbers")
+        )
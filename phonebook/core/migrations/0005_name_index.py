@@ -0,0 +1,120 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:12
+
+import itertools
+
+import django.db.models.deletion
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+
+BATCH_SIZE = 2000
+
+
+def normalize_name(name):
+    return " ".join(str(name).casefold().split())
+
+
+def name_trigrams(normalized):
+    normalized = normalized + "  "
+    return {normalized[i : i + 3] for i in range(len(normalized) - 2)}
+
+
+def index_names(apps, schema_editor):
+    """Indexes the names of the linked users, contacts and spam reports,
+    as the rebuild_name_index command does"""
+    db = schema_editor.connection.alias
+    if db != DEFAULT_DB_ALIAS:
+        # Shards came later, every name is on the default database
+        return
+    PhoneDirectory = apps.get_model("core", "PhoneDirectory")
+    Contact = apps.get_model("core", "Contact")
+    SpamData = apps.get_model("core", "SpamData")
+    NameIndexEntry = apps.get_model("core", "NameIndexEntry")
+    NameTrigram = apps.get_model("core", "NameTrigram")
+    sources = (
+        (
+            "registered",
+            PhoneDirectory.objects.using(db)
+            .filter(user__isnull=False)
+            .values_list("user", "phone", "user__username"),
+        ),
+        (
+            "unregistered",
+            Contact.objects.using(db)
+            .exclude(name=None)
+            .values_list("pk", "phone", "name"),
+        ),
+        (
+            "reported spam",
+            SpamData.objects.using(db)
+            .exclude(name=None)
+            .values_list("pk", "target_phone", "name"),
+        ),
+    )
+    for kind, rows in sources:
+        rows = rows.order_by("pk").iterator(chunk_size=BATCH_SIZE)
+        while batch := list(itertools.islice(rows, BATCH_SIZE)):
+            entries = NameIndexEntry.objects.using(db).bulk_create(
+                NameIndexEntry(
+                    kind=kind,
+                    object_id=object_id,
+                    phone_id=phone,
+                    name=name,
+                    normalized=normalize_name(name),
+                )
+                for object_id, phone, name in batch
+                if name and normalize_name(name)
+            )
+            if entries and entries[0].pk is None:
+                # Backends that do not return primary keys from bulk inserts
+                entries = NameIndexEntry.objects.using(db).filter(
+                    kind=kind, object_id__in=[row[0] for row in batch]
+                )
+            NameTrigram.objects.using(db).bulk_create(
+                (
+                    NameTrigram(entry=entry, trigram=trigram)
+                    for entry in entries
+                    for trigram in name_trigrams(entry.normalized)
+                ),
+                batch_size=10000,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_auto_20230312_0925'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NameIndexEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('registered', 'Registered'), ('unregistered', 'Unregistered'), ('reported spam', 'Reported spam')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('name', models.CharField(max_length=150)),
+                ('normalized', models.CharField(db_index=True, max_length=150)),
+                ('phone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_entries', to='core.phonedirectory')),
+            ],
+            options={
+                'verbose_name': 'name index entry',
+                'verbose_name_plural': 'name index',
+            },
+        ),
+        migrations.CreateModel(
+            name='NameTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('entry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='core.nameindexentry')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='nameindexentry',
+            constraint=models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_name_entry'),
+        ),
+        migrations.AddIndex(
+            model_name='nametrigram',
+            index=models.Index(fields=['trigram', 'entry'], name='name_trigram_idx'),
+        ),
+        migrations.RunPython(index_names, migrations.RunPython.noop),
+    ]
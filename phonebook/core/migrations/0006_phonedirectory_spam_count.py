@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_spam_reports(apps, schema_editor):
+    PhoneDirectory = apps.get_model('core', 'PhoneDirectory')
+    SpamData = apps.get_model('core', 'SpamData')
+    spam_count = (
+        SpamData.objects.filter(target_phone=OuterRef('pk'))
+        .order_by()
+        .values('target_phone')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    PhoneDirectory.objects.update(spam_count=Coalesce(Subquery(spam_count), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='phonedirectory',
+            name='spam_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_spam_reports, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_phonedirectory_spam_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpamBlocklistVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('threshold', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'spam blocklist version',
+                'verbose_name_plural': 'spam blocklist versions',
+            },
+        ),
+        migrations.CreateModel(
+            name='SpamBlocklistEntry',
+            fields=[
+                ('number', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('added_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='added', to='core.spamblocklistversion')),
+                ('removed_version', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='removed', to='core.spamblocklistversion')),
+            ],
+            options={
+                'verbose_name': 'spam blocklist entry',
+                'verbose_name_plural': 'spam blocklist',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+from django.db import migrations, models
+from django.db.models import BigIntegerField
+from django.db.models.functions import Cast, Substr
+
+
+def set_phone_keys(apps, schema_editor):
+    PhoneDirectory = apps.get_model("core", "PhoneDirectory")
+    # Phones are stored in E.164, the key is the digits after the plus sign
+    PhoneDirectory.objects.update(number=Cast(Substr("phone", 2), BigIntegerField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_spam_blocklist"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="phonedirectory",
+            name="number",
+            field=models.BigIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_phone_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="phonedirectory",
+            name="number",
+            field=models.BigIntegerField(editable=False, unique=True),
+        ),
+    ]
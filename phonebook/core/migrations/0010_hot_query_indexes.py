@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_spam_report_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['phone', 'name'], name='contact_phone_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='phonedirectory',
+            index=models.Index(condition=models.Q(('spam_count__gt', 0)), fields=['spam_count', 'number'], name='phonedirectory_spam_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='spamblocklistentry',
+            index=models.Index(fields=['removed_version', 'added_version', 'number'], name='blocklist_delta_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='spamdata',
+            index=models.Index(fields=['target_phone', 'name'], name='spam_target_name_idx'),
+        ),
+    ]
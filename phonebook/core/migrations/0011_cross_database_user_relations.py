@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_hot_query_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contact',
+            name='user',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='contacts', related_query_name='contact', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='phonedirectory',
+            name='user',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='phone_dir', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='spamdata',
+            name='reporter_phone',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='spams_reported', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,14 +1,94 @@
-from django.db import models
-from django.db.models.signals import post_save
+import itertools
+from collections import Counter
+
+from django.db import models, router, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from phonenumber_field.modelfields import PhoneNumberField
 
-from django.db.models import Q
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.db.models.constraints import UniqueConstraint
 from user.models import AuthUser
 
+from .cache import phone_details_cache
+from .contact_graph import (
+    ContactGraph,
+    add_contact_keys,
+    contact_graph_cache,
+    forget_contact_graph,
+    graph_key,
+)
+from .sharding import (
+    ShardedQuerySet,
+    group_by_shard,
+    is_sharded,
+    shard_aliases,
+    shard_for,
+)
+
+
+def phone_key(phone):
+    """Compact integer key of a phone number, its E.164 digits
+    (country code followed by the national number)"""
+    if not isinstance(phone, str):
+        phone = phone.as_e164
+    return int(phone.lstrip("+"))
+
+
 # Create your models here.
+class PhoneDirectoryQuerySet(ShardedQuerySet):
+    def on_shard_of(self, phone):
+        """This queryset on the shard of a phone number,
+        unless a database was chosen"""
+        return self if self._db else self.using(shard_for(phone))
+
+    def get_by_phone(self, phone):
+        """Fetches the directory instance of a phone number
+        through the integer phone key"""
+        return self.on_shard_of(phone).get(number=phone_key(phone))
+
+    async def aget_by_phone(self, phone):
+        return await self.on_shard_of(phone).aget(number=phone_key(phone))
+
+    async def aget_by_phone_with_user(self, phone):
+        """Fetches the directory instance of a phone number with its user,
+        joined when the shard is the database of the users"""
+        queryset = self.on_shard_of(phone)
+        if queryset.db == router.db_for_read(AuthUser):
+            return await queryset.select_related("user").aget_by_phone(phone)
+        instance = await queryset.aget_by_phone(phone)
+        if instance.user_id is not None:
+            instance.user = await AuthUser.objects.aget(pk=instance.user_id)
+        return instance
+
+    def get_or_create_by_phone(self, phone):
+        return self.on_shard_of(phone).get_or_create(
+            number=phone_key(phone), defaults={"phone": phone}
+        )
+
+    def recompute_spam_counts(self):
+        """Repairs spam counts that drifted from the spam reports,
+        returns the number of repaired directory instances"""
+        spam_count = Coalesce(
+            Subquery(
+                SpamData.objects.filter(target_phone=OuterRef("pk"))
+                .order_by()
+                .values("target_phone")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        )
+        drifted = (
+            self.annotate(actual=spam_count)
+            .exclude(spam_count=F("actual"))
+            .values("pk")
+        )
+        return self.filter(pk__in=drifted).update(spam_count=spam_count)
+
+
 class PhoneDirectory(models.Model):
     """Global Phone Directory.
     This model instances never should be deleted by normal means.
@@ -16,7 +96,11 @@ class PhoneDirectory(models.Model):
     Fields
     -------
     phone: primary key, required, unique
-    user: One to One relation to authuser, optional
+    number: integer key of the phone, set on save, required, unique
+    user: One to One relation to authuser, optional, linked by
+        core.directory where users are created
+    spam_count: number of spam reports against the phone, maintained
+        by signals, use the recompute_spam_scores command to repair drift
     """
 
     phone = PhoneNumberField(
@@ -26,13 +110,19 @@ class PhoneDirectory(models.Model):
             "unique": _("Phone number already exists in directory"),
         },
     )
+    number = models.BigIntegerField(unique=True, editable=False)
     user = models.OneToOneField(
         AuthUser,
         related_name="phone_dir",
         null=True,
         blank=True,
         on_delete=models.SET_NULL,
+        # Users stay on the default database when the directory is sharded
+        db_constraint=False,
     )
+    spam_count = models.PositiveIntegerField(default=0)
+
+    objects = PhoneDirectoryQuerySet.as_manager()
 
     def __str__(self) -> str:
         return "".join(
@@ -42,6 +132,118 @@ class PhoneDirectory(models.Model):
     class Meta:
         verbose_name = "Phone instance"
         verbose_name_plural = "Phone directory"
+        indexes = [
+            # Spam reported numbers only, queries add the spam_count > 0 term
+            # so that SQLite can match the partial index
+            models.Index(
+                fields=["spam_count", "number"],
+                condition=Q(spam_count__gt=0),
+                name="phonedirectory_spam_idx",
+            ),
+        ]
+
+
+class ContactManager(models.Manager.from_queryset(ShardedQuerySet)):
+    def bulk_import(self, user, contacts, batch_size=900):
+        """Imports (phone, name) pairs as contacts of user in bulk.
+        Missing directory instances are created with a single insert and
+        contacts that already exist are skipped, returns for every pair
+        whether it was created."""
+        if self._db is None and is_sharded():
+            created = [None] * len(contacts)
+            for shard, group in group_by_shard(contacts, lambda c: c[0]).items():
+                shard_created = self.db_manager(shard).bulk_import(
+                    user, [contact for _, contact in group], batch_size
+                )
+                for (position, _), is_created in zip(group, shard_created):
+                    created[position] = is_created
+            return created
+
+        phones = sorted({str(phone) for phone, _ in contacts})
+        chunks = [phones[i : i + batch_size] for i in range(0, len(phones), batch_size)]
+        with transaction.atomic(using=self.db):
+            PhoneDirectory.objects.using(self.db).bulk_create(
+                (
+                    PhoneDirectory(phone=phone, number=phone_key(phone))
+                    for phone in phones
+                ),
+                ignore_conflicts=True,
+            )
+            seen = set()
+            for chunk in chunks:
+                seen.update(
+                    (str(phone), name)
+                    for phone, name in self.filter(
+                        user=user, phone__in=chunk
+                    ).values_list("phone", "name")
+                )
+            created = []
+            new_contacts = []
+            for phone, name in contacts:
+                key = (str(phone), name)
+                created.append(key not in seen)
+                if key not in seen:
+                    seen.add(key)
+                    new_contacts.append(Contact(user=user, phone_id=key[0], name=name))
+            self.bulk_create(new_contacts, batch_size=batch_size, ignore_conflicts=True)
+            invalidate_phone_details(
+                *{contact.phone_id for contact in new_contacts}, using=self.db
+            )
+            new_keys = [phone_key(contact.phone_id) for contact in new_contacts]
+            transaction.on_commit(
+                lambda: add_contact_keys(user.pk, new_keys), using=self.db
+            )
+
+            # bulk_create skips the post_save signals that index names
+            new_names = {
+                (contact.phone_id, contact.name)
+                for contact in new_contacts
+                if contact.name
+            }
+            for chunk in chunks:
+                NameIndexEntry.objects.db_manager(self.db).bulk_index(
+                    NameIndexEntry.UNREGISTERED,
+                    (
+                        (pk, phone, name)
+                        for pk, phone, name in self.filter(user=user, phone__in=chunk)
+                        .exclude(name=None)
+                        .values_list("pk", "phone", "name")
+                        if (str(phone), name) in new_names
+                    ),
+                    batch_size=batch_size,
+                )
+        return created
+
+    def contact_graph_queries(self, user_id):
+        shards = [self._db] if self._db else shard_aliases()
+        return [
+            self.db_manager(shard)
+            .filter(user_id=user_id)
+            .values_list("phone__number", flat=True)
+            for shard in shards
+        ]
+
+    def contact_graph(self, user_id):
+        """The contact graph of a user, loaded into the cache on first use"""
+        cache = contact_graph_cache()
+        graph = cache.get(graph_key(user_id))
+        if graph is None:
+            graph = ContactGraph(
+                itertools.chain.from_iterable(self.contact_graph_queries(user_id))
+            )
+            cache.set(graph_key(user_id), graph)
+        return graph
+
+    async def acontact_graph(self, user_id):
+        cache = contact_graph_cache()
+        graph = cache.get(graph_key(user_id))
+        if graph is None:
+            keys = []
+            for queryset in self.contact_graph_queries(user_id):
+                keys.extend([key async for key in queryset])
+            graph = ContactGraph(keys)
+            cache.set(graph_key(user_id), graph)
+        return graph
 
 
 class Contact(models.Model):
@@ -60,15 +262,22 @@ class Contact(models.Model):
         related_name="contacts",
         related_query_name="contact",
         on_delete=models.SET_NULL,
+        db_constraint=False,
     )
     phone = models.ForeignKey(
         PhoneDirectory, related_name="aliases", on_delete=models.CASCADE
     )
     name = models.CharField(max_length=128, null=True, blank=True)
 
+    objects = ContactManager()
+
     class Meta:
         verbose_name = "contact"
         verbose_name_plural = "contacts"
+        indexes = [
+            # Covers the alias names of a phone, grouped by name
+            models.Index(fields=["phone", "name"], name="contact_phone_name_idx"),
+        ]
         constraints = [
             UniqueConstraint(
                 fields=["user", "phone", "name"], name="unique_with_optional"
@@ -84,6 +293,98 @@ class Contact(models.Model):
         return f"{self.user.phone} -> {self.phone}({self.name})"
 
 
+class SpamDataManager(models.Manager.from_queryset(ShardedQuerySet)):
+    def bulk_report(self, reports, batch_size=900):
+        """Records (target phone, reporter id, name) spam reports in bulk.
+        Reports already recorded, or repeated within reports, are skipped
+        the way the spam_unique constraints would reject them.
+        Spam counts are incremented once per target phone,
+        returns the number of recorded reports."""
+        reports = [
+            (str(phone), reporter, name or None) for phone, reporter, name in reports
+        ]
+        if self._db is None and is_sharded():
+            return sum(
+                self.db_manager(shard).bulk_report(
+                    [report for _, report in group], batch_size
+                )
+                for shard, group in group_by_shard(reports, lambda r: r[0]).items()
+            )
+
+        phones = sorted({phone for phone, _, _ in reports})
+        reporters = sorted({reporter for _, reporter, _ in reports})
+        with transaction.atomic(using=self.db):
+            PhoneDirectory.objects.using(self.db).bulk_create(
+                (
+                    PhoneDirectory(phone=phone, number=phone_key(phone))
+                    for phone in phones
+                ),
+                ignore_conflicts=True,
+            )
+            seen = set()
+            for i in range(0, len(phones), batch_size):
+                for j in range(0, len(reporters), batch_size):
+                    seen.update(
+                        (str(phone), reporter, name)
+                        for phone, reporter, name in self.filter(
+                            target_phone__in=phones[i : i + batch_size],
+                            reporter_phone__in=reporters[j : j + batch_size],
+                        ).values_list("target_phone", "reporter_phone", "name")
+                    )
+            new_reports = []
+            for key in reports:
+                if key not in seen:
+                    seen.add(key)
+                    new_reports.append(
+                        SpamData(
+                            target_phone_id=key[0],
+                            reporter_phone_id=key[1],
+                            name=key[2],
+                        )
+                    )
+            new_reports = self.bulk_create(new_reports, batch_size=batch_size)
+
+            # bulk_create skips the post_save signals that count and index reports
+            counts = Counter(report.target_phone_id for report in new_reports)
+            by_count = {}
+            for phone, count in counts.items():
+                by_count.setdefault(count, []).append(phone)
+            for count, targets in by_count.items():
+                for i in range(0, len(targets), batch_size):
+                    PhoneDirectory.objects.using(self.db).filter(
+                        pk__in=targets[i : i + batch_size]
+                    ).update(spam_count=F("spam_count") + count)
+            if new_reports and new_reports[0].pk is None:
+                # Backends that do not return primary keys from bulk inserts
+                new_keys = {
+                    (report.target_phone_id, report.reporter_phone_id, report.name)
+                    for report in new_reports
+                }
+                new_reports = [
+                    report
+                    for report in self.filter(
+                        target_phone__in=list(counts), reporter_phone__in=reporters
+                    )
+                    if (
+                        str(report.target_phone_id),
+                        report.reporter_phone_id,
+                        report.name,
+                    )
+                    in new_keys
+                ]
+            NameIndexEntry.objects.db_manager(self.db).bulk_index(
+                NameIndexEntry.REPORTED_SPAM,
+                (
+                    (report.pk, report.target_phone_id, report.name)
+                    for report in new_reports
+                    if report.name
+                ),
+                batch_size=batch_size,
+            )
+            invalidate_phone_details(*counts, using=self.db)
+        return len(new_reports)
+
+
 class SpamData(models.Model):
     """Model for Spam data.
 
@@ -100,13 +401,22 @@ class SpamData(models.Model):
         on_delete=models.CASCADE,
     )
     reporter_phone = models.ForeignKey(
-        AuthUser, related_name="spams_reported", on_delete=models.SET_NULL, null=True
+        AuthUser,
+        related_name="spams_reported",
+        on_delete=models.SET_NULL,
+        null=True,
+        db_constraint=False,
     )
     name = models.CharField(max_length=128, null=True, blank=True)
 
+    objects = SpamDataManager()
+
     class Meta:
         verbose_name = "spam"
         verbose_name_plural = "spam items"
+        indexes = [
+            models.Index(fields=["target_phone", "name"], name="spam_target_name_idx"),
+        ]
         constraints = [
             UniqueConstraint(
                 fields=["target_phone", "reporter_phone", "name"],
@@ -123,11 +433,407 @@ class SpamData(models.Model):
         return f"spam:{self.target_phone}({self.name})"
 
 
+def normalize_name(name):
+    """Case folds a name and collapses its whitespace, the form in which
+    names are stored and searched in the name index"""
+    return " ".join(str(name).casefold().split())
+
+
+def name_trigrams(normalized, padded=True):
+    """Trigrams of a normalized name.
+    Padded trigrams are taken at every position of the name, so that
+    every substring of up to three characters is the prefix of one of them."""
+    if padded:
+        normalized = normalized + "  "
+    return {normalized[i : i + 3] for i in range(len(normalized) - 2)}
+
+
+class NameIndexEntryManager(models.Manager):
+    def index(self, kind, object_id, phone, name):
+        """Creates, updates or drops the index entry of a named object"""
+        if not name or not normalize_name(name):
+            self.unindex(kind, object_id)
+            return None
+        normalized = normalize_name(name)
+        entry, created = self.get_or_create(
+            kind=kind,
+            object_id=object_id,
+            defaults={"phone_id": phone, "name": name, "normalized": normalized},
+        )
+        if not created:
+            if entry.normalized == normalized and entry.phone_id == phone:
+                if entry.name != name:
+                    entry.name = name
+                    entry.save(update_fields=["name"])
+                return entry
+            entry.phone_id = phone
+            entry.name = name
+            entry.normalized = normalized
+            entry.save()
+            entry.trigrams.all().delete()
+        NameTrigram.objects.using(self.db).bulk_create(
+            NameTrigram(entry=entry, trigram=trigram)
+            for trigram in name_trigrams(normalized)
+        )
+        return entry
+
+    def unindex(self, kind, object_id):
+        self.filter(kind=kind, object_id=object_id).delete()
+
+    def bulk_index(self, kind, rows, batch_size=2000):
+        """Indexes an iterable of (object_id, phone, name) rows
+        with bulk inserts, existing entries of the same objects are replaced"""
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                count += self._bulk_index_batch(kind, batch)
+                batch = []
+        if batch:
+            count += self._bulk_index_batch(kind, batch)
+        return count
+
+    def _bulk_index_batch(self, kind, rows):
+        rows = [
+            (object_id, phone, name)
+            for object_id, phone, name in rows
+            if name and normalize_name(name)
+        ]
+        self.filter(kind=kind, object_id__in=[row[0] for row in rows]).delete()
+        entries = self.bulk_create(
+            NameIndexEntry(
+                kind=kind,
+                object_id=object_id,
+                phone_id=phone,
+                name=name,
+                normalized=normalize_name(name),
+            )
+            for object_id, phone, name in rows
+        )
+        if entries and entries[0].pk is None:
+            # Backends that do not return primary keys from bulk inserts
+            entries = self.filter(kind=kind, object_id__in=[row[0] for row in rows])
+        NameTrigram.objects.using(self.db).bulk_create(
+            (
+                NameTrigram(entry=entry, trigram=trigram)
+                for entry in entries
+                for trigram in name_trigrams(entry.normalized)
+            ),
+            batch_size=10000,
+        )
+        return len(rows)
+
+
+class NameIndexEntry(models.Model):
+    """Normalized names of users, contacts and spam reports, used for name search.
+    Entries are maintained by signals, use the rebuild_name_index
+    command after bulk writes.
+
+    Fields
+    -------
+    kind: type of the indexed object, required
+    object_id: primary key of the indexed object, required
+    phone: Phone directory instance the name belongs to, required
+    name: name as given, required
+    normalized: case folded name, required
+    """
+
+    REGISTERED = "registered"
+    UNREGISTERED = "unregistered"
+    REPORTED_SPAM = "reported spam"
+    KIND_CHOICES = (
+        (REGISTERED, "Registered"),
+        (UNREGISTERED, "Unregistered"),
+        (REPORTED_SPAM, "Reported spam"),
+    )
+
+    kind = models.CharField(choices=KIND_CHOICES, max_length=16)
+    object_id = models.BigIntegerField()
+    phone = models.ForeignKey(
+        PhoneDirectory, related_name="name_entries", on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=150)
+    normalized = models.CharField(max_length=150, db_index=True)
+
+    objects = NameIndexEntryManager()
+
+    class Meta:
+        verbose_name = "name index entry"
+        verbose_name_plural = "name index"
+        constraints = [
+            UniqueConstraint(fields=["kind", "object_id"], name="unique_name_entry"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.phone_id}({self.name})"
+
+
+class NameTrigram(models.Model):
+    """Inverted index from name trigrams to name index entries"""
+
+    entry = models.ForeignKey(
+        NameIndexEntry, related_name="trigrams", on_delete=models.CASCADE
+    )
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["trigram", "entry"], name="name_trigram_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.trigram} -> {self.entry_id}"
+
+
+class SpamBlocklistVersion(models.Model):
+    """Published version of the spam blocklist.
+
+    Fields
+    -------
+    threshold: numbers with more spam reports than this are blocklisted, required
+    size: number of blocklisted numbers in this version, required
+    created_at: publish time, auto
+    """
+
+    threshold = models.PositiveIntegerField()
+    size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "spam blocklist version"
+        verbose_name_plural = "spam blocklist versions"
+
+    def __str__(self) -> str:
+        return f"v{self.pk}({self.size} numbers)"
+
+
+class SpamBlocklistEntry(models.Model):
+    """A phone number in the spam blocklist, as its E.164 digits.
+    Removed entries are kept so that deltas between versions can be served.
+
+    Fields
+    -------
+    number: E.164 number without the plus sign, primary key
+    added_version: version that last added the number, required
+    removed_version: version that removed the number, optional
+    """
+
+    number = models.BigIntegerField(primary_key=True)
+    added_version = models.ForeignKey(
+        SpamBlocklistVersion, related_name="added", on_delete=models.CASCADE
+    )
+    removed_version = models.ForeignKey(
+        SpamBlocklistVersion,
+        related_name="removed",
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+    )
+
+    class Meta:
+        verbose_name = "spam blocklist entry"
+        verbose_name_plural = "spam blocklist"
+        indexes = [
+            # Covers both sides of a delta, active entries (removed_version
+            # is null) added after a version and entries removed after it
+            models.Index(
+                fields=["removed_version", "added_version", "number"],
+                name="blocklist_delta_idx",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"+{self.number}"
+
+
+class QueuedSpamReportManager(models.Manager):
+    def drain(self, batch_size=1000):
+        """Records the oldest batch_size queued reports as spam data
+        and removes them from the queue, returns the number of dequeued
+        reports and the number of them that were recorded"""
+        with transaction.atomic():
+            batch = list(
+                self.select_for_update(skip_locked=True)
+                .order_by("pk")
+                .values_list("pk", "target_phone", "reporter_id", "name")[:batch_size]
+            )
+            if not batch:
+                return 0, 0
+            recorded = SpamData.objects.bulk_report(
+                (phone, reporter, name) for _, phone, reporter, name in batch
+            )
+            self.filter(pk__in=[row[0] for row in batch]).delete()
+        return len(batch), recorded
+
+
+class QueuedSpamReport(models.Model):
+    """Spam report waiting to be recorded as spam data.
+    Reports are queued by the spam endpoint and recorded in batches
+    by the process_spam_queue command.
+
+    Fields
+    -------
+    target_phone: E.164 phone number of potential spammer, required
+    reporter: Authuser instance of the user that reported, required
+    name: Potential spammer name, optional
+    queued_at: time the report was received, auto
+    """
+
+    target_phone = models.CharField(max_length=32)
+    reporter = models.ForeignKey(
+        AuthUser, related_name="queued_spam_reports", on_delete=models.CASCADE
+    )
+    name = models.CharField(max_length=128, null=True, blank=True)
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    objects = QueuedSpamReportManager()
+
+    class Meta:
+        verbose_name = "queued spam report"
+        verbose_name_plural = "spam report queue"
+
+    def __str__(self) -> str:
+        return f"queued spam:{self.target_phone}({self.name})"
+
+
+@receiver(pre_save, sender=PhoneDirectory)
+def set_phone_key(sender, instance, **kwargs):
+    instance.number = phone_key(instance.phone)
+
+
 @receiver(post_save, sender=AuthUser)
-def create_phone_directory(sender, instance, created, **kwargs):
-    """Polpulates the phone directory's one to one user
-    on every new user registration"""
+def index_user_name(sender, instance, created, **kwargs):
+    """Reindexes renamed users, the names of new users are indexed
+    once core.directory links them to their directory instance"""
     if created:
-        phone_instance, _ = PhoneDirectory.objects.get_or_create(phone=instance.phone)
-        phone_instance.user = instance
-        phone_instance.save()
+        return
+    entries = NameIndexEntry.objects.db_manager(shard_for(instance.phone))
+    if entries.filter(kind=NameIndexEntry.REGISTERED, object_id=instance.pk).exists():
+        entries.index(
+            NameIndexEntry.REGISTERED, instance.pk, instance.phone, instance.username
+        )
+
+
+@receiver(post_save, sender=Contact)
+def index_contact_name(sender, instance, using, **kwargs):
+    NameIndexEntry.objects.db_manager(using).index(
+        NameIndexEntry.UNREGISTERED, instance.pk, instance.phone_id, instance.name
+    )
+
+
+@receiver(post_save, sender=SpamData)
+def index_spam_name(sender, instance, using, **kwargs):
+    NameIndexEntry.objects.db_manager(using).index(
+        NameIndexEntry.REPORTED_SPAM,
+        instance.pk,
+        instance.target_phone_id,
+        instance.name,
+    )
+
+
+@receiver(post_delete, sender=AuthUser)
+def unindex_user_name(sender, instance, **kwargs):
+    NameIndexEntry.objects.db_manager(shard_for(instance.phone)).unindex(
+        NameIndexEntry.REGISTERED, instance.pk
+    )
+
+
+@receiver(post_delete, sender=AuthUser)
+def release_user_rows(sender, instance, using, **kwargs):
+    """Sets the user of the rows of a deleted user to null on the other
+    shards, deletions only update the rows of their own database"""
+    for shard in shard_aliases():
+        if shard == using:
+            continue
+        PhoneDirectory.objects.using(shard).filter(user=instance.pk).update(user=None)
+        Contact.objects.using(shard).filter(user=instance.pk).update(user=None)
+        SpamData.objects.using(shard).filter(reporter_phone=instance.pk).update(
+            reporter_phone=None
+        )
+
+
+@receiver(post_delete, sender=Contact)
+def unindex_contact_name(sender, instance, using, **kwargs):
+    NameIndexEntry.objects.db_manager(using).unindex(
+        NameIndexEntry.UNREGISTERED, instance.pk
+    )
+
+
+@receiver(post_delete, sender=SpamData)
+def unindex_spam_name(sender, instance, using, **kwargs):
+    NameIndexEntry.objects.db_manager(using).unindex(
+        NameIndexEntry.REPORTED_SPAM, instance.pk
+    )
+
+
+@receiver(post_save, sender=SpamData)
+def increment_spam_count(sender, instance, created, using, **kwargs):
+    if created:
+        PhoneDirectory.objects.using(using).filter(pk=instance.target_phone_id).update(
+            spam_count=F("spam_count") + 1
+        )
+
+
+@receiver(post_delete, sender=SpamData)
+def decrement_spam_count(sender, instance, using, **kwargs):
+    PhoneDirectory.objects.using(using).filter(
+        pk=instance.target_phone_id, spam_count__gt=0
+    ).update(spam_count=F("spam_count") - 1)
+
+
+def invalidate_phone_details(*phones, using=None):
+    """Drops the cached details of phone numbers changed on the database
+    using, the default one when None"""
+    keys = [str(phone) for phone in phones]
+    phone_details_cache().delete_many(keys)
+    # Drop again once committed, a concurrent read may have cached
+    # the state before the transaction
+    transaction.on_commit(lambda: phone_details_cache().delete_many(keys), using=using)
+
+
+@receiver(post_save, sender=PhoneDirectory)
+@receiver(post_delete, sender=PhoneDirectory)
+def invalidate_directory_details(sender, instance, using, **kwargs):
+    invalidate_phone_details(instance.pk, using=using)
+
+
+@receiver(post_save, sender=AuthUser)
+@receiver(post_delete, sender=AuthUser)
+def invalidate_user_details(sender, instance, using, **kwargs):
+    invalidate_phone_details(instance.phone, using=using)
+
+
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+def invalidate_contact_details(sender, instance, using, **kwargs):
+    invalidate_phone_details(instance.phone_id, using=using)
+
+
+@receiver(post_save, sender=Contact)
+def add_to_contact_graph(sender, instance, created, using, **kwargs):
+    if instance.user_id is None:
+        return
+    if created:
+        key = phone_key(instance.phone_id)
+        transaction.on_commit(
+            lambda: add_contact_keys(instance.user_id, [key]), using=using
+        )
+    else:
+        forget_contact_graph(instance.user_id)
+
+
+@receiver(post_delete, sender=Contact)
+def remove_from_contact_graph(sender, instance, using, **kwargs):
+    # The user may have other contacts of the same number
+    if instance.user_id is not None:
+        forget_contact_graph(instance.user_id)
+        transaction.on_commit(
+            lambda: forget_contact_graph(instance.user_id), using=using
+        )
+
+
+@receiver(post_save, sender=SpamData)
+@receiver(post_delete, sender=SpamData)
+def invalidate_spam_details(sender, instance, using, **kwargs):
+    invalidate_phone_details(instance.target_phone_id, using=using)
@@ -0,0 +1,28 @@
+import base64
+import json
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class PrimaryKeyCursorPagination(CursorPagination):
+    """Keyset pagination over the primary key with an opaque cursor"""
+
+    ordering = "pk"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+def encode_cursor(position):
+    """Opaque cursor of a JSON serializable keyset position"""
+    return base64.urlsafe_b64encode(
+        json.dumps(position, separators=(",", ":")).encode()
+    ).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (TypeError, ValueError):
+        raise NotFound(CursorPagination.invalid_cursor_message)
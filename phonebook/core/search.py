@@ -0,0 +1,197 @@
+import asyncio
+import heapq
+import itertools
+
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    Max,
+    Q,
+    Value,
+    When,
+    Window,
+)
+from django.db.models.functions import Least, RowNumber
+
+from .models import NameIndexEntry, NameTrigram, name_trigrams, normalize_name
+from .sharding import shard_aliases
+
+# Upper bound for range scans over an indexed text column
+MAX_CHAR = "\U0010ffff"
+
+EXACT, PREFIX, SUBSTRING = 0, 1, 2
+
+KIND_ORDER = (
+    NameIndexEntry.REGISTERED,
+    NameIndexEntry.UNREGISTERED,
+    NameIndexEntry.REPORTED_SPAM,
+)
+
+# Queries shorter than this only match the start of a word
+MIN_SUBSTRING_LENGTH = 3
+
+MATCH_SCORES = {EXACT: 300, PREFIX: 200, SUBSTRING: 100}
+REGISTERED_SCORE = 50
+# Each spam report costs a point, up to this many
+MAX_SPAM_PENALTY = 50
+
+
+def annotate_spam_count(queryset, phone_field):
+    """Annotates spam_count, the materialized spam count
+    of the directory instance at phone_field"""
+    return queryset.annotate(spam_count=F(f"{phone_field}__spam_count"))
+
+
+class NameSearchEngine:
+    """Prefix and substring name search over the trigram name index.
+
+    Queries of up to three characters are resolved by a range scan over
+    the padded trigrams, and over the names for the first word of
+    shorter ones, longer queries by intersecting the postings of
+    their trigrams. Both are verified and ranked in the same query.
+    Queries shorter than MIN_SUBSTRING_LENGTH only match word prefixes,
+    a single letter would otherwise match most of the index.
+    On a sharded directory every shard is searched for a page of results,
+    the pages are merged in result order.
+    """
+
+    def candidates(self, normalized):
+        if len(normalized) < MIN_SUBSTRING_LENGTH:
+            # Trigrams are only padded at the end, the first word of
+            # a name is found by a range scan over the names themselves
+            word = " " + normalized
+            return Q(
+                pk__in=NameTrigram.objects.filter(
+                    trigram__gte=word, trigram__lt=word + MAX_CHAR
+                ).values("entry")
+            ) | Q(normalized__gte=normalized, normalized__lt=normalized + MAX_CHAR)
+        if len(normalized) <= 3:
+            return Q(
+                pk__in=NameTrigram.objects.filter(
+                    trigram__gte=normalized, trigram__lt=normalized + MAX_CHAR
+                ).values("entry")
+            )
+        trigrams = name_trigrams(normalized, padded=False)
+        return Q(
+            pk__in=NameTrigram.objects.filter(trigram__in=trigrams)
+            .values("entry")
+            .annotate(matched=Count("trigram", distinct=True))
+            .filter(matched=len(trigrams))
+            .values("entry")
+        )
+
+    def matches(self, normalized):
+        prefix = Q(normalized__gte=normalized, normalized__lt=normalized + MAX_CHAR)
+        if len(normalized) < MIN_SUBSTRING_LENGTH:
+            return prefix | Q(normalized__contains=" " + normalized)
+        return Q(normalized__contains=normalized)
+
+    def queryset(self, name_query):
+        """Every matching index entry, annotated with its rank and score"""
+        normalized = normalize_name(name_query)
+        rank = Case(
+            When(normalized=normalized, then=Value(EXACT)),
+            When(
+                normalized__gte=normalized,
+                normalized__lt=normalized + MAX_CHAR,
+                then=Value(PREFIX),
+            ),
+            default=Value(SUBSTRING),
+            output_field=IntegerField(),
+        )
+        return annotate_spam_count(
+            NameIndexEntry.objects.filter(
+                self.matches(normalized), self.candidates(normalized)
+            )
+            .annotate(
+                rank=rank,
+                kind_order=Case(
+                    *(
+                        When(kind=kind, then=Value(order))
+                        for order, kind in enumerate(KIND_ORDER)
+                    ),
+                    output_field=IntegerField(),
+                ),
+                score=Case(
+                    *(
+                        When(rank=match, then=Value(points))
+                        for match, points in MATCH_SCORES.items()
+                    ),
+                    output_field=IntegerField(),
+                )
+                + Case(
+                    When(phone__user__isnull=False, then=Value(REGISTERED_SCORE)),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+                - Least(F("phone__spam_count"), Value(MAX_SPAM_PENALTY)),
+            )
+            .order_by("rank", "kind_order", "normalized", "pk"),
+            "phone",
+        )
+
+    def ranked(self, name_query, limit, after=None, using=None):
+        """The best match of each phone number, highest score first.
+        Phones with the same score are ordered by number, after is the
+        (score, phone) of the last result of the previous page.
+        using is the shard to search, the first one by default."""
+        best_first = ("-score", "kind_order", "normalized", "pk")
+        queryset = self.queryset(name_query).annotate(
+            best_score=Window(Max("score"), partition_by="phone"),
+            position=Window(RowNumber(), partition_by="phone", order_by=best_first),
+        )
+        queryset = queryset.filter(position=1)
+        if after is not None:
+            score, phone = after
+            queryset = queryset.filter(
+                Q(best_score__lt=score) | Q(best_score=score, phone__gt=phone)
+            )
+        if using is not None:
+            queryset = queryset.using(using)
+        return queryset.order_by("-best_score", "phone")[:limit]
+
+    def result(self, entry):
+        return {
+            "type": entry.kind,
+            "name": entry.name,
+            "spam_count": entry.spam_count,
+            "phone": str(entry.phone_id),
+            "score": entry.score,
+        }
+
+    def merge(self, pages, limit):
+        """Merges the result pages of several shards, every phone number
+        being on a single shard"""
+        merged = heapq.merge(
+            *pages, key=lambda result: (-result["score"], result["phone"])
+        )
+        return list(itertools.islice(merged, limit))
+
+    def search(self, name_query, limit, after=None):
+        """Returns up to limit results of name_query, one per phone number,
+        best matches first"""
+        if not normalize_name(name_query):
+            return []
+        pages = [
+            [
+                self.result(entry)
+                for entry in self.ranked(name_query, limit, after, using=shard)
+            ]
+            for shard in shard_aliases()
+        ]
+        return self.merge(pages, limit)
+
+    async def asearch(self, name_query, limit, after=None):
+        if not normalize_name(name_query):
+            return []
+
+        async def search_shard(shard):
+            return [
+                self.result(entry)
+                async for entry in self.ranked(name_query, limit, after, using=shard)
+            ]
+
+        pages = await asyncio.gather(*map(search_shard, shard_aliases()))
+        return self.merge(pages, limit)
@@ -1,31 +1,30 @@
+import asyncio
+
 from django.db import IntegrityError
+from django.db.models import Count
 from django.utils.translation import gettext_lazy as _gl
-from phonenumber_field.serializerfields import PhoneNumberField
 from rest_framework import serializers
 from user.serializers import AuthUserSeriaizer
 
 from .models import Contact, PhoneDirectory, SpamData
+from .phones import CachedPhoneNumberField
 
 
 class PhoneDirectorySerializer(serializers.ModelSerializer):
-    phone = PhoneNumberField()
+    phone = CachedPhoneNumberField()
 
     class Meta:
         model = PhoneDirectory
         fields = ("user", "phone")
 
 
-class PhoneSearchSerializer(serializers.Serializer):
-    def getAliasSerializer(self, model_arg):
-        class AliasSerializer(serializers.ModelSerializer):
-            class Meta:
-                model = model_arg
-                fields = ("name",)
+class AliasSerializer(serializers.Serializer):
+    name = serializers.CharField()
 
-        return AliasSerializer
 
+class PhoneSearchSerializer(serializers.Serializer):
     user = serializers.SerializerMethodField()
-    phone = PhoneNumberField()
+    phone = CachedPhoneNumberField()
     spam_count = serializers.SerializerMethodField()
     contact_count = serializers.SerializerMethodField()
     spam_aliases = serializers.SerializerMethodField()
@@ -34,6 +33,7 @@ class PhoneSearchSerializer(serializers.Serializer):
     def __init__(self, *args, hide_email=True, **kwargs):
         super().__init__(*args, **kwargs)
         self.hide_email = hide_email
+        self._alias_summaries = {}
 
     def get_user(self, obj):
         json = AuthUserSeriaizer(obj.user).data
@@ -41,28 +41,55 @@ class PhoneSearchSerializer(serializers.Serializer):
             json["email"] = None
         return json
 
-    def remove_nulls(self, result_list):
-        return [result for result in result_list if result.get("name") is not None]
+    def alias_rows(self, obj, relation):
+        return (
+            getattr(obj, relation).order_by().values("name").annotate(count=Count("pk"))
+        )
+
+    def summarize_aliases(self, rows):
+        total = 0
+        aliases = []
+        for row in rows:
+            total += row["count"]
+            if row["name"] is not None:
+                aliases.extend([row] * row["count"])
+        return total, AliasSerializer(aliases, many=True).data
+
+    def alias_summary(self, obj, relation):
+        """Row count and non null names of a relation of obj,
+        fetched with one aggregate query and reused by the count and alias fields"""
+        key = (obj.pk, relation)
+        if key not in self._alias_summaries:
+            self._alias_summaries[key] = self.summarize_aliases(
+                self.alias_rows(obj, relation)
+            )
+        return self._alias_summaries[key]
+
+    async def aload_alias_summaries(self, obj):
+        """Fetches the alias summaries of obj concurrently,
+        so that serializing it runs no queries"""
+
+        async def load(relation):
+            rows = [row async for row in self.alias_rows(obj, relation)]
+            self._alias_summaries[(obj.pk, relation)] = self.summarize_aliases(rows)
+
+        await asyncio.gather(load("aliases"), load("spam_reports"))
 
     def get_spam_count(self, obj):
-        return obj.spam_reports.count()
+        return obj.spam_count
 
     def get_contact_count(self, obj):
-        return obj.aliases.count()
+        return self.alias_summary(obj, "aliases")[0]
 
     def get_spam_aliases(self, obj):
-        serializer = self.getAliasSerializer(SpamData)
-        result_list = serializer(obj.spam_reports, many=True).data
-        return self.remove_nulls(result_list)
+        return self.alias_summary(obj, "spam_reports")[1]
 
     def get_contact_aliases(self, obj):
-        serializer = self.getAliasSerializer(Contact)
-        result_list = serializer(obj.aliases, many=True).data
-        return self.remove_nulls(result_list)
+        return self.alias_summary(obj, "aliases")[1]
 
 
 class SpamDataSerializer(serializers.ModelSerializer):
-    target_phone = PhoneNumberField()
+    target_phone = CachedPhoneNumberField()
 
     class Meta:
         model = SpamData
@@ -75,10 +102,11 @@ class SpamDataSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         target_phone = validated_data.pop("target_phone")
-        phone_instance, _ = PhoneDirectory.objects.get_or_create(phone=target_phone)
+        phone_instance, _ = PhoneDirectory.objects.get_or_create_by_phone(target_phone)
 
         try:
-            instance = SpamData.objects.create(
+            # Created on the shard of the number
+            instance = SpamData.objects.using(phone_instance._state.db).create(
                 target_phone=phone_instance, **validated_data
             )
         except IntegrityError:
@@ -88,7 +116,7 @@ class SpamDataSerializer(serializers.ModelSerializer):
 
 
 class ContactSerializer(serializers.ModelSerializer):
-    phone = PhoneNumberField()
+    phone = CachedPhoneNumberField()
 
     class Meta:
         model = Contact
@@ -102,10 +130,19 @@ class ContactSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         phone_data = validated_data.pop("phone")
-        phone_instance, _ = PhoneDirectory.objects.get_or_create(phone=phone_data)
+        phone_instance, _ = PhoneDirectory.objects.get_or_create_by_phone(phone_data)
         try:
-            instance = Contact.objects.create(phone=phone_instance, **validated_data)
+            instance = Contact.objects.using(phone_instance._state.db).create(
+                phone=phone_instance, **validated_data
+            )
         except IntegrityError:
             msg = _gl("Contact is previously added")
             raise serializers.ValidationError(msg)
         return instance
+
+
+class ContactImportSerializer(serializers.Serializer):
+    phone = CachedPhoneNumberField()
+    name = serializers.CharField(
+        max_length=128, allow_null=True, allow_blank=True, required=False
+    )
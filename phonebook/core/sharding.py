@@ -0,0 +1,123 @@
+"""Phone number sharding of the phone directory.
+
+The phone directory, contacts, spam reports and the name index are
+partitioned across the databases listed in settings.PHONEBOOK_SHARDS by a
+hash of a phone number: the number of a directory instance, the number of
+a contact, the reported number of a spam report and the number of a name.
+Everything about a number lives on one shard. Users, the spam report queue
+and the blocklist stay on the default database.
+
+PhoneShardRouter routes saves and related lookups of the sharded models
+by their number, the directory instance of a user is on the shard of the
+phone of the user. ShardedQuerySet.create places new instances the same way. Lookups of a number go through the shard aware queryset
+helpers, name searches and the listings of the contacts and spam reports
+of a user run on every shard and merge the results, deleted users are
+unlinked from the rows of every shard. Other queries that are not about
+a number run on the first shard, and snapshots refuse to run on a
+sharded directory.
+
+With a single shard, the default database, every query runs where it did.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, models, router
+
+# Sharded models and the field of the phone number they are sharded by,
+# name trigrams live with their index entry
+SHARDED_MODELS = {
+    "core.phonedirectory": "phone",
+    "core.contact": "phone",
+    "core.spamdata": "target_phone",
+    "core.nameindexentry": "phone",
+    "core.nametrigram": None,
+}
+
+
+def shard_aliases():
+    return list(getattr(settings, "PHONEBOOK_SHARDS", [DEFAULT_DB_ALIAS]))
+
+
+def is_sharded():
+    return len(shard_aliases()) > 1
+
+
+def shard_for(phone):
+    """Database alias of the shard of a phone number,
+    an E.164 string or a PhoneNumber"""
+    shards = shard_aliases()
+    if len(shards) == 1 or not phone:
+        return shards[0]
+    if not isinstance(phone, str):
+        phone = phone.as_e164
+    digest = hashlib.blake2b(phone.encode(), digest_size=8).digest()
+    return shards[int.from_bytes(digest, "big") % len(shards)]
+
+
+def group_by_shard(items, phone=lambda item: item):
+    """Groups items by the shard of their phone number, the groups
+    are lists of (position in items, item) in the order of items"""
+    groups = {}
+    for position, item in enumerate(items):
+        groups.setdefault(shard_for(phone(item)), []).append((position, item))
+    return groups
+
+
+class ShardedQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        """Creates an instance on the shard of its phone number,
+        unless a database was chosen"""
+        if self._db is None and is_sharded():
+            instance = self.model(**kwargs)
+            return self.using(
+                router.db_for_write(self.model, instance=instance)
+            ).create(**kwargs)
+        return super().create(**kwargs)
+
+
+class PhoneShardRouter:
+    """Routes the sharded models to the shard of their phone number,
+    every other model to the default database"""
+
+    def shard_of(self, instance):
+        label = instance._meta.label_lower
+        if label not in SHARDED_MODELS:
+            return None
+        field_name = SHARDED_MODELS[label]
+        if field_name is None:
+            return instance._state.db
+        phone = getattr(instance, instance._meta.get_field(field_name).attname)
+        return shard_for(phone) if phone else instance._state.db
+
+    def route(self, model, **hints):
+        if model._meta.label_lower not in SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get("instance")
+        if instance is not None:
+            if (
+                model._meta.label_lower == "core.phonedirectory"
+                and instance._meta.label_lower == settings.AUTH_USER_MODEL.lower()
+            ):
+                # The directory instance of a user
+                return shard_for(instance.phone)
+            shard = self.shard_of(instance)
+            if shard:
+                return shard
+        return shard_aliases()[0]
+
+    db_for_read = route
+    db_for_write = route
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users on the default database relate to rows on every shard
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == DEFAULT_DB_ALIAS:
+            return True
+        if db not in shard_aliases():
+            return None
+        if model_name is None:
+            return app_label == "core"
+        return f"{app_label}.{model_name}" in SHARDED_MODELS
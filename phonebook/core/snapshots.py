@@ -0,0 +1,164 @@
+"""Phonebook snapshots, the dumpdata JSON format of the phonebook models.
+
+Snapshots are read and written one object at a time so that their size
+is not bounded by memory. Imports bulk insert the objects with constraint
+checks deferred to the end, link users to their directory instances in
+one pass and rebuild what the model signals would have maintained:
+the name index, spam counts and phone keys.
+"""
+
+import io
+import itertools
+import json
+
+from django.apps import apps
+from django.core import serializers
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from user.models import AuthUser
+
+from .cache import phone_details_cache
+from .directory import backfill_links
+from .models import Contact, PhoneDirectory, SpamData, phone_key
+
+# Dependency order, every model only references the models before it
+SNAPSHOT_MODELS = (AuthUser, PhoneDirectory, Contact, SpamData)
+
+
+def iter_json_array(stream, chunk_size=1 << 16):
+    """Yields the items of the JSON array in a text stream,
+    decoding one item at a time"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+    eof = False
+    while True:
+        # Skip the whitespace and separators before the next item
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            buffer = stream.read(chunk_size)
+            position = 0
+            eof = not buffer
+        if eof and position >= len(buffer):
+            raise ValueError("Unterminated JSON array")
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("Expected a JSON array")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The item continues in the next chunk
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield item
+        position = end
+
+
+def export_snapshot(stream, chunk_size=2000):
+    """Writes the phonebook models to a text stream,
+    returns the number of exported objects per model"""
+    counts = {}
+    stream.write("[")
+    separator = "\n"
+    for model in SNAPSHOT_MODELS:
+        label = model._meta.label_lower
+        counts[label] = 0
+        queryset = model.objects.order_by("pk")
+        if model is AuthUser:
+            queryset = queryset.prefetch_related("groups", "user_permissions")
+        serializer = serializers.get_serializer("python")()
+        instances = queryset.iterator(chunk_size=chunk_size)
+        # The python serializer keeps every object it serializes
+        while chunk := list(itertools.islice(instances, chunk_size)):
+            for data in serializer.serialize(chunk):
+                stream.write(separator + json.dumps(data, cls=DjangoJSONEncoder))
+                separator = ",\n"
+                counts[label] += 1
+    stream.write("\n]\n")
+    return counts
+
+
+class SnapshotImporter:
+    """Bulk inserts the objects of a snapshot, model by model in batches"""
+
+    def __init__(self, batch_size=2000):
+        self.batch_size = batch_size
+        self.batches = {model: [] for model in SNAPSHOT_MODELS}
+        self.m2m = []
+        self.counts = {model._meta.label_lower: 0 for model in SNAPSHOT_MODELS}
+        self.skipped = {}
+
+    def add(self, data):
+        try:
+            model = apps.get_model(data["model"])
+        except (KeyError, LookupError, ValueError):
+            model = None
+        if model not in self.batches:
+            label = data.get("model", "unknown")
+            self.skipped[label] = self.skipped.get(label, 0) + 1
+            return
+        for deserialized in serializers.deserialize("python", [data]):
+            instance = deserialized.object
+            if model is PhoneDirectory:
+                # Set by a pre_save signal that bulk inserts skip
+                instance.number = phone_key(instance.phone)
+            if any(deserialized.m2m_data.values()):
+                self.m2m.append((instance, deserialized.m2m_data))
+            self.batches[model].append(instance)
+        if len(self.batches[model]) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model):
+        batch = self.batches[model]
+        if batch:
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            self.counts[model._meta.label_lower] += len(batch)
+            self.batches[model] = []
+
+    def finish(self):
+        for model in SNAPSHOT_MODELS:
+            self.flush(model)
+        for instance, m2m_data in self.m2m:
+            for field_name, values in m2m_data.items():
+                getattr(instance, field_name).set(values)
+        backfill_links(self.batch_size)
+
+
+def import_snapshot(stream, batch_size=2000):
+    """Imports a snapshot from a text stream into a database without
+    phonebook data, returns the number of imported objects per model
+    and the number of skipped objects per model label"""
+    importer = SnapshotImporter(batch_size)
+    with transaction.atomic():
+        with connection.constraint_checks_disabled():
+            for data in iter_json_array(stream):
+                importer.add(data)
+            importer.finish()
+        connection.check_constraints(
+            table_names=[model._meta.db_table for model in SNAPSHOT_MODELS]
+        )
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), SNAPSHOT_MODELS)
+        if sequence_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_sql:
+                    cursor.execute(sql)
+        PhoneDirectory.objects.recompute_spam_counts()
+    call_command("rebuild_name_index", batch_size=batch_size, stdout=io.StringIO())
+    phone_details_cache().clear()
+    return importer.counts, importer.skipped
@@ -1,3 +1,1217 @@
-from django.test import TestCase
+import io
+import json
+import re
+from contextlib import ExitStack, contextmanager
+from types import SimpleNamespace
+from unittest import skipIf, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib import admin
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+from user.admin import AuthUserAdminView
+from user.models import AuthUser
+
+from . import blocklist, snapshots
+from .cache import phone_details_cache
+from .contact_graph import ContactGraph, contact_graph_cache
+from .directory import backfill_links, link_users
+from .models import (
+    Contact,
+    NameIndexEntry,
+    PhoneDirectory,
+    QueuedSpamReport,
+    SpamData,
+    phone_key,
+)
+from .search import NameSearchEngine
+from .serializers import PhoneSearchSerializer
+from .sharding import is_sharded, shard_aliases, shard_for
+
+
+def count_on_every_shard(queryset):
+    return sum(queryset.using(shard).count() for shard in shard_aliases())
+
+
+class CaptureShardQueries:
+    """CaptureQueriesContext over the connections of every shard"""
+
+    def __init__(self):
+        self.contexts = [
+            CaptureQueriesContext(connections[shard]) for shard in shard_aliases()
+        ]
+
+    def __enter__(self):
+        for context in self.contexts:
+            context.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        for context in reversed(self.contexts):
+            context.__exit__(*exc_info)
+
+    @property
+    def captured_queries(self):
+        return [query for context in self.contexts for query in context]
+
+    def __len__(self):
+        return len(self.captured_queries)
+
+
+@contextmanager
+def execute_shard_commits(testcase):
+    """captureOnCommitCallbacks(execute=True) on every shard"""
+    with ExitStack() as stack:
+        for shard in shard_aliases():
+            stack.enter_context(
+                testcase.captureOnCommitCallbacks(using=shard, execute=True)
+            )
+        yield
+
+
+class SearchQueryCountTests(APITestCase):
+    """Searches run a fixed number of queries however many rows they return"""
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = AuthUser.objects.create_user(
+            phone="+918900000001",
+            username="searcher",
+            email="searcher@mail.com",
+            password="password",
+        )
+        self.client.force_authenticate(self.user)
+        self.unregistered = PhoneDirectory.objects.create(phone="+918900000002")
+        self.registered = AuthUser.objects.create_user(
+            phone="+918900000003",
+            username="Robin",
+            email="robin@mail.com",
+            password="password",
+        )
+        link_users([self.registered])
+        self.reporters = 0
+
+    def populate(self, rows):
+        for i in range(self.reporters, self.reporters + rows):
+            reporter = AuthUser.objects.create(
+                phone=f"+9189100{i:05d}",
+                username=f"reporter{i}",
+                email=f"reporter{i}@mail.com",
+            )
+            Contact.objects.create(
+                user=reporter, phone=self.unregistered, name=f"Robin Contact {i}"
+            )
+            SpamData.objects.create(
+                target_phone=self.unregistered,
+                reporter_phone=reporter,
+                name=f"Robin {i}",
+            )
+            SpamData.objects.create(
+                target_phone=self.registered.phone_dir, reporter_phone=reporter
+            )
+        self.reporters += rows
+
+    def search(self, **params):
+        with CaptureShardQueries() as queries:
+            response = self.client.get(reverse("core:search"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def assertConstantQueries(self, expected, **params):
+        self.populate(1)
+        small, small_queries = self.search(**params)
+        self.populate(20)
+        large, large_queries = self.search(**params)
+        self.assertGreater(len(large), len(small))
+        self.assertEqual(small_queries, expected)
+        self.assertEqual(large_queries, expected)
+        return large
+
+    def test_name_search(self):
+        self.populate(1)
+        small, small_queries = self.search(name="robin")
+        self.populate(20)
+        large, large_queries = self.search(name="robin")
+        # One query per shard
+        self.assertEqual(small_queries, len(shard_aliases()))
+        self.assertEqual(large_queries, len(shard_aliases()))
+        # One result per phone number, the exact registered match first
+        self.assertEqual(
+            [result["phone"] for result in large["results"]],
+            [str(self.registered.phone), str(self.unregistered.phone)],
+        )
+        self.assertEqual(large["results"][0]["type"], "registered")
+        self.assertEqual(large["results"][0]["spam_count"], 21)
+        self.assertIsNone(large["next"])
+
+    def test_name_search_pages(self):
+        self.populate(3)
+        first, _ = self.search(name="rob", page_size=1)
+        self.assertEqual(len(first["results"]), 1)
+        with CaptureShardQueries() as queries:
+            response = self.client.get(first["next"])
+        second = response.json()
+        self.assertEqual(len(queries), len(shard_aliases()))
+        self.assertEqual(len(second["results"]), 1)
+        self.assertNotEqual(first["results"][0]["phone"], second["results"][0]["phone"])
+        self.assertIsNone(second["next"])
+
+    def test_short_name_search_matches_word_prefixes(self):
+        self.populate(1)
+        results, _ = self.search(name="c")
+        self.assertEqual(
+            [result["name"] for result in results["results"]], ["Robin Contact 0"]
+        )
+        results, _ = self.search(name="b")
+        self.assertEqual(results["results"], [])
+
+    def test_short_name_search_matches_first_words(self):
+        self.populate(1)
+        for query in ("r", "ro"):
+            results, queries = self.search(name=query)
+            self.assertEqual(queries, len(shard_aliases()))
+            self.assertEqual(
+                [result["phone"] for result in results["results"]],
+                [str(self.registered.phone), str(self.unregistered.phone)],
+            )
+
+    @skipIf(is_sharded(), "the queries depend on the shards of the numbers")
+    def test_unregistered_phone_search(self):
+        results = self.assertConstantQueries(3, phone=str(self.unregistered.phone))
+        self.assertTrue(all(result["spam_count"] == 21 for result in results))
+
+    @skipIf(is_sharded(), "the queries depend on the shards of the numbers")
+    def test_registered_phone_search(self):
+        self.populate(1)
+        results, small_queries = self.search(phone=str(self.registered.phone))
+        self.populate(20)
+        results, large_queries = self.search(phone=str(self.registered.phone))
+        self.assertEqual(small_queries, 1)
+        self.assertEqual(large_queries, 1)
+        self.assertEqual(results[0]["spam_count"], 21)
+
+
+class NameIndexTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = AuthUser.objects.create(
+            phone="+918900000001", username="Robin Hood", email="robin@mail.com"
+        )
+        link_users([self.user])
+        self.target, _ = PhoneDirectory.objects.get_or_create_by_phone("+918900000002")
+
+    def names(self, kind=None):
+        entries = NameIndexEntry.objects.all()
+        if kind:
+            entries = entries.filter(kind=kind)
+        return sorted(
+            name
+            for shard in shard_aliases()
+            for name in entries.using(shard).values_list("name", flat=True)
+        )
+
+    def found(self, name_query):
+        return sorted(
+            result["name"] for result in NameSearchEngine().search(name_query, 10)
+        )
+
+    def test_contact_names_follow_saves_and_deletes(self):
+        contact = Contact.objects.create(
+            user=self.user, phone=self.target, name="Little  JOHN"
+        )
+        self.assertEqual(self.names(NameIndexEntry.UNREGISTERED), ["Little  JOHN"])
+        self.assertEqual(self.found("little john"), ["Little  JOHN"])
+        contact.name = "Friar Tuck"
+        contact.save()
+        self.assertEqual(self.found("john"), [])
+        self.assertEqual(self.found("tuck"), ["Friar Tuck"])
+        contact.name = None
+        contact.save()
+        self.assertEqual(self.names(NameIndexEntry.UNREGISTERED), [])
+        contact.name = "Friar Tuck"
+        contact.save()
+        contact.delete()
+        self.assertEqual(self.names(NameIndexEntry.UNREGISTERED), [])
+
+    def test_spam_names_follow_saves_and_deletes(self):
+        report = SpamData.objects.create(
+            target_phone=self.target, reporter_phone=self.user, name="Sheriff"
+        )
+        self.assertEqual(self.found("sher"), ["Sheriff"])
+        report.delete()
+        self.assertEqual(self.found("sher"), [])
+
+    def test_user_names_follow_renames_and_deletes(self):
+        self.assertEqual(self.found("hood"), ["Robin Hood"])
+        self.user.username = "Robin of Locksley"
+        self.user.save()
+        self.assertEqual(self.found("hood"), [])
+        self.assertEqual(self.found("locksley"), ["Robin of Locksley"])
+        self.user.delete()
+        self.assertEqual(self.names(NameIndexEntry.REGISTERED), [])
+
+    def test_rebuild_command_restores_the_index(self):
+        Contact.objects.create(user=self.user, phone=self.target, name="Little John")
+        SpamData.objects.create(
+            target_phone=self.target, reporter_phone=self.user, name="Sheriff"
+        )
+        indexed = self.names()
+        for shard in shard_aliases():
+            NameIndexEntry.objects.using(shard).all().delete()
+        self.assertEqual(self.found("john"), [])
+
+        call_command("rebuild_name_index", stdout=io.StringIO())
+        self.assertEqual(self.names(), indexed)
+        self.assertEqual(self.found("john"), ["Little John"])
+        # Rebuilding again replaces the entries
+        call_command("rebuild_name_index", "--clear", stdout=io.StringIO())
+        self.assertEqual(self.names(), indexed)
+
+
+class MigrationTestCase(TransactionTestCase):
+    """Migrates the default database back to migrate_from, setUpBeforeMigration
+    creates rows with the models of that state, then migrates to migrate_to"""
+
+    migrate_from = None
+    migrate_to = None
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([self.migrate_from])
+        self.setUpBeforeMigration(executor.loader.project_state(self.migrate_from).apps)
+        executor = MigrationExecutor(connection)
+        executor.migrate([self.migrate_to])
+        self.apps = executor.loader.project_state(self.migrate_to).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def setUpBeforeMigration(self, apps):
+        pass
+
+
+@skipIf(is_sharded(), "migrates the default database only")
+class NameIndexMigrationTests(MigrationTestCase):
+    migrate_from = ("core", "0004_auto_20230312_0925")
+    migrate_to = ("core", "0005_name_index")
+
+    def setUpBeforeMigration(self, apps):
+        user = apps.get_model("user", "AuthUser").objects.create(
+            phone="+918900000001", username="Robin Hood", email="robin@mail.com"
+        )
+        directory = apps.get_model("core", "PhoneDirectory").objects
+        target = directory.create(phone="+918900000002")
+        directory.create(phone=user.phone, user=user)
+        contacts = apps.get_model("core", "Contact").objects
+        self.contact = contacts.create(user=user, phone=target, name="Little John")
+        contacts.create(user=user, phone=target, name=None)
+        self.report = apps.get_model("core", "SpamData").objects.create(
+            target_phone=target, reporter_phone=user, name="Sheriff"
+        )
+        self.user = user
+
+    def test_existing_names_are_indexed(self):
+        entries = self.apps.get_model("core", "NameIndexEntry").objects
+        self.assertEqual(
+            sorted(entries.values_list("kind", "object_id", "phone", "normalized")),
+            [
+                ("registered", self.user.pk, "+918900000001", "robin hood"),
+                ("reported spam", self.report.pk, "+918900000002", "sheriff"),
+                ("unregistered", self.contact.pk, "+918900000002", "little john"),
+            ],
+        )
+        trigrams = self.apps.get_model("core", "NameTrigram").objects
+        self.assertEqual(
+            set(
+                trigrams.filter(entry__normalized="sheriff").values_list(
+                    "trigram", flat=True
+                )
+            ),
+            {"she", "her", "eri", "rif", "iff", "ff ", "f  "},
+        )
+
+
+@skipIf(is_sharded(), "migrates the default database only")
+class PhoneKeyMigrationTests(MigrationTestCase):
+    migrate_from = ("core", "0007_spam_blocklist")
+    migrate_to = ("core", "0008_phonedirectory_number")
+    phones = ["+918900000002", "+14155550123", "+442071838750"]
+
+    def setUpBeforeMigration(self, apps):
+        directory = apps.get_model("core", "PhoneDirectory").objects
+        for phone in self.phones:
+            directory.create(phone=phone)
+
+    def test_existing_numbers_get_their_key(self):
+        directory = self.apps.get_model("core", "PhoneDirectory").objects
+        self.assertEqual(
+            sorted(directory.values_list("phone", "number")),
+            sorted((phone, phone_key(phone)) for phone in self.phones),
+        )
+        for phone in self.phones:
+            self.assertEqual(directory.get(number=phone_key(phone)).phone, phone)
+
+
+class ContactListTests(APITestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = AuthUser.objects.create(
+            phone="+918900000001", username="owner", email="owner@mail.com"
+        )
+        other = AuthUser.objects.create(
+            phone="+918900000002", username="other", email="other@mail.com"
+        )
+        self.phones = [f"+9189100{i:05d}" for i in range(5)]
+        Contact.objects.bulk_import(
+            self.user, [(phone, "Robin") for phone in self.phones]
+        )
+        Contact.objects.bulk_import(other, [(self.phones[0], "Other")])
+        self.client.force_authenticate(self.user)
+
+    def test_pages_follow_next(self):
+        url = f"{reverse('core:contacts')}?page_size=2"
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([contact["phone"] for contact in response.json()["results"]])
+            url = response.json()["next"]
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sorted(sum(pages, [])), self.phones)
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(reverse("core:contacts"), {"cursor": "oops"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_is_newline_delimited_json(self):
+        response = self.client.get(reverse("core:contacts"), {"stream": "true"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        contacts = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual(sorted(contact["phone"] for contact in contacts), self.phones)
+        self.assertTrue(all(contact["user"] == self.user.pk for contact in contacts))
+
+
+class AsyncViewTests(TestCase):
+    """The read API served as coroutines, as under ASGI"""
+
+    databases = "__all__"
+    client_class = AsyncClient
+
+    def setUp(self):
+        phone_details_cache().clear()
+        self.user = AuthUser.objects.create(
+            phone="+918900000001", username="owner", email="owner@mail.com"
+        )
+        self.registered = AuthUser.objects.create(
+            phone="+918900000002", username="Robin", email="robin@mail.com"
+        )
+        link_users([self.user, self.registered])
+        self.phones = [f"+9189100{i:05d}" for i in range(3)]
+        Contact.objects.bulk_import(
+            self.user, [(phone, "Robin") for phone in self.phones]
+        )
+        token = RefreshToken.for_user(self.user).access_token
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    async def test_anonymous_requests_are_unauthorized(self):
+        for name in ("core:phone_directory", "core:contacts", "core:search"):
+            response = await self.client.get(reverse(name), {"q": "+918900000002"})
+            self.assertEqual(response.status_code, 401, name)
+
+    async def test_phone_details(self):
+        response = await self.client.get(
+            reverse("core:phone_directory"),
+            {"q": "+918900000002"},
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["user"]["username"], "Robin")
+        response = await self.client.get(
+            reverse("core:phone_directory"),
+            {"q": "+918900000009"},
+            headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_contact_pages(self):
+        response = await self.client.get(
+            reverse("core:contacts"), {"page_size": 2}, headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertIsNotNone(response.json()["next"])
+
+    async def test_contact_stream(self):
+        response = await self.client.get(
+            reverse("core:contacts"), {"stream": "1"}, headers=self.headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        contacts = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual(sorted(contact["phone"] for contact in contacts), self.phones)
+
+
+class ContactBulkImportTests(APITestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.user = AuthUser.objects.create(
+            phone="+918900000001", username="importer", email="importer@mail.com"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_import_reports_every_item(self):
+        Contact.objects.create(
+            user=self.user,
+            phone=PhoneDirectory.objects.create(phone="+918900000002"),
+            name="Existing",
+        )
+        contacts = [
+            {"phone": "+918900000002", "name": "Existing"},
+            {"phone": "+918900000003", "name": "New"},
+            {"phone": "+918900000003", "name": "New"},
+            {"phone": "+918900000004"},
+            {"phone": "invalid"},
+        ]
+        response = self.client.post(
+            reverse("core:contacts_bulk"), contacts, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result["status"] for result in response.json()],
+            ["exists", "created", "exists", "created", "invalid"],
+        )
+        self.assertEqual(
+            count_on_every_shard(Contact.objects.filter(user=self.user)), 3
+        )
+        self.assertEqual(
+            count_on_every_shard(
+                NameIndexEntry.objects.filter(
+                    kind=NameIndexEntry.UNREGISTERED, name="New"
+                )
+            ),
+            1,
+        )
+
+    def test_query_count_does_not_grow_per_contact(self):
+        contacts = [{"phone": f"+9189100{i:05d}", "name": f"c{i}"} for i in range(300)]
+        with CaptureShardQueries() as queries:
+            self.client.post(reverse("core:contacts_bulk"), contacts, format="json")
+        self.assertEqual(
+            count_on_every_shard(Contact.objects.filter(user=self.user)), 300
+        )
+        self.assertLess(len(queries), 30)
+
+
+class SpamCountTests(TestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.reporters = [
+            AuthUser.objects.create(
+                phone=f"+9189100{i:05d}", username=f"reporter{i}", email=f"{i}@mail.com"
+            )
+            for i in range(2)
+        ]
+        self.target, _ = PhoneDirectory.objects.get_or_create_by_phone("+918900000002")
+
+    def spam_count(self):
+        return PhoneDirectory.objects.get_by_phone(self.target.phone).spam_count
+
+    def test_reports_update_the_count(self):
+        reports = [
+            SpamData.objects.create(target_phone=self.target, reporter_phone=reporter)
+            for reporter in self.reporters
+        ]
+        self.assertEqual(self.spam_count(), 2)
+        reports[0].delete()
+        self.assertEqual(self.spam_count(), 1)
+        reports[1].delete()
+        self.assertEqual(self.spam_count(), 0)
+
+    def test_command_repairs_drifted_counts(self):
+        SpamData.objects.create(
+            target_phone=self.target, reporter_phone=self.reporters[0]
+        )
+        PhoneDirectory.objects.on_shard_of(self.target.phone).filter(
+            pk=self.target.pk
+        ).update(spam_count=7)
+        output = io.StringIO()
+        call_command("recompute_spam_scores", stdout=output)
+        self.assertIn("Repaired spam counts of 1 phone numbers", output.getvalue())
+        self.assertEqual(self.spam_count(), 1)
+        output = io.StringIO()
+        call_command("recompute_spam_scores", stdout=output)
+        self.assertIn("Repaired spam counts of 0 phone numbers", output.getvalue())
+
+
+class SpamReportQueueTests(APITestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.reporters = [
+            AuthUser.objects.create(
+                phone=f"+9189100{i:05d}", username=f"reporter{i}", email=f"{i}@mail.com"
+            )
+            for i in range(3)
+        ]
+        self.target = PhoneDirectory.objects.create(phone="+918900000002")
+        SpamData.objects.create(
+            target_phone=self.target, reporter_phone=self.reporters[0], name="Spammer"
+        )
+
+    def report(self, reporter, phone, name=None):
+        self.client.force_authenticate(reporter)
+        response = self.client.post(
+            reverse("core:spam"),
+            {"target_phone": phone, "name": name} if name else {"target_phone": phone},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 202)
+
+    def test_drain_records_queued_reports_once(self):
+        self.report(self.reporters[1], "+918900000002", "Spammer")
+        self.report(self.reporters[1], "+918900000002", "Spammer")
+        self.report(self.reporters[1], "+918900000002")
+        self.report(self.reporters[2], "+918900000003")
+        self.assertEqual(count_on_every_shard(SpamData.objects.all()), 1)
+
+        self.assertEqual(QueuedSpamReport.objects.drain(batch_size=100), (4, 3))
+        self.assertFalse(QueuedSpamReport.objects.exists())
+        self.assertEqual(
+            PhoneDirectory.objects.get_by_phone(self.target.phone).spam_count, 3
+        )
+        self.assertEqual(
+            PhoneDirectory.objects.get_by_phone("+918900000003").spam_count, 1
+        )
+        self.assertEqual(
+            count_on_every_shard(
+                NameIndexEntry.objects.filter(
+                    kind=NameIndexEntry.REPORTED_SPAM, phone=self.target
+                )
+            ),
+            2,
+        )
+        for shard in shard_aliases():
+            self.assertEqual(
+                PhoneDirectory.objects.using(shard).recompute_spam_counts(), 0
+            )
+
+
+@skipUnless(connection.vendor == "sqlite", "EXPLAIN QUERY PLAN is SQLite specific")
+class PhoneSearchSerializerTests(TestCase):
+    """Phone details summarize aliases with one query per relation"""
+
+    databases = "__all__"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.phone = PhoneDirectory.objects.create(phone="+918900000002")
+        cls.other = PhoneDirectory.objects.create(phone="+918900000003")
+        for i, name in enumerate(["Robin", "Robin", None, "Rob"]):
+            reporter = AuthUser.objects.create(
+                phone=f"+9189100{i:05d}", username=f"reporter{i}"
+            )
+            Contact.objects.create(user=reporter, phone=cls.phone, name=name)
+            SpamData.objects.create(
+                target_phone=cls.phone, reporter_phone=reporter, name=name
+            )
+        Contact.objects.create(user=reporter, phone=cls.other, name="Other")
+        cls.phone.refresh_from_db()
+        cls.other.refresh_from_db()
+
+    def assertAliases(self, json):
+        self.assertEqual(json["contact_count"], 4)
+        self.assertEqual(json["spam_count"], 4)
+        for field in ("contact_aliases", "spam_aliases"):
+            self.assertCountEqual(
+                [alias["name"] for alias in json[field]], ["Robin", "Robin", "Rob"]
+            )
+
+    def test_aliases_are_summarized_per_phone(self):
+        with CaptureShardQueries() as queries:
+            data = PhoneSearchSerializer([self.phone, self.other], many=True).data
+        # One aggregate query per relation and phone
+        self.assertEqual(len(queries), 4)
+        self.assertAliases(data[0])
+        self.assertEqual(data[1]["contact_count"], 1)
+        self.assertEqual(data[1]["contact_aliases"], [{"name": "Other"}])
+        self.assertEqual(data[1]["spam_aliases"], [])
+
+    def test_loaded_summaries_serialize_without_queries(self):
+        serializer = PhoneSearchSerializer(self.phone)
+        async_to_sync(serializer.aload_alias_summaries)(self.phone)
+        with CaptureShardQueries() as queries:
+            data = serializer.data
+        self.assertEqual(len(queries), 0)
+        self.assertAliases(data)
+
+
+class QueryPlanTests(TestCase):
+    """Hot queries are resolved through indexes, never by scanning a table"""
+
+    databases = "__all__"
+
+    # Scans of materialized subqueries are not table scans
+    full_scan = re.compile(r"^SCAN (?!\(subquery-\d+\)|qualify\b|CONSTANT ROW)")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = AuthUser.objects.create(
+            phone="+918900000001", username="searcher", email="searcher@mail.com"
+        )
+        cls.phone = PhoneDirectory.objects.create(phone="+918900000002")
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScan(self, queryset):
+        plan = self.query_plan(queryset)
+        scans = [step for step in plan if self.full_scan.match(step)]
+        self.assertFalse(scans, "\n".join(plan))
+
+    def test_contact_lookups(self):
+        self.assertNoFullScan(
+            Contact.objects.filter(user_id=self.user.pk, phone__number=918900000002)
+        )
+        self.assertNoFullScan(
+            Contact.objects.select_related("phone__user")
+            .filter(user=self.user)
+            .order_by("pk")[:100]
+        )
+        self.assertNoFullScan(
+            Contact.objects.filter(user=self.user, phone__in=["+918900000002"])
+        )
+
+    def test_spam_lookups(self):
+        self.assertNoFullScan(
+            SpamData.objects.select_related("target_phone__user")
+            .filter(reporter_phone=self.user)
+            .order_by("pk")[:100]
+        )
+        self.assertNoFullScan(
+            SpamData.objects.filter(
+                target_phone__in=["+918900000002"], reporter_phone__in=[self.user.pk]
+            )
+        )
+
+    def test_alias_summaries(self):
+        serializer = PhoneSearchSerializer()
+        for relation in ("aliases", "spam_reports"):
+            with self.subTest(relation=relation):
+                self.assertNoFullScan(serializer.alias_rows(self.phone, relation))
+
+    def test_phone_lookup(self):
+        self.assertNoFullScan(PhoneDirectory.objects.filter(number=918900000002))
+
+    def test_name_search(self):
+        for name_query in ("r", "ro", "rob", "robin", "bin co"):
+            with self.subTest(name_query=name_query):
+                self.assertNoFullScan(NameSearchEngine().ranked(name_query, 21))
+                self.assertNoFullScan(
+                    NameSearchEngine().ranked(name_query, 21, after=[300, "+91"])
+                )
+
+    def test_spam_blocklist(self):
+        self.assertNoFullScan(blocklist.spam_numbers(5))
+        for changes in blocklist.blocklist_changes(1):
+            self.assertNoFullScan(changes)
+
+
+class ContactGraphTests(APITestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        contact_graph_cache().clear()
+        phone_details_cache().clear()
+        self.user = AuthUser.objects.create(
+            phone="+918900000001", username="searcher", email="searcher@mail.com"
+        )
+        self.registered = AuthUser.objects.create(
+            phone="+918900000002", username="Robin", email="robin@mail.com"
+        )
+        link_users([self.user, self.registered])
+        self.client.force_authenticate(self.user)
+
+    def details(self):
+        with CaptureShardQueries() as queries:
+            response = self.client.get(
+                reverse("core:phone_directory"), {"q": "+918900000002"}
+            )
+        return response.json()["user"]["email"], len(queries)
+
+    def test_graph_membership(self):
+        graph = ContactGraph([918900000003, 918900000001, 918900000003])
+        self.assertEqual(list(graph.keys), [918900000001, 918900000003])
+        self.assertIn(918900000003, graph)
+        self.assertNotIn(918900000002, graph)
+        self.assertIn(918900000002, graph.with_keys([918900000002]))
+        self.assertGreater(graph.nbytes, ContactGraph().nbytes)
+
+    @skipIf(is_sharded(), "the queries depend on the shards of the numbers")
+    def test_email_is_shown_to_contacts_only(self):
+        self.assertEqual(self.details(), (None, 4))
+        # The phone details and the contact graph are cached
+        self.assertEqual(self.details(), (None, 0))
+
+        with execute_shard_commits(self):
+            response = self.client.post(
+                reverse("core:contacts"),
+                {"phone": "+918900000002", "name": "Robin"},
+                format="json",
+            )
+        self.assertEqual(response.status_code, 201)
+        # Saving the contact invalidated the phone details only
+        self.assertEqual(self.details(), ("robin@mail.com", 3))
+        self.assertEqual(self.details(), ("robin@mail.com", 0))
+
+        with execute_shard_commits(self):
+            for shard in shard_aliases():
+                Contact.objects.using(shard).filter(user=self.user).delete()
+        self.assertEqual(self.details()[0], None)
+
+    def test_token_users_reach_the_graph_of_their_contacts(self):
+        # Token users have string ids, contacts integer user ids
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertIsNone(self.details()[0])
+
+        with execute_shard_commits(self):
+            Contact.objects.bulk_import(self.user, [("+918900000002", "Robin")])
+        self.assertEqual(self.details()[0], "robin@mail.com")
+
+        with execute_shard_commits(self):
+            for shard in shard_aliases():
+                Contact.objects.using(shard).filter(user=self.user).delete()
+        self.assertIsNone(self.details()[0])
+
+    def test_bulk_import_updates_the_graph(self):
+        Contact.objects.contact_graph(self.user.pk)
+        with execute_shard_commits(self):
+            self.client.post(
+                reverse("core:contacts_bulk"),
+                [{"phone": "+918900000002"}],
+                format="json",
+            )
+        with CaptureShardQueries() as queries:
+            self.assertIn(918900000002, Contact.objects.contact_graph(self.user.pk))
+        self.assertEqual(len(queries), 0)
+
+    def test_stats_report_graph_memory(self):
+        self.user.is_staff = True
+        self.user.save()
+        Contact.objects.create(user=self.user, phone=self.registered.phone_dir)
+        response = self.client.get(
+            reverse("core:contact_graph_stats"), {"user": self.user.pk}
+        )
+        self.assertEqual(
+            response.json(),
+            {
+                "user": self.user.pk,
+                "cached": False,
+                "contacts": 1,
+                "bytes": Contact.objects.contact_graph(self.user.pk).nbytes,
+            },
+        )
+
+
+class PhoneDetailsCacheTests(APITestCase):
+    """Cached phone details are dropped by every change they show"""
+
+    databases = "__all__"
+    phone = "+918900000002"
+
+    def setUp(self):
+        phone_details_cache().clear()
+        self.user = AuthUser.objects.create(
+            phone="+918900000001", username="searcher", email="searcher@mail.com"
+        )
+        self.registered = AuthUser.objects.create(
+            phone=self.phone, username="Robin", email="robin@mail.com"
+        )
+        link_users([self.user, self.registered])
+        self.client.force_authenticate(self.user)
+
+    def details(self):
+        response = self.client.get(reverse("core:phone_directory"), {"q": self.phone})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(phone_details_cache().get(self.phone))
+        return response.json()
+
+    def test_saved_users_are_read_again(self):
+        self.assertEqual(self.details()["user"]["username"], "Robin")
+        with execute_shard_commits(self):
+            self.registered.username = "Robin Hood"
+            self.registered.save()
+        self.assertEqual(self.details()["user"]["username"], "Robin Hood")
+
+    def test_deleted_users_are_read_again(self):
+        self.assertEqual(self.details()["user"]["username"], "Robin")
+        with execute_shard_commits(self):
+            self.registered.delete()
+        self.assertFalse(self.details()["user"]["username"])
+
+    def test_spam_reports_are_read_again(self):
+        self.assertEqual(self.details()["spam_count"], 0)
+        with execute_shard_commits(self):
+            SpamData.objects.create(
+                target_phone=PhoneDirectory.objects.get_by_phone(self.phone),
+                reporter_phone=self.user,
+                name="Spammer",
+            )
+        details = self.details()
+        self.assertEqual(details["spam_count"], 1)
+        self.assertEqual(details["spam_aliases"], [{"name": "Spammer"}])
+
+    def test_numbers_outside_the_directory_are_not_found(self):
+        response = self.client.get(
+            reverse("core:phone_directory"), {"q": "+918900000009"}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(phone_details_cache().get("+918900000009"))
+
+
+class DirectoryLinkTests(APITestCase):
+    databases = "__all__"
+
+    def test_signup_links_existing_directory(self):
+        PhoneDirectory.objects.create(phone="+918900000001", spam_count=2)
+        response = self.client.post(
+            reverse("user:signup"),
+            {"phone": "+918900000001", "username": "Robin", "password": "password"},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        directory = PhoneDirectory.objects.get_by_phone("+918900000001")
+        self.assertEqual(directory.user.username, "Robin")
+        self.assertIsNone(directory.user.email)
+        self.assertEqual(directory.spam_count, 2)
+        self.assertTrue(
+            NameIndexEntry.objects.filter(
+                kind=NameIndexEntry.REGISTERED, phone=directory, name="Robin"
+            ).exists()
+        )
+
+    def test_link_users_runs_one_upsert_per_batch(self):
+        users = AuthUser.objects.bulk_create(
+            AuthUser(phone=f"+9189100{i:05d}", username=f"user{i}", email=f"{i}@m.com")
+            for i in range(10)
+        )
+        PhoneDirectory.objects.create(phone=users[0].phone)
+        with CaptureShardQueries() as queries:
+            link_users(users)
+        upserts = [
+            query
+            for query in queries.captured_queries
+            if query["sql"].startswith('INSERT INTO "core_phonedirectory"')
+        ]
+        # One per shard having users
+        self.assertEqual(len(upserts), len({shard_for(user.phone) for user in users}))
+        self.assertEqual(
+            count_on_every_shard(PhoneDirectory.objects.filter(user__in=users)),
+            len(users),
+        )
+
+    def test_backfill_repairs_links(self):
+        moved, unlinked, missing = AuthUser.objects.bulk_create(
+            AuthUser(phone=f"+9189100{i:05d}", username=f"user{i}", email=f"{i}@m.com")
+            for i in range(3)
+        )
+        PhoneDirectory.objects.create(phone="+918900000001", user=moved)
+        PhoneDirectory.objects.create(phone=unlinked.phone)
+
+        self.assertEqual(backfill_links(), (1, 3))
+        self.assertIsNone(PhoneDirectory.objects.get_by_phone("+918900000001").user)
+        for user in (moved, unlinked, missing):
+            self.assertEqual(
+                PhoneDirectory.objects.get_by_phone(user.phone).user_id, user.pk
+            )
+        self.assertEqual(backfill_links(), (0, 0))
+
+
+class SnapshotTests(TestCase):
+    databases = "__all__"
+
+    @skipIf(is_sharded(), "snapshots refuse to run on a sharded directory")
+    def test_export_import_round_trip(self):
+        user = AuthUser.objects.create(
+            phone="+918900000001", username="owner", email="owner@mail.com"
+        )
+        target = PhoneDirectory.objects.create(phone="+918900000002")
+        Contact.objects.create(user=user, phone=target, name="Robin")
+        SpamData.objects.create(target_phone=target, reporter_phone=user, name="Spam")
+        snapshot = io.StringIO()
+        snapshots.export_snapshot(snapshot, chunk_size=1)
+
+        SpamData.objects.all().delete()
+        Contact.objects.all().delete()
+        PhoneDirectory.objects.all().delete()
+        AuthUser.objects.all().delete()
+        snapshot.seek(0)
+        counts, skipped = snapshots.import_snapshot(snapshot, batch_size=1)
+
+        self.assertEqual(
+            counts,
+            {
+                "user.authuser": 1,
+                "core.phonedirectory": 1,
+                "core.contact": 1,
+                "core.spamdata": 1,
+            },
+        )
+        self.assertEqual(skipped, {})
+        user = AuthUser.objects.get(username="owner")
+        self.assertEqual(user.phone_dir.number, 918900000001)
+        self.assertEqual(
+            PhoneDirectory.objects.get_by_phone(target.phone).spam_count, 1
+        )
+        self.assertTrue(NameIndexEntry.objects.filter(name="Robin").exists())
+
+    def test_iter_json_array_reads_items_across_chunks(self):
+        items = [{"model": "core.contact", "fields": {"name": "a, ]b"}}, [1, 2], 3]
+        stream = io.StringIO(
+            '  [\n{"model": "core.contact", "fields": {"name": "a, ]b"}},' " [1, 2], 3]"
+        )
+        self.assertEqual(list(snapshots.iter_json_array(stream, chunk_size=4)), items)
+        with self.assertRaises(ValueError):
+            list(snapshots.iter_json_array(io.StringIO("[1, 2"), chunk_size=4))
+
+
+class BlocklistDeltaTests(TestCase):
+    databases = "__all__"
+
+    def publish(self, spam_count):
+        PhoneDirectory.objects.on_shard_of(self.phone.phone).filter(
+            pk=self.phone.pk
+        ).update(spam_count=spam_count)
+        return blocklist.build_blocklist(threshold=1).pk
+
+    def test_removals_reach_clients_after_a_number_is_added_again(self):
+        self.phone = PhoneDirectory.objects.create(phone="+918900000002")
+        number = self.phone.number
+        v1 = self.publish(2)
+        self.assertEqual(blocklist.blocklist_delta(0), ([number], []))
+        v2 = self.publish(0)
+        self.assertEqual(blocklist.blocklist_delta(v1), ([], [number]))
+        v3 = self.publish(2)
+        self.assertEqual(blocklist.blocklist_delta(v2), ([number], []))
+        self.publish(0)
+        # A client at v1 still has the number
+        self.assertEqual(blocklist.blocklist_delta(v1), ([], [number]))
+        self.assertEqual(blocklist.blocklist_delta(v3), ([], [number]))
+
+
+class ShardForTests(TestCase):
+    databases = "__all__"
+
+    @override_settings(PHONEBOOK_SHARDS=["default", "shard1", "shard2"])
+    def test_numbers_spread_over_every_shard(self):
+        phones = [f"+9189000{i:05d}" for i in range(300)]
+        shards = [shard_for(phone) for phone in phones]
+        self.assertEqual(set(shards), {"default", "shard1", "shard2"})
+        self.assertEqual(shards, [shard_for(phone) for phone in phones])
+        self.assertEqual(
+            shard_for(PhoneDirectory(phone=phones[0]).phone), shard_for(phones[0])
+        )
+
+    def test_single_shard_is_the_default_database(self):
+        self.assertEqual(shard_for("+918900000001"), "default")
+
+
+@skipUnless(is_sharded(), "Run with PHONEBOOK_SHARDS=3 to test a sharded directory")
+class ShardedDirectoryTests(APITestCase):
+    """Run with PHONEBOOK_SHARDS=3 manage.py test, the rest of the suite
+    runs sharded too, but for the tests of single database behavior"""
+
+    databases = "__all__"
+
+    def setUp(self):
+        self.phones = {}
+        i = 0
+        while len(self.phones) < len(shard_aliases()):
+            phone = f"+9189000{i:05d}"
+            self.phones.setdefault(shard_for(phone), phone)
+            i += 1
+        self.user = AuthUser.objects.create(
+            phone="+918800000001", username="searcher", email="searcher@mail.com"
+        )
+        link_users([self.user])
+        self.client.force_authenticate(self.user)
+
+    def assertOnShard(self, queryset, shard):
+        for alias in shard_aliases():
+            self.assertEqual(queryset.using(alias).exists(), alias == shard, alias)
+
+    def test_rows_live_on_the_shard_of_their_number(self):
+        for shard, phone in self.phones.items():
+            response = self.client.post(
+                reverse("core:contacts"),
+                {"phone": phone, "name": "Robin"},
+                format="json",
+            )
+            self.assertEqual(response.status_code, 201)
+        response = self.client.post(
+            reverse("core:contacts_bulk"),
+            [{"phone": phone, "name": "Robin Bulk"} for phone in self.phones.values()],
+            format="json",
+        )
+        self.assertEqual(
+            [result["status"] for result in response.json()],
+            ["created"] * len(self.phones),
+        )
+        SpamData.objects.bulk_report(
+            (phone, self.user.pk, "Spammer") for phone in self.phones.values()
+        )
+
+        for shard, phone in self.phones.items():
+            self.assertOnShard(PhoneDirectory.objects.filter(phone=phone), shard)
+            self.assertOnShard(Contact.objects.filter(phone=phone, name="Robin"), shard)
+            self.assertOnShard(
+                Contact.objects.filter(phone=phone, name="Robin Bulk"), shard
+            )
+            self.assertOnShard(SpamData.objects.filter(target_phone=phone), shard)
+            self.assertOnShard(
+                NameIndexEntry.objects.filter(phone=phone, name="Robin Bulk"), shard
+            )
+            self.assertEqual(PhoneDirectory.objects.get_by_phone(phone).spam_count, 1)
+
+    def test_phone_lookups_of_registered_numbers(self):
+        for shard, phone in self.phones.items():
+            user = AuthUser.objects.create(
+                phone=phone, username=f"Robin {shard}", email=f"{shard}@mail.com"
+            )
+            link_users([user])
+            with self.captureOnCommitCallbacks(using=shard, execute=True):
+                Contact.objects.using(shard).create(
+                    user=self.user, phone_id=phone, name="Robin"
+                )
+
+            response = self.client.get(reverse("core:phone_directory"), {"q": phone})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["user"]["username"], f"Robin {shard}")
+            self.assertEqual(response.json()["user"]["email"], f"{shard}@mail.com")
+            self.assertEqual(response.json()["contact_count"], 1)
+
+            response = self.client.get(reverse("core:search"), {"phone": phone})
+            self.assertEqual(
+                response.json(),
+                [
+                    {
+                        "type": "registered",
+                        "name": f"Robin {shard}",
+                        "spam_count": 0,
+                        "phone": phone,
+                    }
+                ],
+            )
+
+    def test_admin_phone_change_unlinks_the_old_number(self):
+        old, new = self.phones[shard_aliases()[-1]], self.phones["default"]
+        user = AuthUser.objects.create(phone=old, username="mover", email="m@m.com")
+        link_users([user])
+        user.phone = new
+        form = SimpleNamespace(changed_data=["phone"])
+        AuthUserAdminView(AuthUser, admin.site).save_model(None, user, form, True)
+        self.assertIsNone(PhoneDirectory.objects.get_by_phone(old).user_id)
+        self.assertEqual(PhoneDirectory.objects.get_by_phone(new).user_id, user.pk)
+
+    def test_details_are_dropped_once_the_shard_commits(self):
+        for shard, phone in self.phones.items():
+            PhoneDirectory.objects.get_or_create_by_phone(phone)
+            with self.captureOnCommitCallbacks(using=shard, execute=True) as callbacks:
+                Contact.objects.create(user=self.user, phone_id=phone, name="Robin")
+                # A concurrent read caching the state before the commit
+                phone_details_cache().set(phone, {"stale": True})
+            self.assertTrue(callbacks, shard)
+            self.assertIsNone(phone_details_cache().get(phone), shard)
+
+    def test_listings_gather_every_shard(self):
+        reporter = AuthUser.objects.create(
+            phone="+918800000002", username="reporter", email="reporter@mail.com"
+        )
+        for phone in self.phones.values():
+            self.client.post(
+                reverse("core:contacts"),
+                {"phone": phone, "name": "Robin"},
+                format="json",
+            )
+            Contact.objects.bulk_import(reporter, [(phone, "Robin")])
+        SpamData.objects.bulk_report(
+            (phone, self.user.pk, None) for phone in self.phones.values()
+        )
+        for name in ("core:contacts", "core:spam"):
+            url = f"{reverse(name)}?page_size=2"
+            results = []
+            while url:
+                response = self.client.get(url).json()
+                results.extend(response["results"])
+                url = response["next"]
+            # Rows of different shards have the same pks
+            self.assertEqual(len(results), len(self.phones), name)
+            streamed = b"".join(
+                self.client.get(reverse(name), {"stream": "true"}).streaming_content
+            )
+            self.assertEqual(len(streamed.splitlines()), len(self.phones), name)
+
+    def test_deleted_users_are_unlinked_on_every_shard(self):
+        Contact.objects.bulk_import(
+            self.user, [(phone, "Robin") for phone in self.phones.values()]
+        )
+        SpamData.objects.bulk_report(
+            (phone, self.user.pk, None) for phone in self.phones.values()
+        )
+        self.user.delete()
+        for shard in shard_aliases():
+            self.assertFalse(
+                PhoneDirectory.objects.using(shard).filter(user__isnull=False).exists()
+            )
+            self.assertEqual(
+                list(Contact.objects.using(shard).values_list("user", flat=True)),
+                [None],
+            )
+            self.assertEqual(
+                list(
+                    SpamData.objects.using(shard).values_list(
+                        "reporter_phone", flat=True
+                    )
+                ),
+                [None],
+            )
+
+    def test_name_search_gathers_every_shard(self):
+        Contact.objects.bulk_import(
+            self.user, [(phone, "Robin") for phone in self.phones.values()]
+        )
+        Contact.objects.bulk_import(self.user, [(self.phones["default"], "Rob")])
+        url = f"{reverse('core:search')}?name=rob&page_size=2"
+        results = []
+        while url:
+            response = self.client.get(url).json()
+            results.extend(response["results"])
+            url = response["next"]
+        self.assertEqual(
+            [result["phone"] for result in results],
+            [
+                self.phones["default"],
+                *sorted(set(self.phones.values()) - {self.phones["default"]}),
+            ],
+        )
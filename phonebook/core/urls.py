@@ -1,9 +1,13 @@
 from django.urls import path
 
 from .views import (
+    ContactBulkView,
+    ContactGraphStatsView,
     ContactView,
     SearchView,
     PhoneDetailsView,
+    PhoneParserStatsView,
+    SpamBlocklistView,
     SpamView,
 )
 
@@ -11,7 +15,19 @@ app_name = "core"
 
 urlpatterns = [
     path("contacts/", ContactView.as_view(), name="contacts"),
+    path("contacts/bulk/", ContactBulkView.as_view(), name="contacts_bulk"),
     path("spam/", SpamView.as_view(), name="spam"),
+    path("spam/blocklist/", SpamBlocklistView.as_view(), name="spam_blocklist"),
     path("search/", SearchView.as_view(), name="search"),
     path("phone-directory/", PhoneDetailsView.as_view(), name="phone_directory"),
+    path(
+        "phone-parser/stats/",
+        PhoneParserStatsView.as_view(),
+        name="phone_parser_stats",
+    ),
+    path(
+        "contacts/graph/stats/",
+        ContactGraphStatsView.as_view(),
+        name="contact_graph_stats",
+    ),
 ]
@@ -1,22 +1,41 @@
+import asyncio
+import heapq
+import itertools
+
+from asgiref.sync import sync_to_async
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from phonenumber_field.phonenumber import PhoneNumber
 from phonenumber_field.serializerfields import PhoneNumberField
 from rest_framework import serializers, status
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import GenericAPIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
-from user.models import AuthUser
-
-from .models import Contact, PhoneDirectory, SpamData
+from user.authentication import ClaimsJWTAuthentication
+
+from . import blocklist
+from .async_views import AsyncAPIView
+from .cache import get_cache, phone_details_cache
+from .contact_graph import contact_graph_cache, graph_key
+from .models import Contact, PhoneDirectory, QueuedSpamReport, SpamData, phone_key
+from .pagination import PrimaryKeyCursorPagination, decode_cursor, encode_cursor
+from .phones import cache_stats, phone_to_e164
+from .search import NameSearchEngine, annotate_spam_count
 from .serializers import (
+    ContactImportSerializer,
     ContactSerializer,
     PhoneSearchSerializer,
     SpamDataSerializer,
 )
+from .sharding import is_sharded, shard_aliases
 
 
 class HomeView(APIView):
@@ -29,22 +48,185 @@ class HomeView(APIView):
         return Response(url_routes)
 
 
-class BaseUserXPhoneDirectoryView(GenericAPIView):
+class PhoneParserStatsView(APIView):
+    """Hit rate of this process' phone number parsing cache"""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(cache_stats(), status=status.HTTP_200_OK)
+
+
+class ContactGraphStatsView(APIView):
+    """Size and memory usage of the contact graph of a user"""
+
+    permission_classes = [IsAdminUser]
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "user",
+                openapi.IN_QUERY,
+                description="user id",
+                type=openapi.TYPE_INTEGER,
+            ),
+        ]
+    )
+    def get(self, request):
+        try:
+            user_id = int(request.query_params["user"])
+        except (KeyError, ValueError):
+            return Response(
+                {"error": "Invalid user"}, status=status.HTTP_400_BAD_REQUEST
+            )
+        cached = contact_graph_cache().get(graph_key(user_id)) is not None
+        graph = Contact.objects.contact_graph(user_id)
+        return Response(
+            {
+                "user": user_id,
+                "cached": cached,
+                "contacts": len(graph),
+                "bytes": graph.nbytes,
+            },
+            status=status.HTTP_200_OK,
+        )
+
+
+class BaseUserXPhoneDirectoryView(AsyncAPIView, GenericAPIView):
     permission_classes = [IsAuthenticated]
+    pagination_class = PrimaryKeyCursorPagination
     model = None
     serializer_class = None
     user_field = None
-
-    def get(self, request):
-        if request.user.is_staff:
-            query_set = self.model.objects.all()
+    phone_field = None
+    stream_chunk_size = 2000
+
+    def get_queryset(self):
+        # The serializers render the directory instance, whose str shows its user
+        if is_sharded():
+            # Users are on the default database only
+            query_set = self.model.objects.select_related(
+                self.phone_field
+            ).prefetch_related(f"{self.phone_field}__user")
         else:
-            query_set = self.model.objects.filter(**{self.user_field: request.user})
+            query_set = self.model.objects.select_related(f"{self.phone_field}__user")
+        if self.request.user.is_staff:
+            return query_set
+        return query_set.filter(**{self.user_field: self.request.user})
+
+    def stream(self, query_set):
+        """Every row, shard after shard in pk order"""
+        encoder = JSONEncoder()
+        for shard in shard_aliases():
+            for instance in (
+                query_set.using(shard)
+                .order_by("pk")
+                .iterator(chunk_size=self.stream_chunk_size)
+            ):
+                yield encoder.encode(self.serializer_class(instance).data) + "\n"
+
+    async def astream(self, query_set):
+        encoder = JSONEncoder()
+        for shard in shard_aliases():
+            async for instance in (
+                query_set.using(shard)
+                .order_by("pk")
+                .aiterator(chunk_size=self.stream_chunk_size)
+            ):
+                yield encoder.encode(self.serializer_class(instance).data) + "\n"
+
+    def paginate_shards(self, query_set):
+        """A page of the rows of every shard, merged in (pk, shard position)
+        order as rows of different shards may have the same pk. The cursor
+        is the [pk, shard position] of the last row of the previous page.
+        Returns the page and the url of the next one."""
+        request = self.request
+        paginator = self.paginator
+        page_size = paginator.get_page_size(request)
+        after = None
+        cursor = request.query_params.get(paginator.cursor_query_param)
+        if cursor:
+            after = decode_cursor(cursor)
+            if not (
+                isinstance(after, list)
+                and len(after) == 2
+                and all(isinstance(value, int) for value in after)
+            ):
+                raise NotFound(paginator.invalid_cursor_message)
+
+        pages = []
+        for position, shard in enumerate(shard_aliases()):
+            rows = query_set.using(shard).order_by("pk")
+            if after is not None:
+                pk, last_position = after
+                if position <= last_position:
+                    rows = rows.filter(pk__gt=pk)
+                else:
+                    rows = rows.filter(pk__gte=pk)
+            # One extra row tells whether there is a next page
+            pages.append([(row.pk, position, row) for row in rows[: page_size + 1]])
+        merged = heapq.merge(*pages, key=lambda item: item[:2])
+        page = list(itertools.islice(merged, page_size + 1))
+
+        next_url = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_url = replace_query_param(
+                request.build_absolute_uri(),
+                paginator.cursor_query_param,
+                encode_cursor(list(page[-1][:2])),
+            )
+        return [row for _, _, row in page], next_url
 
-        query_json = self.serializer_class(query_set, many=True).data
-        return Response(query_json, status=status.HTTP_200_OK)
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                description="pagination cursor",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "page_size",
+                openapi.IN_QUERY,
+                description="results per page",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "stream",
+                openapi.IN_QUERY,
+                description="stream every result as newline delimited json",
+                type=openapi.TYPE_BOOLEAN,
+            ),
+        ]
+    )
+    async def get(self, request):
+        query_set = self.get_queryset()
+        if request.query_params.get("stream") in ("1", "true"):
+            # WSGI servers would buffer an asynchronous iterator
+            if isinstance(request._request, ASGIRequest):
+                content = self.astream(query_set)
+            else:
+                content = self.stream(query_set)
+            return StreamingHttpResponse(content, content_type="application/x-ndjson")
 
-    def post(self, request):
+        if is_sharded():
+            page, next_url = await sync_to_async(self.paginate_shards)(query_set)
+            query_json = self.serializer_class(page, many=True).data
+            return Response(
+                {"next": next_url, "previous": None, "results": query_json},
+                status=status.HTTP_200_OK,
+            )
+
+        # The paginator evaluates the page synchronously
+        page = await sync_to_async(self.paginate_queryset)(query_set)
+        query_json = self.serializer_class(page, many=True).data
+        return self.get_paginated_response(query_json)
+
+    async def post(self, request):
+        return await sync_to_async(self.create)(request)
+
+    def create(self, request):
         request.data[self.user_field] = request.user.id
         serializer = self.serializer_class(
             context={"request": request}, data=request.data
@@ -60,15 +242,134 @@ class ContactView(BaseUserXPhoneDirectoryView):
     model = Contact
     serializer_class = ContactSerializer
     user_field = "user"
+    phone_field = "phone"
+
+
+class ContactBulkView(GenericAPIView):
+    """Imports a list of contacts of the requesting user in one request"""
+
+    permission_classes = [IsAuthenticated]
+    serializer_class = ContactImportSerializer
+    max_contacts = 10000
+
+    @swagger_auto_schema(request_body=ContactImportSerializer(many=True))
+    def post(self, request):
+        if not isinstance(request.data, list):
+            return Response(
+                {"error": "Expected a list of contacts"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(request.data) > self.max_contacts:
+            return Response(
+                {"error": f"At most {self.max_contacts} contacts allowed per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        results = []
+        valid = []
+        for item in request.data:
+            serializer = self.serializer_class(data=item)
+            if serializer.is_valid():
+                phone = phone_to_e164(serializer.validated_data["phone"])
+                name = serializer.validated_data.get("name")
+                valid.append((len(results), (phone, name)))
+                results.append({"phone": phone, "name": name})
+            else:
+                results.append({"status": "invalid", "errors": serializer.errors})
+
+        created = Contact.objects.bulk_import(
+            request.user, [contact for _, contact in valid]
+        )
+        for (index, _), is_created in zip(valid, created):
+            results[index]["status"] = "created" if is_created else "exists"
+        return Response(results, status=status.HTTP_200_OK)
 
 
 class SpamView(BaseUserXPhoneDirectoryView):
     model = SpamData
     serializer_class = SpamDataSerializer
     user_field = "reporter_phone"
+    phone_field = "target_phone"
+
+    def create(self, request):
+        """Queues the spam report, it is recorded by the process_spam_queue
+        command. Repeated reports are accepted and dropped when recorded."""
+        request.data[self.user_field] = request.user.id
+        serializer = self.serializer_class(
+            context={"request": request}, data=request.data
+        )
+        serializer.is_valid(raise_exception=True)
+        report = QueuedSpamReport.objects.create(
+            target_phone=serializer.validated_data["target_phone"].as_e164,
+            reporter=request.user,
+            name=serializer.validated_data.get("name") or None,
+        )
+        return Response(
+            {
+                "target_phone": report.target_phone,
+                "reporter_phone": report.reporter_id,
+                "name": report.name,
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
 
 
-class PhoneDetailsView(APIView):
+class SpamBlocklistView(APIView):
+    """Spam blocklist export for checking numbers on the client"""
+
+    permission_classes = [IsAuthenticated]
+    encodings = ("packed", "bloom")
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "since",
+                openapi.IN_QUERY,
+                description="blocklist version held by the client, 0 for all numbers",
+                type=openapi.TYPE_INTEGER,
+            ),
+            openapi.Parameter(
+                "encoding",
+                openapi.IN_QUERY,
+                description="packed (default) or bloom, bloom exports all numbers",
+                type=openapi.TYPE_STRING,
+            ),
+        ]
+    )
+    def get(self, request):
+        encoding = request.query_params.get("encoding", "packed")
+        try:
+            since = int(request.query_params.get("since", 0))
+        except ValueError:
+            since = -1
+        if encoding not in self.encodings or since < 0:
+            return Response(
+                {"error": "Invalid blocklist query"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        version = blocklist.latest_version()
+        if version is None:
+            return Response(
+                {"error": "No blocklist published"}, status=status.HTTP_404_NOT_FOUND
+            )
+        since = min(since, version.pk)
+        # Exports of a published version never change
+        cache = get_cache("blocklist")
+        key = f"{version.pk}:{encoding}:{since}"
+        content = cache.get(key)
+        if content is None:
+            if encoding == "bloom":
+                content = blocklist.export_bloom(version.pk)
+            else:
+                content = blocklist.export_packed(version.pk, since)
+            cache.set(key, content)
+        response = HttpResponse(content, content_type="application/octet-stream")
+        response["X-Blocklist-Version"] = version.pk
+        return response
+
+
+class PhoneDetailsView(AsyncAPIView):
+    authentication_classes = [ClaimsJWTAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticated]
 
     @swagger_auto_schema(
@@ -81,27 +382,60 @@ class PhoneDetailsView(APIView):
             ),
         ]
     )
-    def get(self, request):
+    async def get(self, request):
         user = request.user
         phone_query = request.query_params.get("q")
-        phone_number = PhoneNumber.from_string(phone_query)
-        if not phone_query or not phone_number.is_valid():
+        phone_number = phone_to_e164(phone_query)
+        if not phone_number:
             return Response(
                 {"error": "Invalid Phone number"}, status=status.HTTP_400_BAD_REQUEST
             )
         else:
-            phone_instance = PhoneDirectory.objects.get(phone=phone_number)
-            hide_email = True
-            if Contact.objects.filter(user=user, phone__phone=phone_number).exists():
-                hide_email = False
-            phone_json = PhoneSearchSerializer(
-                phone_instance, hide_email=hide_email
-            ).data
+            # The email of a registered user is only shown to users
+            # having them as a contact
+            async def has_contact():
+                graph = await Contact.objects.acontact_graph(user.id)
+                return phone_key(phone_number) in graph
+
+            phone_json = phone_details_cache().get(phone_number)
+            if phone_json is None:
+                try:
+                    phone_json, is_contact = await asyncio.gather(
+                        self.get_phone_details(phone_number), has_contact()
+                    )
+                except ObjectDoesNotExist:
+                    return Response(
+                        {"error": "Invalid Phone number"},
+                        status=status.HTTP_404_NOT_FOUND,
+                    )
+            else:
+                is_contact = phone_json["user"].get("email") and await has_contact()
+            phone_json = dict(phone_json)
+            if not phone_json["user"].get("email") or not is_contact:
+                phone_json["user"] = {**phone_json["user"], "email": None}
             return Response(phone_json, status=status.HTTP_200_OK)
 
+    async def get_phone_details(self, phone_number):
+        """Caller independent details of an E.164 phone number,
+        read through the phone details cache"""
+        cache = phone_details_cache()
+        phone_json = cache.get(phone_number)
+        if phone_json is None:
+            phone_instance = await PhoneDirectory.objects.aget_by_phone_with_user(
+                phone_number
+            )
+            serializer = PhoneSearchSerializer(phone_instance, hide_email=False)
+            await serializer.aload_alias_summaries(phone_instance)
+            phone_json = dict(serializer.data)
+            cache.set(phone_number, phone_json)
+        return dict(phone_json)
+
 
-class SearchView(APIView):
+class SearchView(AsyncAPIView):
+    authentication_classes = [ClaimsJWTAuthentication, SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    page_size = 20
+    max_page_size = 100
 
     class BaseNameSerializer(serializers.Serializer):
         type = serializers.SerializerMethodField()
@@ -115,7 +449,8 @@ class SearchView(APIView):
             raise NotImplementedError
 
         def get_spam_count(self, obj):
-            raise NotImplementedError
+            # Querysets are annotated with annotate_spam_count
+            return obj.spam_count
 
     class RegisteredNameSerializer(BaseNameSerializer):
         phone = PhoneNumberField()
@@ -126,9 +461,6 @@ class SearchView(APIView):
         def get_name(self, obj):
             return obj.username
 
-        def get_spam_count(self, obj):
-            return obj.phone_dir.spam_reports.count()
-
         def to_representation(self, instance):
             data = super().to_representation(instance)
             data.update({"phone": str(instance.phone_dir.phone)})
@@ -143,12 +475,9 @@ class SearchView(APIView):
         def get_name(self, obj):
             return obj.name
 
-        def get_spam_count(self, obj):
-            return obj.phone.spam_reports.count()
-
         def to_representation(self, instance):
             data = super().to_representation(instance)
-            data.update({"phone": str(instance.phone.phone)})
+            data.update({"phone": str(instance.phone_id)})
             return data
 
     class SpamNameSerializer(BaseNameSerializer):
@@ -160,69 +489,82 @@ class SearchView(APIView):
         def get_name(self, obj):
             return obj.name
 
-        def get_spam_count(self, obj):
-            return obj.target_phone.spam_reports.count()
-
         def to_representation(self, instance):
             data = super().to_representation(instance)
             data.pop("target_phone")
-            data.update({"phone": str(instance.target_phone.phone)})
+            data.update({"phone": str(instance.target_phone_id)})
             return data
 
-    def name_search(self, name_query):
-        prefix_queries = []
-        substring_queries = []
-        if name_query != None:
-            for model, name_field, serializer in zip(
-                [AuthUser, Contact, SpamData],
-                ["username", "name", "name"],
-                [
-                    self.RegisteredNameSerializer,
-                    self.ContactNameSerializer,
-                    self.SpamNameSerializer,
-                ],
+    async def name_search(self, request, name_query):
+        try:
+            page_size = int(request.query_params.get("page_size", self.page_size))
+            page_size = max(1, min(page_size, self.max_page_size))
+        except ValueError:
+            page_size = self.page_size
+        after = None
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            after = decode_cursor(cursor)
+            if not (
+                isinstance(after, list)
+                and len(after) == 2
+                and isinstance(after[0], int)
+                and isinstance(after[1], str)
             ):
-                prefix_matches = model.objects.filter(
-                    **{f"{name_field}__startswith": name_query}
-                )
-                substring_matches = model.objects.filter(
-                    **{f"{name_field}__iregex": r".+" + name_query}
-                )
-                prefix_data = serializer(prefix_matches, many=True).data
-                substring_data = serializer(substring_matches, many=True).data
-                prefix_queries.extend(prefix_data)
-                substring_queries.extend(substring_data)
-            return Response(
-                prefix_queries + substring_queries,
-                status=status.HTTP_200_OK,
+                raise NotFound(PrimaryKeyCursorPagination.invalid_cursor_message)
+
+        # One extra result tells whether there is a next page
+        results = await NameSearchEngine().asearch(name_query, page_size + 1, after)
+        next_url = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            last = results[-1]
+            next_url = replace_query_param(
+                request.build_absolute_uri(),
+                "cursor",
+                encode_cursor([last["score"], last["phone"]]),
             )
-        else:
-            return Response({"Invalid Name"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {"next": next_url, "results": results}, status=status.HTTP_200_OK
+        )
 
-    def phone_search(self, phone_query):
-        phone_number = PhoneNumber.from_string(phone_query)
-        if phone_number.is_valid():
+    async def phone_search(self, phone_query):
+        phone_number = phone_to_e164(phone_query)
+        if phone_number:
             try:
-                phone_instance = PhoneDirectory.objects.get(phone=phone_number)
+                phone_instance = await PhoneDirectory.objects.aget_by_phone_with_user(
+                    phone_number
+                )
             except ObjectDoesNotExist:
                 return Response(
                     {"error": "Invalid Phone number"}, status=status.HTTP_404_NOT_FOUND
                 )
 
             query_json = []
-            if phone_instance.user:
-                query_json = [self.RegisteredNameSerializer(phone_instance.user).data]
+            if phone_instance.user_id:
+                user = phone_instance.user
+                user.phone_dir = phone_instance
+                user.spam_count = phone_instance.spam_count
+                query_json = self.RegisteredNameSerializer([user], many=True).data
             else:
-                from_contacts = phone_instance.aliases.all()
-                from_spam = phone_instance.spam_reports.all()
-                for data, serializer in zip(
-                    [from_contacts, from_spam],
-                    [
-                        self.ContactNameSerializer,
-                        self.SpamNameSerializer,
-                    ],
+                from_contacts = annotate_spam_count(
+                    phone_instance.aliases.select_related("phone"), "phone"
+                )
+                from_spam = annotate_spam_count(
+                    phone_instance.spam_reports.select_related("target_phone"),
+                    "target_phone",
+                )
+
+                async def serialize(data, serializer):
+                    return serializer(
+                        [instance async for instance in data], many=True
+                    ).data
+
+                for data in await asyncio.gather(
+                    serialize(from_contacts, self.ContactNameSerializer),
+                    serialize(from_spam, self.SpamNameSerializer),
                 ):
-                    query_json.extend(serializer(data, many=True).data)
+                    query_json.extend(data)
             return Response(query_json, status=status.HTTP_200_OK)
         else:
             return Response(
@@ -243,9 +585,21 @@ class SearchView(APIView):
                 description="search by phone",
                 type=openapi.TYPE_STRING,
             ),
+            openapi.Parameter(
+                "cursor",
+                openapi.IN_QUERY,
+                description="name search page, the next link of the previous page",
+                type=openapi.TYPE_STRING,
+            ),
+            openapi.Parameter(
+                "page_size",
+                openapi.IN_QUERY,
+                description="name search results per page",
+                type=openapi.TYPE_INTEGER,
+            ),
         ]
     )
-    def get(self, request):
+    async def get(self, request):
         name_query = request.query_params.get("name")
 
         phone_query = request.query_params.get("phone")
@@ -255,9 +609,9 @@ class SearchView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
         if name_query:
-            return self.name_search(name_query)
+            return await self.name_search(request, name_query)
         elif phone_query:
-            return self.phone_search(phone_query)
+            return await self.phone_search(phone_query)
         else:
             return Response(
                 {"message": "No search query provided"},
@@ -110,9 +110,27 @@ REST_FRAMEWORK = {
 }
 
 SIMPLE_JWT = {
-    "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.AuthTokenObtainPairSerializer",
+    "TOKEN_OBTAIN_SERIALIZER": "user.serializers.AuthTokenObtainPairSerializer",
 }
 
+# Phonebook caches, BACKEND is "local" for a per process LRU cache
+# or "django" for the django cache named by ALIAS (shared between workers)
+PHONEBOOK_CACHES = {
+    "phone_details": {"BACKEND": "local", "MAX_SIZE": 10000, "TTL": 300},
+    "blocklist": {"BACKEND": "local", "MAX_SIZE": 64, "TTL": 3600},
+    # Active status of token users, a deactivated user keeps access
+    # to the claims authenticated views of other workers for up to TTL seconds
+    "token_users": {"BACKEND": "local", "MAX_SIZE": 100000, "TTL": 30},
+    # Phone keys of the contacts of users, 8 bytes a contact
+    "contact_graphs": {"BACKEND": "local", "MAX_SIZE": 10000, "TTL": 600},
+}
+
+# Number of distinct phone number strings kept by the phone parsing cache
+PHONE_PARSE_CACHE_SIZE = 100000
+
+# Numbers with more spam reports than this are exported in the spam blocklist
+SPAM_BLOCKLIST_THRESHOLD = 5
+
 WSGI_APPLICATION = "server.wsgi.application"
 
 
@@ -126,6 +144,20 @@ DATABASES = {
     }
 }
 
+# The phone directory, contacts, spam reports and name index are sharded
+# by phone number across PHONEBOOK_SHARDS databases (see core.sharding).
+# Every shard after the default database is a SQLite file next to it,
+# migrate each with "manage.py migrate --database shardN".
+PHONEBOOK_SHARDS = ["default"]
+for shard in range(1, int(os.environ.get("PHONEBOOK_SHARDS", 1))):
+    DATABASES[f"shard{shard}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / f"db.shard{shard}.sqlite3",
+    }
+    PHONEBOOK_SHARDS.append(f"shard{shard}")
+
+DATABASE_ROUTERS = ["core.sharding.PhoneShardRouter"]
+
 AUTH_USER_MODEL = "user.AuthUser"
 
 # Password validation
@@ -1,3 +1,6 @@
+from core.directory import link_users
+from core.models import PhoneDirectory
+from core.sharding import shard_aliases
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.utils.translation import gettext_lazy as _
@@ -22,6 +25,17 @@ class AuthUserAdminView(UserAdmin):
     readonly_fields = ["last_login"]
     list_display = ("username", "phone", "email", "is_staff")
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change or "phone" in form.changed_data:
+            # The directory instance of the old number is no longer theirs,
+            # it may be on any shard
+            for shard in shard_aliases():
+                PhoneDirectory.objects.using(shard).filter(user=obj).exclude(
+                    phone=obj.phone
+                ).update(user=None)
+            link_users([obj])
+
     def name(self, obj):
         return obj.first_name + " " + obj.last_name
 
@@ -0,0 +1,52 @@
+from core.cache import get_cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from .models import AuthUser
+
+
+def token_users_cache():
+    return get_cache("token_users")
+
+
+def token_user_flags(user_id):
+    """(is_active, is_staff) of the user of a token, both False once the user
+    is deleted, read through a short lived per process cache"""
+    cache = token_users_cache()
+    flags = cache.get(str(user_id))
+    if flags is None:
+        row = (
+            AuthUser.objects.filter(pk=user_id)
+            .values_list("is_active", "is_staff")
+            .first()
+        )
+        flags = tuple(row) if row else (False, False)
+        cache.set(str(user_id), flags)
+    return flags
+
+
+class ClaimsJWTAuthentication(JWTStatelessUserAuthentication):
+    """JWT authentication for views that only need the user id and is_staff.
+
+    The user is a TokenUser built from the token claims instead of the user
+    row. Its is_staff and whether it is active come from token_user_flags,
+    so deactivated, deleted and demoted users lose access at once in this
+    process and in others once their cache entry expires.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        is_active, is_staff = token_user_flags(user.id)
+        if not is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        user.is_staff = is_staff
+        return user
+
+
+@receiver(post_save, sender=AuthUser)
+@receiver(post_delete, sender=AuthUser)
+def invalidate_token_user(sender, instance, **kwargs):
+    token_users_cache().delete(str(instance.pk))
@@ -1,6 +1,8 @@
+from core.directory import link_users
+from core.phones import CachedPhoneNumberField, phone_to_e164
 from django.contrib.auth import authenticate, login
+from django.db import transaction
 from django.utils.translation import gettext_lazy as _
-from phonenumber_field.serializerfields import PhoneNumberField
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import (
     PasswordField,
@@ -11,7 +13,7 @@ from .models import AuthUser
 
 
 class LoginSerializer(serializers.Serializer):
-    phone = PhoneNumberField()
+    phone = CachedPhoneNumberField()
     password = serializers.CharField(
         write_only=True,
         required=True,
@@ -20,7 +22,7 @@ class LoginSerializer(serializers.Serializer):
     )
 
     def validate(self, data):
-        phone = str(data.get("phone"))
+        phone = phone_to_e164(data.get("phone"))
         password = data.get("password")
         if phone and password:
             user = authenticate(
@@ -43,7 +45,7 @@ class LoginSerializer(serializers.Serializer):
 
 
 class AuthUserSeriaizer(serializers.ModelSerializer):
-    phone = PhoneNumberField()
+    phone = CachedPhoneNumberField()
     password = serializers.CharField(
         write_only=True,
         required=True,
@@ -57,7 +59,7 @@ class AuthUserSeriaizer(serializers.ModelSerializer):
         fields = ("phone", "password", "username", "email")
 
     def validate(self, data):
-        phone = str(data.get("phone"))
+        phone = phone_to_e164(data.get("phone"))
         username = data.get("username")
         password = data.get("password")
         email = data.get("email")
@@ -97,11 +99,13 @@ class AuthUserSeriaizer(serializers.ModelSerializer):
                 + "@mail.com"
             )
 
-        user = AuthUser.objects.create_user(**validated_data)
+        with transaction.atomic():
+            user = AuthUser.objects.create_user(**validated_data)
 
-        if email is None:
-            user.email = None
-            user.save()
+            if email is None:
+                user.email = None
+                user.save()
+            link_users([user])
         return user
 
 
@@ -109,7 +113,7 @@ class AuthTokenObtainPairSerializer(TokenObtainPairSerializer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self.fields[self.username_field] = PhoneNumberField()
+        self.fields[self.username_field] = CachedPhoneNumberField()
         self.fields["password"] = PasswordField()
 
     @classmethod
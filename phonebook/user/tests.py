@@ -1,3 +1,59 @@
-from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from .authentication import ClaimsJWTAuthentication, token_users_cache
+from .models import AuthUser
+
+
+class ClaimsJWTAuthenticationTests(APITestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        token_users_cache().clear()
+        self.user = AuthUser.objects.create_user(
+            phone="+918900000001",
+            username="searcher",
+            email="searcher@mail.com",
+            password="password",
+        )
+        response = self.client.post(
+            reverse("user:token_obtain_pair"),
+            {"phone": "+918900000001", "password": "password"},
+            format="json",
+        )
+        self.access = response.json()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.access}")
+
+    def search(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("core:search"), {"name": "robin"})
+        return response, len(queries)
+
+    def test_user_row_is_not_loaded(self):
+        response, first_queries = self.search()
+        self.assertEqual(response.status_code, 200)
+        response, queries = self.search()
+        self.assertEqual(response.status_code, 200)
+        # Only the first request checks the user is active
+        self.assertEqual(first_queries, queries + 1)
+        self.assertEqual(queries, 1)
+
+    def test_deactivated_user_is_rejected(self):
+        self.assertEqual(self.search()[0].status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.search()[0].status_code, 401)
+
+    def test_demoted_user_loses_staff(self):
+        def authenticated_user():
+            return ClaimsJWTAuthentication().get_user(AccessToken(self.access))
+
+        self.user.is_staff = True
+        self.user.save()
+        self.assertTrue(authenticated_user().is_staff)
+        self.user.is_staff = False
+        self.user.save()
+        self.assertFalse(authenticated_user().is_staff)